@@ -1,14 +1,42 @@
-from flask import Flask, jsonify, request, abort
+from flask import Flask, jsonify, request, abort, send_file, Response, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from models import db, User, Artist, Album, Genre, Song, Playlist, PlaylistSong
+from models import db, User, Artist, Album, Genre, Song, Playlist, PlaylistSong, PlayEvent, SimilarSong, SimilarityBuild, Job
 from functools import wraps
 import os
 from flask_jwt_extended import JWTManager, set_access_cookies, create_access_token, jwt_required, get_jwt_identity, unset_jwt_cookies
 from flask_bcrypt import Bcrypt
 from datetime import datetime
 from lib.auth import verify_api_key, is_valid_email
+from lib.pagination import list_response
+from lib.serialization import Projection, FastJSONProvider
+from lib.fieldsets import requested_selection, expanded_tables
+from lib.multiget import multi_get_response
+from lib.streaming import FileStatCache, is_relative_media_path
+from lib.query_plans import find_table_scans
+from lib import search as search_index
+from lib.ingest import SongIngest, iter_ndjson, iter_json_array, DEFAULT_BATCH_SIZE, MAX_BATCH_SIZE
+from lib.playlists import apply_playlist_changes, parse_playlist_changes, next_position, PlaylistChangeError
+from lib.changes import changes
+from lib.cache import ResponseCache, cached
+from lib.versions import init_versions, conditional, engine_transaction
+from lib.hashing import PasswordHasher, HasherBusy
+from lib.database import load_database_config
+from lib.replicas import ReplicaRouter, use_primary
+from lib.seed import seed_catalog
+from lib import aggregates, charts
+from lib.metrics import Metrics
+from lib.plays import PlayBuffer, PlayBufferFull, validate_play, MAX_EVENTS_PER_REQUEST
+from lib.similarity import SimilarSongsBuilder, DEFAULT_TOP_K, MIN_COOCCURRENCE
+from lib.metadata import MetadataExtractor
+from lib.cascades import cascade_delete
+from lib.jobs import JobQueue, UnknownTask, PRIORITY_HIGH, PRIORITY_LOW
 from itsdangerous import URLSafeTimedSerializer as Serializer
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+import click
+import json
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -17,16 +45,101 @@ app = Flask(__name__)
 bcrypt = Bcrypt(app)
 jwt = JWTManager(app)
 
-# Configuring the SQLite database
-app.config['SQLALCHEMY_DATABASE_URI']   = 'sqlite:///MUSICA_DB.db'
+# Configuring the database (SQLite by default, PostgreSQL via SQLALCHEMY_DATABASE_URI)
+load_database_config(app)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = os.getenv('SQLALCHEMY_TRACK_MODIFICATIONS') == 'True'
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['API_KEY'] = os.getenv('API_KEY')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
 app.config['JWT_COOKIE_SECURE'] = os.getenv('JWT_COOKIE_SECURE')
 app.config['JWT_COOKIE_CSRF_PROTECT'] = os.getenv('JWT_COOKIE_CSRF_PROTECT')
+# Song files are served and read only from under MEDIA_ROOT; unset, none are
+app.config['MEDIA_ROOT'] = os.getenv('MEDIA_ROOT')
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == 'True'
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory')
+app.config['CACHE_TTL'] = os.getenv('CACHE_TTL', 60)
+app.config['CACHE_MAX_ENTRIES'] = os.getenv('CACHE_MAX_ENTRIES', 10000)
+app.config['CACHE_MAX_BYTES'] = os.getenv('CACHE_MAX_BYTES', 64 * 1024 * 1024)
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL')
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+app.config['PASSWORD_HASH_WORKERS'] = os.getenv('PASSWORD_HASH_WORKERS')
+app.config['PASSWORD_HASH_QUEUE'] = os.getenv('PASSWORD_HASH_QUEUE')
+app.config['DATABASE_REPLICA_URIS'] = os.getenv('DATABASE_REPLICA_URIS')
+app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+app.config['REPLICA_HEALTH_CHECK_SECONDS'] = os.getenv('REPLICA_HEALTH_CHECK_SECONDS', 10)
+app.config['SLOW_REQUEST_SECONDS'] = os.getenv('SLOW_REQUEST_SECONDS', 1.0)
+app.config['PLAY_FLUSH_BATCH'] = os.getenv('PLAY_FLUSH_BATCH', 5000)
+app.config['PLAY_FLUSH_SECONDS'] = os.getenv('PLAY_FLUSH_SECONDS', 1.0)
+app.config['PLAY_BUFFER_SIZE'] = os.getenv('PLAY_BUFFER_SIZE', 100000)
+app.config['PLAY_BUFFER_WAIT_SECONDS'] = os.getenv('PLAY_BUFFER_WAIT_SECONDS', 0.5)
+app.config['CHARTS_REFRESH_SECONDS'] = os.getenv('CHARTS_REFRESH_SECONDS', 60)
+app.config['METADATA_WORKERS'] = os.getenv('METADATA_WORKERS')
+app.config['METADATA_QUEUE'] = os.getenv('METADATA_QUEUE')
+app.config['JOBS_POLL_SECONDS'] = os.getenv('JOBS_POLL_SECONDS', 1.0)
+app.config['JOBS_BACKOFF_SECONDS'] = os.getenv('JOBS_BACKOFF_SECONDS', 10)
+app.config['JOBS_MAX_BACKOFF_SECONDS'] = os.getenv('JOBS_MAX_BACKOFF_SECONDS', 3600)
+app.config['JOBS_KEEP_SECONDS'] = os.getenv('JOBS_KEEP_SECONDS', 86400)
+# orjson-backed provider for the large list routes
+fast_json = FastJSONProvider(app)
+
+# Latency, status and SQL counters per endpoint, served on /metrics
+metrics = Metrics()
+metrics.init_app(app)
+# Replica binds must be in the config before db.init_app
+replica_router = ReplicaRouter()
+replica_router.init_app(app, db)
 db.init_app(app)
 migrate = Migrate(app, db)
+replica_router.init_session(db.session)
+
+# Committed writes invalidate cached catalog responses
+changes.init_session(db.session)
+response_cache = ResponseCache()
+response_cache.init_app(app, changes)
+# ... and bump the per-table versions behind the ETags of those routes
+init_versions(db.session)
+# Aggregate counters change with their child rows, so child writes invalidate parents too
+for table, dependents in aggregates.DEPENDENT_TABLES.items():
+    changes.add_dependents(table, dependents)
+
+# bcrypt runs in a bounded process pool, off the request threads
+password_hasher = PasswordHasher()
+password_hasher.init_app(app)
+
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    resp = jsonify({"message": "Server busy, please retry"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
+
+# Play events are buffered in memory and inserted in batches by a background thread
+play_buffer = PlayBuffer()
+play_buffer.init_app(app, db, PlayEvent.__table__, User.__table__, Song.__table__)
+# ... which adds them to the hourly and daily chart rollups in the same transaction
+play_buffer.add_listener(charts.rollup_plays)
+# ... and forgets the user and song ids it has seen when this process writes to those tables
+changes.add_listener(play_buffer.forget)
+
+# Duration, bitrate, codec and content hash are read from song files in a bounded thread pool
+metadata_extractor = MetadataExtractor()
+metadata_extractor.init_app(app, db, Song.__table__)
+
+# Deferred work is queued in the jobs table and run by `flask run-jobs` worker processes
+jobs = JobQueue()
+jobs.init_app(app, db, Job.__table__)
+
+# Top-K charts are served from snapshots refreshed in the background
+chart_snapshots = charts.ChartSnapshots()
+chart_snapshots.init_app(app, db)
+
+@app.errorhandler(PlayBufferFull)
+def play_buffer_full(e):
+    resp = jsonify({"message": "Too many play events, please retry"})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
+
+if not app.config['MEDIA_ROOT']:
+    app.logger.warning("MEDIA_ROOT is not set: song files will not be streamed or read")
 
 # Error handling
 def get_or_404(model, id):
@@ -35,6 +148,52 @@ def get_or_404(model, id):
         abort(404, description=f"{model.__name__} not found with id: {id}")
     return item
 
+# Deletes cascade to child rows with a few set-based statements (lib/cascades.py)
+def delete_response(kind, entity_id, name):
+    """
+        Delete a row and its children in one transaction and report the rows removed.
+        With ?background=true the delete is queued for a job worker instead;
+        GET /jobs/<job_id> reports its progress.
+        : return: 200, {"message", "deleted": {table: rows}}; 202, {"message", "job_id"}; 404
+    """
+    if request.args.get('background') in ('1', 'true', 'True'):
+        table = db.metadata.tables[kind]
+        if db.session.execute(select(table.c.id).where(table.c.id == entity_id)).scalar() is None:
+            abort(404, description=f"{name} not found with id: {entity_id}")
+        job_id = jobs.enqueue('cascade_delete', {'kind': kind, 'entity_id': entity_id})
+        db.session.commit()
+        return jsonify({"message": f"{name} deletion queued", "job_id": job_id}), 202
+    counts = cascade_delete(db.session, db.metadata.tables, kind, entity_id)
+    if counts is None:
+        abort(404, description=f"{name} not found with id: {entity_id}")
+    db.session.commit()
+    if counts.get('songs'):
+        if kind == 'songs':
+            song_files.invalidate(entity_id)
+        else:
+            song_files.clear()
+    return jsonify({"message": f"{name} deleted", "deleted": counts})
+
+@jobs.task('cascade_delete', timeout=3600)
+def cascade_delete_job(kind, entity_id):
+    cascade_delete(db.session, db.metadata.tables, kind, entity_id)
+    db.session.commit()
+
+# Multi-get: many items of one kind by id in one request (lib/multiget.py)
+def batch_response(model, item_endpoint, projection):
+    """
+        Items as item_endpoint returns them, honouring ?fields= and ?expand= like it does.
+        :param projection: Columns of the item route's usual output
+        : return: 200, {"items": [item or null, in request order], "missing": [ids]}; 400
+    """
+    resource = model.__tablename__
+    selection = requested_selection(resource)
+    loader = projection if selection is None else selection
+    return multi_get_response(resource, item_endpoint,
+                              lambda ids: loader.apply(model.query).filter(model.id.in_(ids)).all(),
+                              projection if selection is None else selection.serialize,
+                              related=expanded_tables(resource)())
+
 
 
 @app.route('/sign-up/user', methods=['POST'])
@@ -56,7 +215,7 @@ def create_user():
     if User.query.filter_by(username=username).first() or User.query.filter_by(email=email).first():
         return jsonify({'message': 'Username or email already exists'}), 400
 
-    hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+    hashed_password = password_hasher.hash(password)
 
     new_user = User(username=username, email=email, password=hashed_password)
     db.session.add(new_user)
@@ -85,10 +244,15 @@ def login():
 
     user = User.query.filter_by(username=username).first()
 
-    if not user or not bcrypt.check_password_hash(user.password, password):
+    if not user or not password_hasher.check(user.password, password):
         resp = jsonify({'message': 'Invalid credentials'})
         return resp, 401
 
+    # Upgrade hashes made with a different work factor while we have the password
+    if password_hasher.needs_rehash(user.password):
+        user.password = password_hasher.hash(password)
+        db.session.commit()
+
     access_token = create_access_token(identity=username)
     resp = jsonify({
         'username': username,
@@ -99,13 +263,14 @@ def login():
 
 
 def generate_token(expiry, username):
-    s = Serializer(current_app.config['JWT_SECRET_KEY'], expires_in=expiry)
-    return s.dumps({'username': username}).decode('utf-8')
+    # Timestamped, not expiring by itself: whoever checks it passes max_age=expiry to loads()
+    s = Serializer(current_app.config['JWT_SECRET_KEY'], salt='password-reset')
+    return s.dumps({'username': username})
 
 
 @app.route("/request-password-reset", methods=["POST"])
 @verify_api_key
-@jwt_required
+@jwt_required()
 def request_password_reset():
     """
     Handle forget password logic.
@@ -126,12 +291,14 @@ def request_password_reset():
     token_expiry_time = 60  # Token valid for 1 minute in seconds
     token = generate_token(expiry=token_expiry_time, username=user.email)
 
-    # Mocked email sender
-    sent_user_reset_token(recipient=user.email, token=token, name=user.name)
+    # Sent by a job worker; the request only queues it
+    jobs.enqueue('send_reset_token', {'recipient': user.email, 'token': token, 'name': user.username})
+    db.session.commit()
 
     return jsonify({"message": f"Token sent to your email {email}"}), 200
 
 
+@jobs.task('send_reset_token', priority=PRIORITY_HIGH, max_attempts=3, timeout=60)
 def sent_user_reset_token(recipient, token, name):
     # Mock email-sending function
     print(f"Sending token {token} to {recipient} for {name}")
@@ -139,8 +306,7 @@ def sent_user_reset_token(recipient, token, name):
 @app.route('/all/users', methods=['GET'])
 @verify_api_key
 def get_users():
-    users = User.query.all()
-    return jsonify([{"id": user.id, "username": user.username, "email": user.email} for user in users])
+    return list_response(User.query, User.id, Projection(User.id, User.username, User.email))
 
 # Get a specific user by ID
 @app.route('/a-user/<int:user_id>', methods=['GET'])
@@ -149,6 +315,13 @@ def get_user(user_id):
     user = User.query.get_or_404(user_id)
     return jsonify({"id": user.id, "username": user.username, "email": user.email})
 
+# Get many users by ID: /users/batch?ids=3,1,2
+@app.route('/users/batch', methods=['GET'])
+@verify_api_key
+@conditional('users', related=expanded_tables('users'))
+def get_users_batch():
+    return batch_response(User, 'get_user', Projection(User.id, User.username, User.email))
+
 # Update a user
 @app.route('/update-user/<int:user_id>', methods=['PUT'])
 @verify_api_key
@@ -165,10 +338,7 @@ def update_user(user_id):
 @app.route('/delete-user/<int:user_id>', methods=['DELETE'])
 @verify_api_key
 def delete_user(user_id):
-    user = User.query.get_or_404(user_id)
-    db.session.delete(user)
-    db.session.commit()
-    return jsonify({"message": "User deleted"})
+    return delete_response('users', user_id, 'User')
 
 # Create a new artist
 @app.route('/sign-up/artists', methods=['POST'])
@@ -186,16 +356,35 @@ def create_artist():
 # Get all artists
 @app.route('/all/artists', methods=['GET'])
 @verify_api_key
+@conditional('artists', related=expanded_tables('artists'))
+@cached('artists', related=expanded_tables('artists'))
 def get_artists():
-    artists = Artist.query.all()
-    return jsonify([{"id": artist.id, "name": artist.name, "bio": artist.bio} for artist in artists])
+    selection = requested_selection('artists')
+    if selection is not None:
+        return list_response(selection.apply(Artist.query), Artist.id, selection.serialize)
+    return list_response(Artist.query, Artist.id,
+                         Projection(Artist.id, Artist.name, Artist.bio, Artist.album_count, Artist.song_count))
 
 # Get a specific artist by ID
 @app.route('/a-artists/<int:artist_id>', methods=['GET'])
 @verify_api_key
+@conditional('artists', 'artist_id', related=expanded_tables('artists'))
+@cached('artists', 'artist_id', related=expanded_tables('artists'))
 def get_artist(artist_id):
+    selection = requested_selection('artists')
+    if selection is not None:
+        artist = selection.apply(Artist.query).filter(Artist.id == artist_id).first_or_404()
+        return jsonify(selection.serialize(artist))
     artist = Artist.query.get_or_404(artist_id)
-    return jsonify({"id": artist.id, "name": artist.name, "bio": artist.bio})
+    return jsonify(artist.to_dict())
+
+# Get many artists by ID: /artists/batch?ids=3,1,2
+@app.route('/artists/batch', methods=['GET'])
+@verify_api_key
+@conditional('artists', related=expanded_tables('artists'))
+def get_artists_batch():
+    return batch_response(Artist, 'get_artist', Projection(Artist.id, Artist.name, Artist.bio,
+                                                           Artist.album_count, Artist.song_count))
 
 # Update an artist
 @app.route('/update-artist/<int:artist_id>', methods=['PUT'])
@@ -212,10 +401,7 @@ def update_artist(artist_id):
 @app.route('/delete-artist/<int:artist_id>', methods=['DELETE'])
 @verify_api_key
 def delete_artist(artist_id):
-    artist = Artist.query.get_or_404(artist_id)
-    db.session.delete(artist)
-    db.session.commit()
-    return jsonify({"message": "Artist deleted"})
+    return delete_response('artists', artist_id, 'Artist')
 
 # CRUD operations for Album
 @app.route('/add-album', methods=['POST'])
@@ -229,15 +415,33 @@ def create_album():
 
 @app.route('/all-albums', methods=['GET'])
 @verify_api_key
+@conditional('albums', related=expanded_tables('albums'))
+@cached('albums', related=expanded_tables('albums'))
 def get_albums():
-    albums = Album.query.all()
-    return jsonify([{"id": album.id, "title": album.title, "artist_id": album.artist_id} for album in albums])
+    selection = requested_selection('albums')
+    if selection is not None:
+        return list_response(selection.apply(Album.query), Album.id, selection.serialize)
+    return list_response(Album.query, Album.id,
+                         Projection(Album.id, Album.title, Album.artist_id, Album.song_count, Album.total_duration))
 
 @app.route('/a-album/<int:album_id>', methods=['GET'])
 @verify_api_key
+@conditional('albums', 'album_id', related=expanded_tables('albums'))
+@cached('albums', 'album_id', related=expanded_tables('albums'))
 def get_album(album_id):
+    selection = requested_selection('albums')
+    if selection is not None:
+        album = selection.apply(Album.query).filter(Album.id == album_id).first_or_404()
+        return jsonify(selection.serialize(album))
     album = Album.query.get_or_404(album_id)
-    return jsonify({"id": album.id, "title": album.title, "artist_id": album.artist_id})
+    return jsonify(album.to_dict())
+
+@app.route('/albums/batch', methods=['GET'])
+@verify_api_key
+@conditional('albums', related=expanded_tables('albums'))
+def get_albums_batch():
+    return batch_response(Album, 'get_album', Projection(Album.id, Album.title, Album.artist_id,
+                                                         Album.song_count, Album.total_duration))
 
 @app.route('/update-album/<int:album_id>', methods=['PUT'])
 @verify_api_key
@@ -252,53 +456,151 @@ def update_album(album_id):
 @app.route('/delete-album/<int:album_id>', methods=['DELETE'])
 @verify_api_key
 def delete_album(album_id):
-    album = Album.query.get_or_404(album_id)
-    db.session.delete(album)
-    db.session.commit()
-    return jsonify({"message": "Album deleted"})
+    return delete_response('albums', album_id, 'Album')
 
 # CRUD operations for Song
 @app.route('/add-song', methods=['POST'])
 @verify_api_key
 def create_song():
     data = request.get_json()
+    if not is_relative_media_path(data.get('file_path')):
+        abort(400, description="'file_path' must be a relative path inside MEDIA_ROOT")
     new_song = Song(title=data['title'], duration=data['duration'], file_path=data['file_path'], album_id=data.get('album_id'), genre_id=data.get('genre_id'))
     db.session.add(new_song)
     db.session.commit()
+    # The real duration replaces the client's once the file has been read
+    metadata_extractor.submit(new_song.id)
     return jsonify({"message": "Song created", "song": data}), 201
 
+@app.route('/add-songs/bulk', methods=['POST'])
+@verify_api_key
+def create_songs_bulk():
+    """
+        Bulk song ingest.
+        Body: NDJSON (Content-Type: application/x-ndjson) or a JSON array, read as a stream.
+        Rows are validated, album/genre ids are checked with one IN query per batch,
+        and each batch is inserted with a single executemany and committed.
+        Query params: batch_size (default 1000)
+        : return: 200 with a per-row error report, 400 if the body cannot be parsed
+                  (in a JSON array, at the first malformed element; batches before it stay inserted)
+    """
+    batch_size = request.args.get('batch_size', DEFAULT_BATCH_SIZE, type=int)
+    if batch_size < 1:
+        return jsonify({"message": "batch_size must be positive"}), 400
+    batch_size = min(batch_size, MAX_BATCH_SIZE)
+
+    if 'ndjson' in (request.mimetype or ''):
+        items = iter_ndjson(request.stream)
+    else:
+        items = iter_json_array(request.stream)
+    ingest = SongIngest(db.session, Song.__table__, Album.__table__, Genre.__table__, batch_size)
+    try:
+        report = ingest.run(items)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"message": str(e), "inserted": ingest.inserted,
+                        "failed": ingest.error_count, "errors": ingest.errors}), 400
+    return jsonify(report), 200
+
 @app.route('/songs', methods=['GET'])
 @verify_api_key
+@conditional('songs', related=expanded_tables('songs'))
+@cached('songs', related=expanded_tables('songs'))
 def get_songs():
-    songs = Song.query.all()
-    return jsonify([{"id": song.id, "title": song.title, "duration": song.duration, "file_path": song.file_path} for song in songs])
+    """
+        Query params: limit, after, stream (see lib.pagination),
+        fields (e.g. id,title,album_id), expand (album, album.artist, genre)
+    """
+    selection = requested_selection('songs')
+    if selection is not None:
+        return list_response(selection.apply(Song.query), Song.id, selection.serialize, json_provider=fast_json)
+    return list_response(Song.query, Song.id, Projection(Song.id, Song.title, Song.duration, Song.file_path),
+                         json_provider=fast_json)
 
 @app.route('/songs/<int:song_id>', methods=['GET'])
 @verify_api_key
+@conditional('songs', 'song_id', related=expanded_tables('songs'))
+@cached('songs', 'song_id', related=expanded_tables('songs'))
 def get_song(song_id):
+    selection = requested_selection('songs')
+    if selection is not None:
+        song = selection.apply(Song.query).filter(Song.id == song_id).first_or_404()
+        return jsonify(selection.serialize(song))
     song = Song.query.get_or_404(song_id)
     return jsonify({"id": song.id, "title": song.title, "duration": song.duration, "file_path": song.file_path})
 
+@app.route('/songs/batch', methods=['GET'])
+@verify_api_key
+@conditional('songs', related=expanded_tables('songs'))
+def get_songs_batch():
+    return batch_response(Song, 'get_song', Projection(Song.id, Song.title, Song.duration, Song.file_path))
+
 @app.route('/songs/<int:song_id>', methods=['PUT'])
 @verify_api_key
 def update_song(song_id):
     song = Song.query.get_or_404(song_id)
     data = request.get_json()
+    if 'file_path' in data and not is_relative_media_path(data['file_path']):
+        abort(400, description="'file_path' must be a relative path inside MEDIA_ROOT")
     song.title = data.get('title', song.title)
     song.duration = data.get('duration', song.duration)
+    file_changed = data.get('file_path', song.file_path) != song.file_path
     song.file_path = data.get('file_path', song.file_path)
     song.album_id = data.get('album_id', song.album_id)
     song.genre_id = data.get('genre_id', song.genre_id)
     db.session.commit()
+    song_files.invalidate(song_id)
+    if file_changed:
+        metadata_extractor.submit(song_id)
     return jsonify({"message": "Song updated"})
 
 @app.route('/songs/<int:song_id>', methods=['DELETE'])
 @verify_api_key
 def delete_song(song_id):
-    song = Song.query.get_or_404(song_id)
-    db.session.delete(song)
-    db.session.commit()
-    return jsonify({"message": "Song deleted"})
+    return delete_response('songs', song_id, 'Song')
+
+@app.route('/songs/<int:song_id>/similar', methods=['GET'])
+@verify_api_key
+@conditional('similar_songs', 'song_id', related=lambda: ['songs'])
+@cached('similar_songs', 'song_id', related=lambda: ['songs'])
+def get_similar_songs(song_id):
+    """
+        Songs that share playlists with this one, best first, from the table
+        built by `flask build-similar-songs`.
+        Query params: limit (default 10)
+        : return: 200, 404
+    """
+    limit = min(max(request.args.get('limit', 10, type=int), 1), DEFAULT_TOP_K)
+    if db.session.get(Song, song_id) is None:
+        abort(404, description=f"Song not found with id: {song_id}")
+    rows = (db.session.query(SimilarSong.similar_song_id, SimilarSong.score, Song.title, Song.album_id)
+            .join(Song, Song.id == SimilarSong.similar_song_id)
+            .filter(SimilarSong.song_id == song_id)
+            .order_by(SimilarSong.rank).limit(limit).all())
+    return jsonify({"song_id": song_id, "items": [
+        {"id": similar_id, "title": title, "album_id": album_id, "score": score}
+        for similar_id, score, title, album_id in rows]})
+
+# Path and stat metadata per song, so seeks don't hit the database
+song_files = FileStatCache()
+
+def _song_file_path(song_id):
+    return db.session.query(Song.file_path).filter_by(id=song_id).scalar()
+
+@app.route('/songs/<int:song_id>/stream', methods=['GET'])
+@verify_api_key
+def stream_song(song_id):
+    """
+        Serve a song's audio file.
+        Supports Range requests (206), ETag/Last-Modified validators (304) and
+        hands the file to the server's wsgi.file_wrapper (sendfile) when available.
+        : return: 200, 206, 304, 404, 416
+    """
+    info = song_files.get(song_id, _song_file_path, app.config['MEDIA_ROOT'])
+    if info is None:
+        abort(404, description=f"Audio file not found for song id: {song_id}")
+    return send_file(info.path, mimetype=info.mimetype, conditional=True,
+                     etag=info.etag, last_modified=info.mtime, max_age=3600)
 # Genre Routes (Create, Get, Update, Delete)
 @app.route('/add-genre', methods=['POST'])
 @verify_api_key
@@ -314,12 +616,15 @@ def create_genre():
 
 @app.route('/all/genres', methods=['GET'])
 @verify_api_key
+@conditional('genres')
+@cached('genres')
 def get_genres():
-    genres = Genre.query.all()
-    return jsonify([{"id": genre.id, "title": genre.title, "artist_id": genre.artist_id} for genre in genres])
+    return list_response(Genre.query, Genre.id, Projection(Genre.id, Genre.title, Genre.artist_id))
 
 @app.route('/a-genre/<int:genre_id>', methods=['GET'])
 @verify_api_key
+@conditional('genres', 'genre_id')
+@cached('genres', 'genre_id')
 def get_genre(genre_id):
     genre = get_or_404(Genre, genre_id)
     return jsonify({"id": genre.id, "title": genre.title, "artist_id": genre.artist_id})
@@ -336,10 +641,7 @@ def update_genre(genre_id):
 @app.route('/delete-genre/<int:genre_id>', methods=['DELETE'])
 @verify_api_key
 def delete_genre(genre_id):
-    genre = get_or_404(Genre, genre_id)
-    db.session.delete(genre)
-    db.session.commit()
-    return jsonify({"message": "Genre deleted"})
+    return delete_response('genres', genre_id, 'Genre')
 
 # Playlist Routes (Create, Get, Update, Delete)
 @app.route('/create-playlist', methods=['POST'])
@@ -357,14 +659,82 @@ def create_playlist():
 @app.route('/all/playlists', methods=['GET'])
 @verify_api_key
 def get_playlists():
-    playlists = Playlist.query.all()
-    return jsonify([{"id": playlist.id, "title": playlist.title, "user_id": playlist.user_id} for playlist in playlists])
+    selection = requested_selection('playlists')
+    if selection is not None:
+        return list_response(selection.apply(Playlist.query), Playlist.id, selection.serialize)
+    return list_response(Playlist.query, Playlist.id,
+                         Projection(Playlist.id, Playlist.title, Playlist.user_id,
+                                    Playlist.song_count, Playlist.total_duration))
 
 @app.route('/a-playlist/<int:playlist_id>', methods=['GET'])
 @verify_api_key
 def get_playlist(playlist_id):
+    selection = requested_selection('playlists')
+    if selection is not None:
+        playlist = selection.apply(Playlist.query).filter(Playlist.id == playlist_id).first_or_404()
+        return jsonify(selection.serialize(playlist))
     playlist = get_or_404(Playlist, playlist_id)
-    return jsonify({"id": playlist.id, "title": playlist.title, "user_id": playlist.user_id})
+    return jsonify(playlist.to_dict())
+
+def playlist_track_to_dict(entry):
+    song = entry.song
+    album = song.album
+    # album_id / artist_id can point at rows that no longer exist
+    if album is not None:
+        artist = album.artist
+        album = {
+            "id": album.id, "title": album.title,
+            "artist": {"id": artist.id, "name": artist.name} if artist is not None else None,
+        }
+    return {
+        "entry_id": entry.id,
+        "position": entry.position,
+        "added_at": entry.added_at.isoformat() if entry.added_at else None,
+        "song": {
+            "id": song.id, "title": song.title, "duration": song.duration, "file_path": song.file_path,
+            "genre_id": song.genre_id, "album": album,
+        },
+    }
+
+@app.route('/a-playlist/<int:playlist_id>/tracks', methods=['GET'])
+@verify_api_key
+def get_playlist_tracks(playlist_id):
+    """
+    Returns a playlist with its ordered tracks, each with album and artist data.
+
+    Songs, albums and artists are joined-loaded with the entries, so a page costs
+    two queries (playlist + tracks) however long the playlist is.
+    Query params: limit (default 100, max 1000), after (next_cursor of the previous page)
+
+    Returns:
+        JSON playlist with 'tracks' and 'next_cursor'.
+    """
+    playlist = get_or_404(Playlist, playlist_id)
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    if limit < 1:
+        abort(400, description="'limit' must be positive")
+
+    query = (PlaylistSong.query
+             .filter(PlaylistSong.playlist_id == playlist_id)
+             .options(joinedload(PlaylistSong.song).joinedload(Song.album).joinedload(Album.artist)))
+    after = request.args.get('after')
+    if after:
+        # Cursor is "<position>:<entry id>" of the last track on the previous page
+        try:
+            position, entry_id = (int(part) for part in after.split(':'))
+        except ValueError:
+            abort(400, description="Invalid cursor")
+        query = query.filter(or_(PlaylistSong.position > position,
+                                 and_(PlaylistSong.position == position, PlaylistSong.id > entry_id)))
+    entries = query.order_by(PlaylistSong.position, PlaylistSong.id).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = f"{entries[-1].position}:{entries[-1].id}"
+    return jsonify({**playlist.to_dict(),
+                    "tracks": [playlist_track_to_dict(entry) for entry in entries],
+                    "next_cursor": next_cursor})
 
 @app.route('/update-playlist/<int:playlist_id>', methods=['PUT'])
 @verify_api_key
@@ -379,10 +749,7 @@ def update_playlist(playlist_id):
 @app.route('/delete-playlist/<int:playlist_id>', methods=['DELETE'])
 @verify_api_key
 def delete_playlist(playlist_id):
-    playlist = get_or_404(Playlist, playlist_id)
-    db.session.delete(playlist)
-    db.session.commit()
-    return jsonify({"message": "Playlist deleted"})
+    return delete_response('playlists', playlist_id, 'Playlist')
 
 # PlaylistSong Routes (Create, Get, Delete)
 @app.route('/add-song-to-playlist', methods=['POST'])
@@ -404,16 +771,50 @@ def add_song_to_playlist():
     song = Song.query.get(data['song_id'])
     if not playlist or not song:
         abort(400, description="Playlist or Song not found")
-    playlist_song = PlaylistSong(playlist_id=playlist.id, song_id=song.id)
+    position = next_position(db.session, PlaylistSong.__table__, playlist.id)
+    playlist_song = PlaylistSong(playlist_id=playlist.id, song_id=song.id, position=position)
     db.session.add(playlist_song)
     db.session.commit()
     return jsonify({"message": "Song added to playlist"})
 
+@app.route('/playlists/<int:playlist_id>/songs/batch', methods=['POST'])
+@verify_api_key
+def batch_update_playlist_songs(playlist_id):
+    """
+    Adds, removes and reorders many playlist entries in one transaction.
+
+    Expects JSON data with any of:
+        'add': song ids to append, or objects {"song_id": id, "after": entry id or null}
+        'remove': playlist entry ids
+        'move': objects {"id": entry id, "after": entry id or null}
+    "after": null places the song at the front of the playlist.
+
+    Returns:
+        JSON response with the number of added, removed and moved entries.
+    """
+    get_or_404(Playlist, playlist_id)
+    try:
+        add, remove, move = parse_playlist_changes(request.get_json())
+    except PlaylistChangeError as e:
+        abort(400, description=str(e))
+    try:
+        counts = apply_playlist_changes(db.session, PlaylistSong.__table__, Song.__table__,
+                                        playlist_id, add=add, remove=remove, move=move)
+        db.session.commit()
+    except PlaylistChangeError as e:
+        db.session.rollback()
+        abort(400, description=str(e))
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"message": "Song already in playlist"}), 409
+    return jsonify({"message": "Playlist updated", **counts})
+
 @app.route('/all/playlist-songs', methods=['GET'])
 @verify_api_key
 def get_playlist_songs():
-    playlist_songs = PlaylistSong.query.all()
-    return jsonify([{"id": playlist_song.id, "playlist_id": playlist_song.playlist_id, "song_id": playlist_song.song_id} for playlist_song in playlist_songs])
+    return list_response(PlaylistSong.query, PlaylistSong.id,
+                         Projection(PlaylistSong.id, PlaylistSong.playlist_id, PlaylistSong.song_id, PlaylistSong.position),
+                         json_provider=fast_json)
 
 @app.route('/remove-song-from-playlist/<int:id>', methods=['DELETE'])
 @verify_api_key
@@ -422,5 +823,296 @@ def remove_song_from_playlist(id):
     db.session.delete(playlist_song)
     db.session.commit()
     return jsonify({"message": "Song removed from playlist"})
+
+# Play events
+@app.route('/plays', methods=['POST'])
+@verify_api_key
+def record_plays():
+    """
+        Record play events without waiting for the database.
+        Body: one event or a JSON array of up to 1000, each
+        {"user_id", "song_id", "ms_played", "played_at" (ISO 8601 or epoch ms, optional)}
+        Events are written in batches shortly after; ones for unknown users or songs are dropped.
+        : return: 202 with a per-event error report, 400, 503 when the buffer is full
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        return jsonify({"message": "Body must be a JSON object or array"}), 400
+    items = data if isinstance(data, list) else [data]
+    if len(items) > MAX_EVENTS_PER_REQUEST:
+        return jsonify({"message": f"At most {MAX_EVENTS_PER_REQUEST} events per request"}), 400
+    events = []
+    errors = []
+    for index, item in enumerate(items):
+        values, error = validate_play(item)
+        if error:
+            errors.append({"row": index, "error": error})
+        else:
+            events.append(values)
+    if not events:
+        return jsonify({"message": "No valid events", "accepted": 0, "failed": len(errors), "errors": errors}), 400
+    play_buffer.add(events)
+    return jsonify({"accepted": len(events), "failed": len(errors), "errors": errors}), 202
+
+# Play buffer counters
+@app.route('/plays/stats', methods=['GET'])
+@verify_api_key
+def play_stats():
+    return jsonify(play_buffer.stats())
+
+# Job counts per status and task, and how far the workers are behind
+@app.route('/jobs/stats', methods=['GET'])
+@verify_api_key
+def job_stats():
+    return jsonify(jobs.stats())
+
+# Status of one job, e.g. a ?background=true delete. A worker process writes it, so
+# the recent-write cookie can't keep the poller on the primary: always read it there
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+@verify_api_key
+@use_primary
+def get_job(job_id):
+    return jsonify(get_or_404(Job, job_id).to_dict())
+
+# Cache counters, for sizing the response cache
+@app.route('/cache/stats', methods=['GET'])
+@verify_api_key
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+# Prometheus metrics
+@app.route('/metrics', methods=['GET'])
+@verify_api_key
+def get_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# Charts
+def chart_response(kind):
+    try:
+        window, granularity, buckets = charts.parse_window(request.args.get('window', '24h'))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+    metric = request.args.get('metric', 'plays')
+    if metric not in charts.METRICS:
+        return jsonify({"message": f"metric must be one of {', '.join(charts.METRICS)}"}), 400
+    limit = request.args.get('limit', 20, type=int)
+    if limit < 1:
+        return jsonify({"message": "limit must be positive"}), 400
+
+    snapshot = chart_snapshots.get(kind, granularity, buckets, metric)
+    if request.if_none_match.contains_weak(snapshot.etag):
+        response = app.response_class(status=304)
+    else:
+        response = fast_json.response({
+            "window": window, "metric": metric, "since": snapshot.since.isoformat(),
+            "generated_at": snapshot.generated_at.isoformat(),
+            "items": snapshot.items[:min(limit, charts.MAX_CHART_SIZE)]})
+    response.set_etag(snapshot.etag, weak=True)
+    response.headers['Cache-Control'] = f'max-age={int(chart_snapshots.refresh_seconds)}'
+    return response
+
+@app.route('/charts/songs', methods=['GET'])
+@verify_api_key
+def get_song_charts():
+    """
+        Most played songs over a recent window, from a snapshot refreshed every CHARTS_REFRESH_SECONDS.
+        Query params: window (1h, 6h, 24h, 7d, 30d... or hour, day, week, month; default 24h),
+        metric (plays, ms_played, playlist_adds), limit (default 20, at most 100)
+        : return: 200, 304, 400
+    """
+    return chart_response('songs')
+
+@app.route('/charts/artists', methods=['GET'])
+@verify_api_key
+def get_artist_charts():
+    """
+        Most played artists over a recent window; same query params as /charts/songs.
+        : return: 200, 304, 400
+    """
+    return chart_response('artists')
+
+# Full-text search
+@app.route('/search', methods=['GET'])
+@verify_api_key
+def search():
+    """
+        Ranked full-text search over songs, albums and artists.
+        Query params: q, type (song|album|artist), limit, offset
+        : return: 200, 400, 501
+    """
+    q = request.args.get('q', '')
+    kind = request.args.get('type')
+    if kind is not None and kind not in search_index.KINDS:
+        return jsonify({"message": "type must be one of song, album, artist"}), 400
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if limit < 1:
+        return jsonify({"message": "limit must be positive"}), 400
+
+    connection = db.session.connection()
+    if not search_index.is_supported(connection):
+        return jsonify({"message": "Search requires SQLite FTS5"}), 501
+    items = search_index.search(connection, q, kind=kind, limit=limit + 1, offset=offset)
+    next_offset = offset + limit if len(items) > limit else None
+    return jsonify({"items": items[:limit], "next_offset": next_offset})
+
+# Maintenance tasks for the job workers, e.g. `flask enqueue-job rebuild_search`
+@jobs.task('rebuild_search', priority=PRIORITY_LOW, timeout=3600)
+def rebuild_search_job():
+    with engine_transaction(['search_index']) as connection:
+        search_index.rebuild_search_index(connection)
+
+@jobs.task('rebuild_aggregates', priority=PRIORITY_LOW, timeout=3600)
+def rebuild_aggregates_job():
+    with engine_transaction(aggregates.AGGREGATES) as connection:
+        aggregates.create_aggregate_triggers(connection)
+        aggregates.rebuild_aggregates(connection)
+
+@jobs.task('rebuild_rollups', priority=PRIORITY_LOW, timeout=3600)
+def rebuild_rollups_job():
+    with engine_transaction(charts.ROLLUP_TABLES) as connection:
+        charts.create_rollup_triggers(connection)
+        charts.rebuild_rollups(connection)
+
+@jobs.task('build_similar_songs', priority=PRIORITY_LOW, timeout=3600)
+def build_similar_songs_job(full=False):
+    SimilarSongsBuilder(db.session, PlaylistSong.__table__, SimilarSong.__table__,
+                        SimilarityBuild.__table__).run(full=full)
+
+@jobs.task('extract_metadata', priority=PRIORITY_LOW, timeout=3600)
+def extract_metadata_job(recheck=False):
+    metadata_extractor.backfill(recheck=recheck)
+
+@app.cli.command('rebuild-search')
+def rebuild_search():
+    """Create the FTS5 search index if needed and repopulate it."""
+    with engine_transaction(['search_index']) as connection:
+        count = search_index.rebuild_search_index(connection)
+    print(f"Indexed {count} rows")
+
+@app.cli.command('verify-aggregates')
+@click.option('--fix', is_flag=True, help='Rebuild the counters when a mismatch is found')
+def verify_aggregates(fix):
+    """Recount the artist, album and playlist counters and report mismatches."""
+    with db.engine.connect() as connection:
+        mismatches = aggregates.verify_aggregates(connection)
+    for m in mismatches:
+        print(f"{m['table']} {m['id']} {m['column']}: stored {m['stored']}, actual {m['actual']}")
+    if mismatches and fix:
+        with engine_transaction(aggregates.AGGREGATES) as connection:
+            aggregates.rebuild_aggregates(connection)
+        print("Counters rebuilt")
+    elif mismatches:
+        raise SystemExit(1)
+    else:
+        print("All counters match")
+
+@app.cli.command('rebuild-aggregates')
+def rebuild_aggregates():
+    """Create the counter triggers if needed and recompute every counter."""
+    with engine_transaction(aggregates.AGGREGATES) as connection:
+        aggregates.create_aggregate_triggers(connection)
+        counts = aggregates.rebuild_aggregates(connection)
+    print(', '.join(f"{count} {table}" for table, count in counts.items()))
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups():
+    """Create the playlist-add rollup trigger if needed and recompute the chart rollups."""
+    with engine_transaction(charts.ROLLUP_TABLES) as connection:
+        charts.create_rollup_triggers(connection)
+        counts = charts.rebuild_rollups(connection)
+    print(', '.join(f"{count} {table}" for table, count in counts.items()))
+
+@app.cli.command('build-similar-songs')
+@click.option('--full', is_flag=True, help='Recompute every song instead of only changed playlists')
+@click.option('--top-k', default=DEFAULT_TOP_K, show_default=True, help='Neighbours stored per song')
+@click.option('--min-count', default=MIN_COOCCURRENCE, show_default=True,
+              help='Playlists two songs must share to count as similar')
+def build_similar_songs(full, top_k, min_count):
+    """Refresh the similar-songs table from playlist co-occurrence (needs numpy and scipy)."""
+    builder = SimilarSongsBuilder(db.session, PlaylistSong.__table__, SimilarSong.__table__,
+                                  SimilarityBuild.__table__, k=top_k, min_count=min_count)
+    report = builder.run(full=full)
+    kind = 'Full' if report['full'] else 'Incremental'
+    print(f"{kind} build: {report['songs']} songs, {report['pairs']} neighbours in {report['seconds']}s")
+
+@app.cli.command('extract-metadata')
+@click.option('--all', 'recheck', is_flag=True, help='Re-read every song, not only unchecked ones')
+@click.option('--workers', type=int, help='Files read in parallel (default METADATA_WORKERS)')
+def extract_metadata(recheck, workers):
+    """Read duration, bitrate, sample rate, codec and content hash from the song files."""
+    def progress(report):
+        print(f"{report['checked']} songs checked, {report['failed']} failed, {report['seconds']}s")
+    report = metadata_extractor.backfill(workers=workers, recheck=recheck, progress=progress)
+    print(f"Done: {report['checked']} songs checked, {report['failed']} failed in {report['seconds']}s")
+
+@app.cli.command('run-jobs')
+@click.option('--processes', default=1, show_default=True, help='Worker processes')
+@click.option('--burst', is_flag=True, help='Exit once no job is runnable instead of waiting for more')
+def run_jobs(processes, burst):
+    """Run queued background jobs; Ctrl-C or SIGTERM lets running jobs finish first."""
+    def progress(report):
+        print(f"Worker {os.getpid()}: {report['done']} done, {report['queued']} to retry, {report['dead']} dead")
+    jobs.run_workers(processes=processes, burst=burst, progress=progress)
+
+@app.cli.command('enqueue-job')
+@click.argument('task')
+@click.option('--payload', default='{}', help='JSON object of keyword arguments for the task')
+@click.option('--priority', type=int, help="Lower runs first (default: the task's own)")
+@click.option('--delay', default=0, help='Seconds before the job may run')
+def enqueue_job(task, payload, priority, delay):
+    """Queue a background job, e.g. rebuild_search or build_similar_songs."""
+    try:
+        job_id = jobs.enqueue(task, json.loads(payload), priority=priority, delay=delay)
+    except UnknownTask as e:
+        raise click.BadParameter(f"{e.args[0]}; known tasks: {', '.join(sorted(jobs.tasks))}")
+    db.session.commit()
+    print(f"Queued job {job_id}")
+
+@app.cli.command('job-stats')
+def job_stats_command():
+    """Print job counts per status and task."""
+    report = jobs.stats()
+    print(', '.join(f"{report[status]} {status}" for status in ('queued', 'running', 'done', 'dead')))
+    for task, counts in sorted(report['tasks'].items()):
+        print(f"  {task}: " + ', '.join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+@app.cli.command('requeue-dead-jobs')
+@click.option('--task', help='Only jobs of this task')
+def requeue_dead_jobs(task):
+    """Give dead jobs a fresh set of attempts."""
+    print(f"Requeued {jobs.requeue_dead(task)} jobs")
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Fail if a hot lookup query is planned as a full table scan (SQLite)."""
+    with db.engine.connect() as connection:
+        failures = find_table_scans(connection)
+    for name, lines in failures.items():
+        print(f"{name}: {'; '.join(lines)}")
+    if failures:
+        raise SystemExit(1)
+    print("All hot queries use an index")
+
+@app.cli.command('seed-catalog')
+@click.option('--artists', default=100, help='Number of artists')
+@click.option('--albums-per-artist', default=5)
+@click.option('--songs-per-album', default=10)
+@click.option('--genres-per-artist', default=2)
+@click.option('--users', default=1000)
+@click.option('--playlists', default=2000)
+@click.option('--playlist-min', default=5, help='Smallest playlist; sizes follow a heavy-tailed distribution')
+@click.option('--playlist-max', default=1000, help='Largest playlist')
+@click.option('--password', default='password', help='Password of every seeded user and artist')
+@click.option('--seed', default=0, help='Random seed, for a repeatable catalog')
+def seed_catalog_command(password, **options):
+    """Bulk-generate a synthetic catalog for load tests and benchmarks."""
+    tables = {model.__tablename__: model.__table__
+              for model in (User, Artist, Album, Genre, Song, Playlist, PlaylistSong)}
+    password_hash = password_hasher.hash(password)
+    counts = seed_catalog(db.session, tables, password_hash, **options)
+    db.session.commit()
+    print(', '.join(f"{count} {name}" for name, count in counts.items()))
+
 if __name__ == '__main__':
     app.run(port=0000, debug=True)
\ No newline at end of file
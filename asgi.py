@@ -0,0 +1,280 @@
+"""
+ASGI entry point, for holding many concurrent connections per process:
+
+    uvicorn asgi:application --workers 4
+
+Catalog reads and audio streaming are served natively on an async engine
+(aiosqlite / asyncpg) and return the same JSON as the Flask views. Every other
+route, and any request the native handlers don't cover exactly (bad params,
+missing API key, not found, multi-range...), is passed to the Flask app
+through asgiref's WSGI adapter, so responses stay identical.
+"""
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from urllib.parse import parse_qsl
+from werkzeug.http import http_date, parse_etags, parse_range_header
+import asyncio
+import json
+import os
+import re
+import time
+
+from app import app, db, song_files, _song_file_path, fast_json
+from models import Artist, Album, Genre, Song, TableVersion
+from lib.database import async_engine_url, async_engine_options, apply_sqlite_pragmas
+from lib.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, STREAM_BATCH_SIZE
+
+CHUNK_SIZE = 64 * 1024
+
+# path -> (model, True if the Flask route encodes with fast_json)
+LIST_ROUTES = {
+    '/songs': (Song, True),
+    '/all/artists': (Artist, False),
+    '/all-albums': (Album, False),
+    '/all/genres': (Genre, False),
+}
+ITEM_ROUTES = [
+    (re.compile(r'^/songs/(\d+)$'), Song),
+    (re.compile(r'^/a-artists/(\d+)$'), Artist),
+    (re.compile(r'^/a-album/(\d+)$'), Album),
+    (re.compile(r'^/a-genre/(\d+)$'), Genre),
+]
+STREAM_ROUTE = re.compile(r'^/songs/(\d+)/stream$')
+
+
+class NotHandled(Exception):
+    """The native handler can't answer exactly like Flask would; let Flask do it."""
+
+
+def _headers(scope):
+    return {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise NotHandled()
+
+
+async def _send(send, status, headers, body=b''):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class MusicaASGI:
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        self.engine = None
+        self.session = None
+
+    def start(self):
+        with self.flask_app.app_context():
+            url = db.engine.url
+        url = async_engine_url(url)
+        self.engine = create_async_engine(url, **async_engine_options(url, self.flask_app.config))
+        if url.get_backend_name() == 'sqlite':
+            from sqlalchemy import event
+            event.listen(self.engine.sync_engine, 'connect', apply_sqlite_pragmas)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def stop(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            handler = self.match(scope['path'])
+            if handler is not None:
+                if self.engine is None:
+                    self.start()
+                try:
+                    return await handler(scope, send)
+                except NotHandled:
+                    pass
+        return await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def match(self, path):
+        if path in LIST_ROUTES:
+            return lambda scope, send: self.list_route(scope, send, *LIST_ROUTES[path])
+        for pattern, model in ITEM_ROUTES:
+            found = pattern.match(path)
+            if found:
+                return lambda scope, send: self.item_route(scope, send, model, int(found.group(1)))
+        found = STREAM_ROUTE.match(path)
+        if found:
+            return lambda scope, send: self.stream_route(scope, send, int(found.group(1)))
+        return None
+
+    def check_api_key(self, headers):
+        # Missing or invalid keys get Flask's exact 401 responses
+        api_key = headers.get('x-api-key')
+        if not api_key or api_key != os.getenv('API_KEY'):
+            raise NotHandled()
+
+    def json_body(self, obj, fast=False):
+        provider = fast_json if fast else self.flask_app.json
+        with self.flask_app.app_context():
+            return provider.response(obj).get_data()
+
+    async def table_etag(self, session, table, entity_id=None):
+        version = (await session.execute(
+            select(TableVersion.version).where(TableVersion.table_name == table))).scalar()
+        etag = f"{table}-{version or 0}"
+        if entity_id is not None:
+            etag += f"-{entity_id}"
+        return etag
+
+    async def list_route(self, scope, send, model, fast):
+        headers = _headers(scope)
+        self.check_api_key(headers)
+        params = dict(parse_qsl(scope['query_string'].decode('latin-1')))
+        if set(params) - {'limit', 'after', 'stream'}:
+            raise NotHandled()
+        limit = _int_param(params, 'limit')
+        after = _int_param(params, 'after')
+        stream = params.get('stream') in ('1', 'true', 'True')
+        if limit is not None and limit < 1:
+            raise NotHandled()
+
+        async with self.session() as session:
+            etag = await self.table_etag(session, model.__tablename__)
+            etag_header = f'W/"{etag}"'
+            if parse_etags(headers.get('if-none-match')).contains_weak(etag):
+                return await _send(send, 304, [('ETag', etag_header)])
+
+            if stream:
+                return await self.stream_list(session, send, model, etag_header, fast)
+
+            query = select(model).order_by(model.id)
+            if limit is None and after is None:
+                rows = (await session.execute(query)).scalars().all()
+                body = self.json_body([row.to_dict() for row in rows], fast)
+            else:
+                limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+                if after is not None:
+                    query = query.where(model.id > after)
+                rows = (await session.execute(query.limit(limit + 1))).scalars().all()
+                next_cursor = None
+                if len(rows) > limit:
+                    rows = rows[:limit]
+                    next_cursor = rows[-1].id
+                body = self.json_body({"items": [row.to_dict() for row in rows], "next_cursor": next_cursor}, fast)
+        await _send(send, 200, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                                ('ETag', etag_header)], body)
+
+    async def stream_list(self, session, send, model, etag_header, fast):
+        dumps = fast_json.dumps if fast else json.dumps
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'application/json'), (b'etag', etag_header.encode())]})
+        result = await session.stream_scalars(
+            select(model).order_by(model.id).execution_options(yield_per=STREAM_BATCH_SIZE))
+        chunk = ['[']
+        first = True
+        async for row in result:
+            chunk.append(('' if first else ',') + dumps(row.to_dict()))
+            first = False
+            if len(chunk) >= 256:
+                await send({'type': 'http.response.body', 'body': ''.join(chunk).encode(), 'more_body': True})
+                chunk = []
+        chunk.append(']')
+        await send({'type': 'http.response.body', 'body': ''.join(chunk).encode()})
+
+    async def item_route(self, scope, send, model, entity_id):
+        headers = _headers(scope)
+        self.check_api_key(headers)
+        # ?fields= and ?expand= change the body and the tables its ETag covers; Flask does those
+        if parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True):
+            raise NotHandled()
+        async with self.session() as session:
+            etag = await self.table_etag(session, model.__tablename__, entity_id)
+            etag_header = f'W/"{etag}"'
+            if parse_etags(headers.get('if-none-match')).contains_weak(etag):
+                return await _send(send, 304, [('ETag', etag_header)])
+            row = await session.get(model, entity_id)
+            if row is None:
+                raise NotHandled()
+            body = self.json_body(row.to_dict())
+        await _send(send, 200, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                                ('ETag', etag_header)], body)
+
+    def _file_info(self, song_id):
+        with self.flask_app.app_context():
+            return song_files.get(song_id, _song_file_path, self.flask_app.config['MEDIA_ROOT'])
+
+    async def stream_route(self, scope, send, song_id):
+        headers = _headers(scope)
+        self.check_api_key(headers)
+        if 'if-range' in headers or 'if-modified-since' in headers:
+            raise NotHandled()
+        loop = asyncio.get_running_loop()
+        # Path and stat come from the shared cache; a miss costs one lookup in a worker thread
+        info = await loop.run_in_executor(None, self._file_info, song_id)
+        if info is None:
+            raise NotHandled()
+
+        common = [('Content-Disposition', f'inline; filename={os.path.basename(info.path)}'),
+                  ('Cache-Control', 'public, max-age=3600'),
+                  ('Expires', http_date(time.time() + 3600)),
+                  ('ETag', f'"{info.etag}"'),
+                  ('Accept-Ranges', 'bytes')]
+        if parse_etags(headers.get('if-none-match')).contains(info.etag):
+            return await _send(send, 304, common)
+
+        status, start, length = 200, 0, info.size
+        extra = []
+        if 'range' in headers:
+            ranges = parse_range_header(headers['range'])
+            if ranges is None or len(ranges.ranges) != 1:
+                raise NotHandled()
+            bounds = ranges.range_for_length(info.size)
+            if bounds is None:
+                raise NotHandled()
+            start, stop = bounds
+            status, length = 206, stop - start
+            extra = [('Content-Range', f'bytes {start}-{stop - 1}/{info.size}')]
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': [
+            (k.encode('latin-1'), v.encode('latin-1')) for k, v in
+            [('Content-Type', info.mimetype), ('Content-Length', str(length)),
+             ('Last-Modified', http_date(info.mtime))] + common + extra]})
+        if scope['method'] == 'HEAD':
+            return await send({'type': 'http.response.body', 'body': b''})
+
+        with open(info.path, 'rb') as file:
+            if 'http.response.zerocopysend' in scope.get('extensions', {}):
+                return await send({'type': 'http.response.zerocopysend', 'file': file,
+                                   'offset': start, 'count': length})
+            file.seek(start)
+            remaining = length
+            while remaining > 0:
+                data = await loop.run_in_executor(None, file.read, min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                await send({'type': 'http.response.body', 'body': data, 'more_body': remaining > 0})
+            if remaining > 0:
+                await send({'type': 'http.response.body', 'body': b''})
+
+
+application = MusicaASGI(app)
@@ -0,0 +1,140 @@
+"""
+Throughput and latency of the same routes under the WSGI and ASGI servers.
+
+Seeds a temporary SQLite database, starts the Flask app on werkzeug's threaded
+server and asgi.py on uvicorn, then drives each with the same number of
+concurrent keep-alive clients.
+
+    python bench/asgi_vs_wsgi.py --concurrency 64 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'bench-key'
+SONGS = 2000
+ROUTES = ['/songs?limit=50', '/songs/{id}', '/a-album/1', '/songs/{id}/stream']
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(media_root):
+    from app import app, db
+    from models import Artist, Album, Genre, Song
+    with open(os.path.join(media_root, 'track.mp3'), 'wb') as file:
+        file.write(os.urandom(256 * 1024))
+    with app.app_context():
+        db.create_all()
+        artist = Artist(name='Bench', bio='', password='x')
+        db.session.add(artist)
+        db.session.flush()
+        album = Album(title='Bench', artist_id=artist.id)
+        genre = Genre(title='Bench', artist_id=artist.id)
+        db.session.add_all([album, genre])
+        db.session.flush()
+        db.session.add_all([Song(title=f'song {i}', duration=i % 400, file_path='track.mp3',
+                                 album_id=album.id, genre_id=genre.id) for i in range(SONGS)])
+        db.session.commit()
+
+
+def start_server(mode, port, env):
+    if mode == 'wsgi':
+        command = [sys.executable, '-m', 'flask', '--app', 'app', 'run', '--port', str(port), '--with-threads']
+    else:
+        command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--port', str(port),
+                   '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            httpx.get(f'http://127.0.0.1:{port}/a-album/1', headers={'X-API-KEY': API_KEY}, timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def client(base_url, stop_at, latencies, errors, worker):
+    async with httpx.AsyncClient(base_url=base_url, headers={'X-API-KEY': API_KEY}, timeout=30) as session:
+        i = worker
+        while time.perf_counter() < stop_at:
+            path = ROUTES[i % len(ROUTES)].format(id=i % SONGS + 1)
+            i += 1
+            started = time.perf_counter()
+            try:
+                response = await session.get(path)
+                await response.aread()
+                if response.status_code not in (200, 206):
+                    errors.append(response.status_code)
+                    continue
+            except httpx.HTTPError:
+                errors.append(0)
+                continue
+            latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else None
+
+
+async def load(base_url, concurrency, seconds):
+    latencies, errors = [], []
+    stop_at = time.perf_counter() + seconds
+    await asyncio.gather(*(client(base_url, stop_at, latencies, errors, i) for i in range(concurrency)))
+    latencies.sort()
+    return {
+        "requests_per_sec": round(len(latencies) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2) if latencies else None,
+        "errors": len(errors),
+    }
+
+
+def run(mode, env, concurrency, seconds):
+    port = free_port()
+    process = start_server(mode, port, env)
+    try:
+        return asyncio.run(load(f'http://127.0.0.1:{port}', concurrency, seconds))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, API_KEY=API_KEY, MEDIA_ROOT=tmp, CACHE_BACKEND='none',
+                   SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        os.environ.update(env)
+        seed(tmp)
+        results = {
+            "wsgi": run('wsgi', env, args.concurrency, args.seconds),
+            "asgi": run('asgi', env, args.concurrency, args.seconds),
+            "concurrency": args.concurrency,
+            "routes": ROUTES,
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
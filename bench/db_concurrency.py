@@ -0,0 +1,104 @@
+"""
+Read throughput while a writer commits, for SQLite journal modes.
+
+Each mode gets a fresh database file seeded with songs. Reader threads run
+primary-key lookups while one writer thread inserts and commits in a loop.
+
+    python bench/db_concurrency.py --readers 4 --seconds 5
+"""
+from sqlalchemy import create_engine, text
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.database import SQLITE_DEFAULTS, configure_sqlite, engine_options
+
+ROWS = 20000
+
+
+def make_engine(path, journal_mode, synchronous):
+    config = dict(SQLITE_DEFAULTS, SQLITE_JOURNAL_MODE=journal_mode, SQLITE_SYNCHRONOUS=synchronous)
+    configure_sqlite(config)
+    uri = f'sqlite:///{path}'
+    return create_engine(uri, pool_size=16, **engine_options(uri, config))
+
+
+def seed(engine):
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE songs (id INTEGER PRIMARY KEY, title VARCHAR(200), duration INTEGER)"))
+        connection.execute(text("INSERT INTO songs (title, duration) VALUES (:title, :duration)"),
+                           [{'title': f'song {i}', 'duration': i % 400} for i in range(ROWS)])
+
+
+def reader(engine, stop, counts, errors):
+    reads = 0
+    with engine.connect() as connection:
+        while not stop.is_set():
+            try:
+                connection.execute(text("SELECT title FROM songs WHERE id = :id"),
+                                   {'id': random.randint(1, ROWS)}).scalar()
+                connection.commit()
+                reads += 1
+            except Exception:
+                errors.append(1)
+                connection.rollback()
+    counts.append(reads)
+
+
+def writer(engine, stop, counts, errors):
+    writes = 0
+    while not stop.is_set():
+        try:
+            with engine.begin() as connection:
+                connection.execute(text("INSERT INTO songs (title, duration) VALUES ('new', 1)"))
+            writes += 1
+        except Exception:
+            errors.append(1)
+    counts.append(writes)
+
+
+def run(journal_mode, synchronous, readers, seconds):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, 'bench.db'), journal_mode, synchronous)
+        seed(engine)
+        stop = threading.Event()
+        read_counts, write_counts, errors = [], [], []
+        threads = [threading.Thread(target=reader, args=(engine, stop, read_counts, errors))
+                   for _ in range(readers)]
+        threads.append(threading.Thread(target=writer, args=(engine, stop, write_counts, errors)))
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+    return {
+        "reads_per_sec": round(sum(read_counts) / seconds, 1),
+        "writes_per_sec": round(sum(write_counts) / seconds, 1),
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    args = parser.parse_args()
+    results = {
+        "delete_full": run('DELETE', 'FULL', args.readers, args.seconds),
+        "wal_normal": run('WAL', 'NORMAL', args.readers, args.seconds),
+        "readers": args.readers,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
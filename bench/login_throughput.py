@@ -0,0 +1,74 @@
+"""
+Login throughput: bcrypt checks inline on request threads vs the process pool.
+
+Simulates a login storm with N request threads and reports checks per second,
+plus how long a trivial "catalog read" takes on another thread meanwhile.
+
+    python bench/login_throughput.py --threads 16 --logins 200 --rounds 10
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.hashing import PasswordHasher, _hash_password, _check_password
+
+
+def probe_latency(stop, samples):
+    """Time a small pure-Python task repeatedly, standing in for a catalog read."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        sum(range(20000))
+        samples.append(time.perf_counter() - start)
+        time.sleep(0.005)
+
+
+def run(check, hashed, threads, logins):
+    stop = threading.Event()
+    samples = []
+    prober = threading.Thread(target=probe_latency, args=(stop, samples))
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: check(hashed, 'correct horse'), range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+    assert all(results)
+    samples.sort()
+    return {
+        "logins_per_sec": round(logins / elapsed, 1),
+        "probe_p50_ms": round(samples[len(samples) // 2] * 1000, 2) if samples else None,
+        "probe_p99_ms": round(samples[int(len(samples) * 0.99)] * 1000, 2) if samples else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    hashed = _hash_password('correct horse', args.rounds)
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_pending=args.logins)
+    hasher.check(hashed, 'correct horse')  # start the pool before timing
+    results = {
+        "inline": run(_check_password, hashed, args.threads, args.logins),
+        "process_pool": run(hasher.check, hashed, args.threads, args.logins),
+        "rounds": args.rounds,
+        "threads": args.threads,
+        "workers": hasher.workers,
+    }
+    hasher.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Multi-get routes (/songs/batch?ids=...) vs one item request per id.
+
+Seeds a temporary SQLite catalog with lib.seed, then times rendering one
+"screen" of N ids (the size of a playlist page) both ways through the test
+client: N requests to the item route, or one request to the batch route.
+Each is measured with the response cache off, cold (cleared before every
+screen) and warm (the same screen requested again), and reported as p50/p95
+milliseconds per screen:
+
+    python bench/multiget.py --sizes 10 50 100 --screens 50
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'bench-key'
+
+ROUTES = {
+    'songs': ('/songs/{}', '/songs/batch?ids={}'),
+    'albums': ('/a-album/{}', '/albums/batch?ids={}'),
+    'artists': ('/a-artists/{}', '/artists/batch?ids={}'),
+    'users': ('/a-user/{}', '/users/batch?ids={}'),
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def time_screens(client, screens, render, before=None):
+    timings = []
+    for ids in screens:
+        if before:
+            before()
+        started = time.perf_counter()
+        render(client, ids)
+        timings.append(time.perf_counter() - started)
+    return {"p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(timings, 0.95) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--kind', choices=sorted(ROUTES), default='songs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 100], help='Ids per screen')
+    parser.add_argument('--screens', type=int, default=50, help='Screens timed per size and mode')
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update(API_KEY=API_KEY, BCRYPT_LOG_ROUNDS='4', CACHE_BACKEND='memory',
+                          SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        from app import app, db, response_cache
+        from models import User, Artist, Album, Genre, Song, Playlist, PlaylistSong
+        from lib.seed import seed_catalog
+        from lib.aggregates import create_aggregate_triggers
+
+        tables = {model.__tablename__: model.__table__
+                  for model in (User, Artist, Album, Genre, Song, Playlist, PlaylistSong)}
+        with app.app_context():
+            db.create_all()
+            with db.engine.begin() as connection:
+                create_aggregate_triggers(connection)
+            dataset = seed_catalog(db.session, tables, 'x', artists=args.artists, users=args.users,
+                                   playlists=100, seed=args.seed)
+            db.session.commit()
+            table = tables[args.kind]
+            ids = [row[0] for row in db.session.execute(table.select().with_only_columns(table.c.id))]
+            db.session.remove()
+
+        item_route, batch_route = ROUTES[args.kind]
+        headers = {'X-API-KEY': API_KEY}
+
+        def per_id(client, screen):
+            for entity_id in screen:
+                assert client.get(item_route.format(entity_id), headers=headers).status_code == 200
+
+        def batch(client, screen):
+            assert client.get(batch_route.format(','.join(map(str, screen))), headers=headers).status_code == 200
+
+        backend = response_cache.backend
+        rng = random.Random(args.seed)
+        results = {}
+        with app.test_client() as client:
+            for size in args.sizes:
+                screens = [rng.sample(ids, min(size, len(ids))) for _ in range(args.screens)]
+                row = {}
+                for name, render in (('per_id', per_id), ('batch', batch)):
+                    response_cache.backend = None
+                    off = time_screens(client, screens, render)
+                    response_cache.backend = backend
+                    cold = time_screens(client, screens, render, before=response_cache.clear)
+                    # Every screen was just rendered once, so this pass reads the cache only
+                    warm = time_screens(client, screens, render)
+                    row[name] = {"no_cache": off, "cold_cache": cold, "warm_cache": warm}
+                row["speedup_p50"] = {mode: round(row["per_id"][mode]["p50_ms"] / row["batch"][mode]["p50_ms"], 1)
+                                      for mode in ("no_cache", "cold_cache", "warm_cache")}
+                results[str(size)] = row
+
+    print(json.dumps({"kind": args.kind, "dataset": dataset, "screens": args.screens, "sizes": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Play-event ingestion: one INSERT + commit per event vs the write-behind buffer.
+
+Posts play events to /plays from N client threads through the test client
+and reports events/second accepted and written, against a baseline that
+inserts and commits each event on the request thread like the create_* routes.
+
+    python bench/plays.py --threads 8 --events 50000 --per-request 50
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'bench-key'
+
+
+def batches(events, per_request, users, songs, seed):
+    rng = random.Random(seed)
+    for start in range(0, events, per_request):
+        yield [{'user_id': rng.randint(1, users), 'song_id': rng.randint(1, songs),
+                'ms_played': rng.randint(1000, 300000)} for _ in range(min(per_request, events - start))]
+
+
+def run(app, threads, post, payloads):
+    def send(payload):
+        with app.test_client() as client:
+            return post(client, payload)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(send, payloads))
+    return time.perf_counter() - started, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--per-request', type=int, default=50)
+    parser.add_argument('--baseline-events', type=int, default=2000,
+                        help='Events for the commit-per-event baseline (it is slow)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        os.environ['API_KEY'] = API_KEY
+        from app import app, db, play_buffer
+        from models import User, Artist, Album, Song, PlayEvent
+        from lib.plays import validate_play
+
+        users, songs = 1000, 5000
+        with app.app_context():
+            db.create_all()
+            db.session.execute(User.__table__.insert(), [
+                {'id': i, 'username': f'u{i}', 'email': f'u{i}@example.com', 'password': 'x'}
+                for i in range(1, users + 1)])
+            db.session.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Bench', 'password': 'x'}])
+            db.session.execute(Album.__table__.insert(), [{'id': 1, 'title': 'Bench', 'artist_id': 1}])
+            db.session.execute(Song.__table__.insert(), [
+                {'id': i, 'title': f's{i}', 'duration': 200, 'file_path': f'{i}.mp3', 'album_id': 1}
+                for i in range(1, songs + 1)])
+            db.session.commit()
+
+        headers = {'X-API-KEY': API_KEY}
+
+        # Baseline: the create_* route pattern, one event per request, INSERT + commit each
+        def commit_each(client, payload):
+            with app.app_context():
+                values, _ = validate_play(payload[0])
+                db.session.add(PlayEvent(**values))
+                db.session.commit()
+            return 201
+
+        baseline = list(batches(args.baseline_events, 1, users, songs, args.seed))
+        baseline_seconds, _ = run(app, args.threads, commit_each, baseline)
+
+        def post(client, payload):
+            return client.post('/plays', json=payload, headers=headers).status_code
+
+        payloads = list(batches(args.events, args.per_request, users, songs, args.seed))
+        started = time.perf_counter()
+        accept_seconds, statuses = run(app, args.threads, post, payloads)
+        play_buffer.flush()
+        written_seconds = time.perf_counter() - started
+
+        with app.app_context():
+            stored = db.session.query(PlayEvent).count() - args.baseline_events
+            db.engine.dispose()
+
+    results = {
+        "commit_per_event": {"events": args.baseline_events,
+                             "events_per_sec": round(args.baseline_events / baseline_seconds)},
+        "buffered": {"events": args.events, "per_request": args.per_request,
+                     "accepted_per_sec": round(args.events / accept_seconds),
+                     "written_per_sec": round(args.events / written_seconds),
+                     "statuses": {str(code): statuses.count(code) for code in sorted(set(statuses))},
+                     "stored": stored},
+        "buffer": play_buffer.stats(),
+        "threads": args.threads,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
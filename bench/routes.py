@@ -0,0 +1,320 @@
+"""
+Per-route throughput and latency of every route in app.py, on a seeded catalog.
+
+Seeds a temporary SQLite database with lib.seed (same seed, same data), then
+drives each route in-process through the Flask test client from several
+threads and reports requests/s and p50/p95/p99 latency as JSON. Results carry
+the git commit so runs can be compared:
+
+    python bench/routes.py --output before.json
+    python bench/routes.py --compare before.json --threshold 0.2
+"""
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'bench-key'
+PASSWORD = 'password'
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Context:
+    """Seeded id ranges plus pools of throwaway rows for the DELETE routes."""
+
+    def __init__(self, db, tables, media_root):
+        self.db = db
+        self.tables = tables
+        self.media_root = media_root
+        self.ids = {}
+        self.pools = {}
+        self.rng = random.Random(0)
+        self.lock = threading.Lock()
+        self.run = int(time.time())
+
+    def load_ids(self):
+        for name, table in self.tables.items():
+            self.ids[name] = [row[0] for row in self.db.session.execute(table.select().with_only_columns(table.c.id))]
+
+    def any(self, name):
+        with self.lock:
+            return self.rng.choice(self.ids[name])
+
+    def any_ids(self, name, n):
+        with self.lock:
+            return ','.join(str(self.rng.choice(self.ids[name])) for _ in range(n))
+
+    def make_pool(self, name, rows):
+        table = self.tables[name]
+        start = (self.db.session.execute(table.select().with_only_columns(table.c.id)
+                                         .order_by(table.c.id.desc()).limit(1)).scalar() or 0) + 1
+        rows = [dict(row, id=start + i) for i, row in enumerate(rows)]
+        self.db.session.execute(table.insert(), rows)
+        self.db.session.commit()
+        self.pools[name] = [row['id'] for row in rows]
+
+    def take(self, name):
+        with self.lock:
+            return self.pools[name].pop()
+
+
+def make_pools(ctx, size):
+    artist = ctx.ids['artists'][0]
+    album = ctx.ids['albums'][0]
+    user = ctx.ids['users'][0]
+    ctx.make_pool('users', [{'username': f'pool{i}', 'email': f'pool{i}@example.com', 'password': 'x'}
+                            for i in range(size)])
+    ctx.make_pool('artists', [{'name': f'Pool {i}', 'bio': '', 'password': 'x'} for i in range(size)])
+    ctx.make_pool('albums', [{'title': f'Pool {i}', 'artist_id': artist} for i in range(size)])
+    ctx.make_pool('genres', [{'title': f'Pool {i}', 'artist_id': artist} for i in range(size)])
+    ctx.make_pool('songs', [{'title': f'Pool {i}', 'duration': 1, 'file_path': 'pool.mp3', 'album_id': album}
+                            for i in range(size)])
+    ctx.make_pool('playlists', [{'title': f'Pool {i}', 'user_id': user} for i in range(size)])
+    ctx.make_pool('playlist_songs', [{'playlist_id': ctx.ids['playlists'][0], 'song_id': ctx.ids['songs'][i % 10],
+                                      'position': 0} for i in range(size)])
+
+
+def stream_songs(ctx, count):
+    """Write audio files for a handful of songs so the stream route has something to serve."""
+    songs = ctx.tables['songs']
+    rows = ctx.db.session.execute(songs.select().with_only_columns(songs.c.id, songs.c.file_path)
+                                  .where(songs.c.id.in_(ctx.ids['songs'][:count]))).all()
+    for _, file_path in rows:
+        path = os.path.join(ctx.media_root, file_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(os.urandom(512 * 1024))
+    return [song_id for song_id, _ in rows]
+
+
+# Endpoint name -> function(ctx, i) returning (method, path, request kwargs)
+SCENARIOS = {
+    'create_user': lambda ctx, i: ('POST', '/sign-up/user', {'json': {
+        'username': f'bench{ctx.run}-{i}', 'email': f'bench{ctx.run}-{i}@example.com', 'password': PASSWORD}}),
+    'login': lambda ctx, i: ('POST', '/login/user', {'json': {
+        'username': f"user{ctx.any('users')}", 'password': PASSWORD}}),
+    'request_password_reset': lambda ctx, i: ('POST', '/request-password-reset', {'json': {
+        'email': f"user{ctx.any('users')}@example.com"}}),
+    'get_users': lambda ctx, i: ('GET', f"/all/users?limit=100&after={ctx.any('users')}", {}),
+    'get_user': lambda ctx, i: ('GET', f"/a-user/{ctx.any('users')}", {}),
+    'get_users_batch': lambda ctx, i: ('GET', f"/users/batch?ids={ctx.any_ids('users', 50)}", {}),
+    'update_user': lambda ctx, i: ('PUT', f"/update-user/{ctx.any('users')}", {'json': {}}),
+    'delete_user': lambda ctx, i: ('DELETE', f"/delete-user/{ctx.take('users')}", {}),
+    'create_artist': lambda ctx, i: ('POST', '/sign-up/artists', {'json': {
+        'name': f'Bench {ctx.run}-{i}', 'bio': 'bench', 'password': PASSWORD}}),
+    'get_artists': lambda ctx, i: ('GET', f"/all/artists?limit=100&after={ctx.any('artists')}", {}),
+    'get_artist': lambda ctx, i: ('GET', f"/a-artists/{ctx.any('artists')}", {}),
+    'get_artists_batch': lambda ctx, i: ('GET', f"/artists/batch?ids={ctx.any_ids('artists', 50)}", {}),
+    'update_artist': lambda ctx, i: ('PUT', f"/update-artist/{ctx.any('artists')}", {'json': {'bio': f'bio {i}'}}),
+    'delete_artist': lambda ctx, i: ('DELETE', f"/delete-artist/{ctx.take('artists')}", {}),
+    'create_album': lambda ctx, i: ('POST', '/add-album', {'json': {
+        'title': f'Bench {i}', 'artist_id': ctx.any('artists')}}),
+    'get_albums': lambda ctx, i: ('GET', f"/all-albums?limit=100&after={ctx.any('albums')}", {}),
+    'get_album': lambda ctx, i: ('GET', f"/a-album/{ctx.any('albums')}", {}),
+    'get_albums_batch': lambda ctx, i: ('GET', f"/albums/batch?ids={ctx.any_ids('albums', 50)}", {}),
+    'update_album': lambda ctx, i: ('PUT', f"/update-album/{ctx.any('albums')}", {'json': {'title': f'Album {i}'}}),
+    'delete_album': lambda ctx, i: ('DELETE', f"/delete-album/{ctx.take('albums')}", {}),
+    'create_song': lambda ctx, i: ('POST', '/add-song', {'json': {
+        'title': f'Bench {i}', 'duration': 200, 'file_path': 'bench.mp3', 'album_id': ctx.any('albums')}}),
+    'create_songs_bulk': lambda ctx, i: ('POST', '/add-songs/bulk', {
+        'data': '\n'.join(json.dumps({'title': f'Bulk {i}-{n}', 'duration': 200, 'file_path': 'bulk.mp3',
+                                      'album_id': ctx.any('albums')}) for n in range(100)),
+        'content_type': 'application/x-ndjson'}),
+    'get_songs': lambda ctx, i: ('GET', f"/songs?limit=100&after={ctx.any('songs')}", {}),
+    'get_song': lambda ctx, i: ('GET', f"/songs/{ctx.any('songs')}", {}),
+    'get_songs_batch': lambda ctx, i: ('GET', f"/songs/batch?ids={ctx.any_ids('songs', 50)}", {}),
+    'update_song': lambda ctx, i: ('PUT', f"/songs/{ctx.any('songs')}", {'json': {'duration': 100 + i % 300}}),
+    'delete_song': lambda ctx, i: ('DELETE', f"/songs/{ctx.take('songs')}", {}),
+    'get_similar_songs': lambda ctx, i: ('GET', f"/songs/{ctx.any('songs')}/similar", {}),
+    'stream_song': lambda ctx, i: ('GET', f"/songs/{ctx.streamable[i % len(ctx.streamable)]}/stream", {
+        'headers': {'Range': f'bytes={i % 4 * 65536}-{i % 4 * 65536 + 65535}'} if i % 2 else {}}),
+    'create_genre': lambda ctx, i: ('POST', '/add-genre', {'json': {'title': 'Bench', 'artist_id': ctx.any('artists')}}),
+    'get_genres': lambda ctx, i: ('GET', f"/all/genres?limit=100&after={ctx.any('genres')}", {}),
+    'get_genre': lambda ctx, i: ('GET', f"/a-genre/{ctx.any('genres')}", {}),
+    'update_genre': lambda ctx, i: ('PUT', f"/update-genre/{ctx.any('genres')}", {'json': {'title': 'Jazz'}}),
+    'delete_genre': lambda ctx, i: ('DELETE', f"/delete-genre/{ctx.take('genres')}", {}),
+    'create_playlist': lambda ctx, i: ('POST', '/create-playlist', {'json': {
+        'title': f'Bench {i}', 'user_id': ctx.any('users')}}),
+    'get_playlists': lambda ctx, i: ('GET', f"/all/playlists?limit=100&after={ctx.any('playlists')}", {}),
+    'get_playlist': lambda ctx, i: ('GET', f"/a-playlist/{ctx.any('playlists')}", {}),
+    'get_playlist_tracks': lambda ctx, i: ('GET', f"/a-playlist/{ctx.any('playlists')}/tracks", {}),
+    'update_playlist': lambda ctx, i: ('PUT', f"/update-playlist/{ctx.any('playlists')}", {'json': {'title': f'P {i}'}}),
+    'delete_playlist': lambda ctx, i: ('DELETE', f"/delete-playlist/{ctx.take('playlists')}", {}),
+    'add_song_to_playlist': lambda ctx, i: ('POST', '/add-song-to-playlist', {'json': {
+        'playlist_id': ctx.any('playlists'), 'song_id': ctx.any('songs')}}),
+    'batch_update_playlist_songs': lambda ctx, i: ('POST', f"/playlists/{ctx.any('playlists')}/songs/batch", {
+        'json': {'add': [ctx.any('songs') for _ in range(10)]}}),
+    'get_playlist_songs': lambda ctx, i: ('GET', f"/all/playlist-songs?limit=100&after={ctx.any('playlist_songs')}", {}),
+    'remove_song_from_playlist': lambda ctx, i: ('DELETE', f"/remove-song-from-playlist/{ctx.take('playlist_songs')}", {}),
+    'record_plays': lambda ctx, i: ('POST', '/plays', {'json': [
+        {'user_id': ctx.any('users'), 'song_id': ctx.any('songs'), 'ms_played': 30000 + i} for _ in range(50)]}),
+    'play_stats': lambda ctx, i: ('GET', '/plays/stats', {}),
+    'job_stats': lambda ctx, i: ('GET', '/jobs/stats', {}),
+    'get_song_charts': lambda ctx, i: ('GET', f"/charts/songs?window={('1h', '24h', '7d')[i % 3]}", {}),
+    'get_artist_charts': lambda ctx, i: ('GET', f"/charts/artists?window={('1h', '24h', '7d')[i % 3]}", {}),
+    'cache_stats': lambda ctx, i: ('GET', '/cache/stats', {}),
+    'get_metrics': lambda ctx, i: ('GET', '/metrics', {}),
+    'search': lambda ctx, i: ('GET', f"/search?q={ctx.rng.choice(('blue', 'night', 'river', 'gold', 'echo'))}", {}),
+}
+
+
+def uncovered_rules(app, ctx):
+    """URL rules of the app that no scenario exercises."""
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for scenario in SCENARIOS.values():
+        method, path, _ = scenario(ctx, 0)
+        rule, _ = adapter.match(path.split('?')[0], method=method, return_rule=True)
+        covered.add((rule.rule, method))
+    return sorted(f"{method} {rule.rule}" for rule in app.url_map.iter_rules() if rule.endpoint != 'static'
+                  for method in rule.methods - {'HEAD', 'OPTIONS'} if (rule.rule, method) not in covered)
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def bench_route(app, ctx, endpoint, requests, concurrency):
+    scenario = SCENARIOS[endpoint]
+    counter = count()
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker():
+        client = app.test_client()
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            method, path, kwargs = scenario(ctx, i)
+            headers = {'X-API-KEY': API_KEY, **kwargs.pop('headers', {})}
+            started = time.perf_counter()
+            response = client.open(path, method=method, headers=headers, **kwargs)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "requests_per_sec": round(len(latencies) / wall, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "statuses": {str(code): n for code, n in sorted(statuses.items())},
+    }
+
+
+def compare(baseline, results, threshold):
+    """Routes whose p95 grew by more than threshold (a fraction) since the baseline."""
+    regressions = {}
+    for endpoint, current in results['routes'].items():
+        before = baseline.get('routes', {}).get(endpoint)
+        if not before or not before['p95_ms']:
+            continue
+        change = (current['p95_ms'] - before['p95_ms']) / before['p95_ms']
+        if change > threshold:
+            regressions[endpoint] = {"p95_ms_before": before['p95_ms'], "p95_ms_after": current['p95_ms'],
+                                     "change": round(change, 3)}
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--routes', nargs='*', help='Endpoint names to run (default: all)')
+    parser.add_argument('--artists', type=int, default=100)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--playlists', type=int, default=2000)
+    parser.add_argument('--bcrypt-rounds', type=int, default=12)
+    parser.add_argument('--output', help='Write the JSON results to this file')
+    parser.add_argument('--compare', help='Baseline results file to compare p95 latencies against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p95 growth that counts as a regression')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='musica-bench-')
+    os.environ.update(API_KEY=API_KEY, MEDIA_ROOT=tmp, BCRYPT_LOG_ROUNDS=str(args.bcrypt_rounds),
+                      SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+                      SECRET_KEY='bench', JWT_SECRET_KEY='bench')
+    from app import app, db, password_hasher
+    from models import User, Artist, Album, Genre, Song, Playlist, PlaylistSong
+    from lib.seed import seed_catalog
+    from lib import search as search_index, aggregates, charts
+
+    tables = {model.__tablename__: model.__table__
+              for model in (User, Artist, Album, Genre, Song, Playlist, PlaylistSong)}
+    endpoints = args.routes or list(SCENARIOS)
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            search_index.create_search_index(connection)
+            aggregates.create_aggregate_triggers(connection)
+            charts.create_rollup_triggers(connection)
+        dataset = seed_catalog(db.session, tables, password_hasher.hash(PASSWORD), artists=args.artists,
+                               users=args.users, playlists=args.playlists)
+        db.session.commit()
+        ctx = Context(db, tables, tmp)
+        ctx.load_ids()
+        # One spare row per pool for the coverage check
+        make_pools(ctx, args.requests + 1)
+        ctx.streamable = stream_songs(ctx, 20)
+        db.session.remove()
+    missing = uncovered_rules(app, ctx)
+
+    routes = {endpoint: bench_route(app, ctx, endpoint, args.requests, args.concurrency) for endpoint in endpoints}
+    password_hasher.shutdown()
+    shutil.rmtree(tmp, ignore_errors=True)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "requests_per_route": args.requests,
+        "concurrency": args.concurrency,
+        "routes": routes,
+        "routes_without_scenario": missing,
+    }
+    if args.compare:
+        with open(args.compare) as file:
+            results["regressions"] = compare(json.load(file), results, args.threshold)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output + '\n')
+    print(output)
+    if results.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
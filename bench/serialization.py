@@ -0,0 +1,75 @@
+"""
+Rows/second of the list-route serialization paths.
+
+Builds the /songs response for a seeded table three ways inside a request
+context: ORM objects + to_dict + jsonify (the original path), a column
+Projection + jsonify, and a Projection + FastJSONProvider (orjson if installed).
+
+    python bench/serialization.py --rows 50000 --repeat 5
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def measure(app, build, rows, repeat):
+    best = None
+    for _ in range(repeat):
+        with app.test_request_context('/songs'):
+            started = time.perf_counter()
+            body = build().get_data()
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return {"rows_per_sec": round(rows / best), "best_seconds": round(best, 4), "bytes": len(body)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from app import app, db
+        from models import Song, Album, Artist
+        from lib.pagination import list_response
+        from lib.serialization import Projection, FastJSONProvider, orjson
+
+        with app.app_context():
+            db.create_all()
+            db.session.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Bench', 'password': 'x'}])
+            db.session.execute(Album.__table__.insert(), [{'id': 1, 'title': 'Bench', 'artist_id': 1}])
+            db.session.execute(Song.__table__.insert(), [
+                {'title': f'song {i}', 'duration': i % 400, 'file_path': f'{i}.mp3', 'album_id': 1}
+                for i in range(args.rows)])
+            db.session.commit()
+
+        fast_json = FastJSONProvider(app)
+        projection = Projection(Song.id, Song.title, Song.duration, Song.file_path)
+        paths = {
+            "orm_to_dict_jsonify": lambda: list_response(Song.query, Song.id, Song.to_dict),
+            "projection_jsonify": lambda: list_response(Song.query, Song.id, projection),
+            "projection_fast_json": lambda: list_response(Song.query, Song.id, projection, json_provider=fast_json),
+        }
+        results = {name: measure(app, build, args.rows, args.repeat) for name, build in paths.items()}
+
+        # The three paths must agree on the data they return
+        with app.test_request_context('/songs'):
+            bodies = [json.loads(build().get_data()) for build in paths.values()]
+        results["same_output"] = all(body == bodies[0] for body in bodies)
+        results["orjson"] = orjson is not None
+        results["rows"] = args.rows
+        with app.app_context():
+            db.engine.dispose()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Build time and memory of the similar-songs model at 1M+ playlist_songs rows.
+
+Generates (playlist, song) pairs in memory with the seeder's shape (Pareto
+playlist sizes, Zipf song popularity), then times a full top-K build and an
+incremental one after a batch of new rows, with peak traced memory of each.
+The database is left out so the numbers are the model's own.
+
+    python bench/similarity.py --rows 1000000 --songs 200000 --added 1000
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np
+
+from lib.seed import PLAYLIST_SIZE_SHAPE, SONG_POPULARITY_SKEW
+from lib.similarity import playlist_matrix, top_k_neighbours, DEFAULT_TOP_K, MIN_COOCCURRENCE
+
+
+def synthetic_pairs(rng, rows, songs, min_size=5, max_size=1000):
+    sizes = []
+    total = 0
+    while total < rows:
+        size = min(max_size, int(min_size * (1 + rng.pareto(PLAYLIST_SIZE_SHAPE))))
+        sizes.append(size)
+        total += size
+    playlist_ids = np.repeat(np.arange(1, len(sizes) + 1), sizes)
+    weights = 1.0 / np.arange(1, songs + 1) ** SONG_POPULARITY_SKEW
+    song_ids = rng.choice(np.arange(1, songs + 1), size=total, p=weights / weights.sum())
+    return playlist_ids, song_ids
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, {"seconds": round(seconds, 3), "peak_mb": round(peak / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--songs', type=int, default=200000)
+    parser.add_argument('--added', type=int, default=1000, help='Rows added before the incremental build')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K)
+    parser.add_argument('--min-count', type=int, default=MIN_COOCCURRENCE)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    playlist_ids, song_ids = synthetic_pairs(rng, args.rows, args.songs)
+    matrix, matrix_stats = measure(lambda: playlist_matrix(playlist_ids, song_ids))
+    all_songs = np.unique(song_ids)
+    full, full_stats = measure(lambda: top_k_neighbours(matrix, all_songs, args.top_k, args.min_count))
+
+    # New rows land in random existing playlists, songs drawn uniformly
+    new_playlists = rng.integers(1, playlist_ids.max() + 1, size=args.added)
+    new_songs = rng.integers(1, args.songs + 1, size=args.added)
+    playlist_ids = np.concatenate([playlist_ids, new_playlists])
+    song_ids = np.concatenate([song_ids, new_songs])
+
+    def incremental():
+        updated = playlist_matrix(playlist_ids, song_ids)
+        playlists = np.unique(updated.tocsc()[:, np.unique(new_songs)].indices)
+        songs = np.unique(updated[playlists].indices)
+        return songs, top_k_neighbours(updated, songs, args.top_k, args.min_count)
+
+    (recomputed, _), incremental_stats = measure(incremental)
+
+    results = {
+        "rows": int(len(playlist_ids) - args.added),
+        "playlists": int(matrix.shape[0] - 1),
+        "songs": int(len(all_songs)),
+        "matrix": {**matrix_stats, "mb": round((matrix.data.nbytes + matrix.indices.nbytes
+                                                + matrix.indptr.nbytes) / 2 ** 20, 1)},
+        "full_build": {**full_stats, "neighbour_rows": int(len(full[0]))},
+        "incremental_build": {**incremental_stats, "added_rows": args.added,
+                              "songs_recomputed": int(len(recomputed))},
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+from sqlalchemy import text
+
+# Denormalized counters kept in step with their child rows by database triggers,
+# so every write path (ORM, bulk Core inserts, raw SQL) maintains them in the
+# same transaction. Each column's source of truth is the subquery below, used
+# by verify_aggregates and rebuild_aggregates.
+AGGREGATES = {
+    'albums': {
+        'song_count': "SELECT count(*) FROM songs WHERE songs.album_id = albums.id",
+        'total_duration': "SELECT coalesce(sum(songs.duration), 0) FROM songs WHERE songs.album_id = albums.id",
+    },
+    'artists': {
+        'album_count': "SELECT count(*) FROM albums WHERE albums.artist_id = artists.id",
+        'song_count': "SELECT count(*) FROM songs JOIN albums ON albums.id = songs.album_id "
+                      "WHERE albums.artist_id = artists.id",
+    },
+    'playlists': {
+        'song_count': "SELECT count(*) FROM playlist_songs WHERE playlist_songs.playlist_id = playlists.id",
+        'total_duration': "SELECT coalesce(sum(songs.duration), 0) FROM playlist_songs "
+                          "JOIN songs ON songs.id = playlist_songs.song_id "
+                          "WHERE playlist_songs.playlist_id = playlists.id",
+    },
+}
+
+# Writes to a source table change rows of these tables through the triggers
+DEPENDENT_TABLES = {
+    'songs': ('albums', 'artists', 'playlists'),
+    'albums': ('artists',),
+    'playlist_songs': ('playlists',),
+}
+
+
+def _song_added(row):
+    return (f"UPDATE albums SET song_count = song_count + 1, "
+            f"total_duration = total_duration + coalesce({row}.duration, 0) WHERE id = {row}.album_id; "
+            f"UPDATE artists SET song_count = song_count + 1 "
+            f"WHERE id = (SELECT artist_id FROM albums WHERE id = {row}.album_id);")
+
+
+def _song_removed(row):
+    return (f"UPDATE albums SET song_count = song_count - 1, "
+            f"total_duration = total_duration - coalesce({row}.duration, 0) WHERE id = {row}.album_id; "
+            f"UPDATE artists SET song_count = song_count - 1 "
+            f"WHERE id = (SELECT artist_id FROM albums WHERE id = {row}.album_id);")
+
+
+def _song_duration_delta(delta, song):
+    # Once per playlist entry of the song
+    return (f"UPDATE playlists SET total_duration = total_duration + ({delta}) * "
+            f"(SELECT count(*) FROM playlist_songs WHERE playlist_id = playlists.id AND song_id = {song}) "
+            f"WHERE id IN (SELECT playlist_id FROM playlist_songs WHERE song_id = {song});")
+
+
+def _album_added(row):
+    return (f"UPDATE artists SET album_count = album_count + 1, song_count = song_count + {row}.song_count "
+            f"WHERE id = {row}.artist_id;")
+
+
+def _album_removed(row):
+    return (f"UPDATE artists SET album_count = album_count - 1, song_count = song_count - {row}.song_count "
+            f"WHERE id = {row}.artist_id;")
+
+
+def _entry_added(row):
+    return (f"UPDATE playlists SET song_count = song_count + 1, total_duration = total_duration + "
+            f"coalesce((SELECT duration FROM songs WHERE id = {row}.song_id), 0) WHERE id = {row}.playlist_id;")
+
+
+def _entry_removed(row):
+    return (f"UPDATE playlists SET song_count = song_count - 1, total_duration = total_duration - "
+            f"coalesce((SELECT duration FROM songs WHERE id = {row}.song_id), 0) WHERE id = {row}.playlist_id;")
+
+
+# table: (columns whose updates matter, on insert, on delete, extra statements on update)
+TRIGGERS = {
+    'songs': ('album_id, duration', _song_added('new'), _song_removed('old'),
+              _song_duration_delta('coalesce(new.duration, 0) - coalesce(old.duration, 0)', 'new.id')),
+    'albums': ('artist_id', _album_added('new'), _album_removed('old'), ''),
+    'playlist_songs': ('playlist_id, song_id', _entry_added('new'), _entry_removed('old'), ''),
+}
+SONG_DELETED_FROM_PLAYLISTS = _song_duration_delta('-coalesce(old.duration, 0)', 'old.id')
+
+
+def _sqlite_statements():
+    statements = []
+    for table, (columns, added, removed, updated) in TRIGGERS.items():
+        on_delete = removed + (SONG_DELETED_FROM_PLAYLISTS if table == 'songs' else '')
+        statements += [
+            f"CREATE TRIGGER IF NOT EXISTS {table}_aggregates_ai AFTER INSERT ON {table} BEGIN {added} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_aggregates_ad AFTER DELETE ON {table} BEGIN {on_delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {table}_aggregates_au AFTER UPDATE OF {columns} ON {table} "
+            f"BEGIN {removed} {added} {updated} END",
+        ]
+    return statements
+
+
+def _postgresql_statements():
+    statements = []
+    for table, (columns, added, removed, updated) in TRIGGERS.items():
+        on_delete = removed + (SONG_DELETED_FROM_PLAYLISTS if table == 'songs' else '')
+        statements += [
+            f"CREATE OR REPLACE FUNCTION {table}_aggregates() RETURNS trigger AS $$ BEGIN "
+            f"IF TG_OP = 'INSERT' THEN {added} "
+            f"ELSIF TG_OP = 'DELETE' THEN {on_delete} "
+            f"ELSE {removed} {added} {updated} END IF; "
+            f"RETURN NULL; END $$ LANGUAGE plpgsql",
+            f"DROP TRIGGER IF EXISTS {table}_aggregates ON {table}",
+            f"CREATE TRIGGER {table}_aggregates AFTER INSERT OR DELETE OR UPDATE OF {columns} ON {table} "
+            f"FOR EACH ROW EXECUTE FUNCTION {table}_aggregates()",
+        ]
+    return statements
+
+
+def create_aggregate_triggers(connection):
+    """
+        Create the triggers maintaining the aggregate columns. Idempotent.
+        :param connection: SQLAlchemy connection to SQLite or PostgreSQL
+    """
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        statements = _sqlite_statements()
+    elif dialect == 'postgresql':
+        statements = _postgresql_statements()
+    else:
+        raise RuntimeError(f"Aggregate triggers are not implemented for {dialect}")
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def drop_aggregate_triggers(connection):
+    for table in TRIGGERS:
+        if connection.dialect.name == 'postgresql':
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_aggregates ON {table}")
+            connection.exec_driver_sql(f"DROP FUNCTION IF EXISTS {table}_aggregates()")
+        else:
+            for suffix in ('ai', 'ad', 'au'):
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {table}_aggregates_{suffix}")
+
+
+def verify_aggregates(connection, limit=100):
+    """
+        Compare every aggregate column with a recount from the child rows.
+        :return: list of {"table", "id", "column", "stored", "actual"}, at most limit per column
+    """
+    mismatches = []
+    for table, columns in AGGREGATES.items():
+        for column, source in columns.items():
+            rows = connection.execute(text(
+                f"SELECT id, {column}, ({source}) AS actual FROM {table} "
+                f"WHERE {column} <> ({source}) ORDER BY id LIMIT :limit"), {'limit': limit})
+            mismatches += [{"table": table, "id": id, "column": column, "stored": stored, "actual": actual}
+                           for id, stored, actual in rows]
+    return mismatches
+
+
+def rebuild_aggregates(connection):
+    """
+        Recompute every aggregate column from the child rows, e.g. after the
+        triggers were created on an existing database or a mismatch was found.
+        :return: {table: rows updated}
+    """
+    counts = {}
+    for table, columns in AGGREGATES.items():
+        assignments = ', '.join(f"{column} = ({source})" for column, source in columns.items())
+        counts[table] = connection.execute(text(f"UPDATE {table} SET {assignments}")).rowcount
+    return counts
@@ -0,0 +1,259 @@
+from collections import namedtuple
+import hashlib
+import os
+import struct
+
+AudioInfo = namedtuple('AudioInfo', ['codec', 'duration', 'bitrate', 'sample_rate'])
+
+# Bytes read to find the first MP3 frame after any ID3v2 tag
+SCAN_BYTES = 64 * 1024
+# Bytes read from the end of an Ogg file to find its last page
+OGG_TAIL_BYTES = 64 * 1024
+HASH_CHUNK_SIZE = 1024 * 1024
+
+WAV_CODECS = {1: 'pcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw', 0x11: 'adpcm', 0x55: 'mp3'}
+
+# kbps by bitrate index, per (MPEG version 1 or 2, layer)
+MP3_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {1: (44100, 48000, 32000), 2: (22050, 24000, 16000), 2.5: (11025, 12000, 8000)}
+
+
+class UnsupportedAudio(ValueError):
+    """The file is not WAV, FLAC, MP3 or Ogg, or its header is damaged."""
+
+
+def _kbps(bits, seconds):
+    return round(bits / seconds / 1000) if seconds else None
+
+
+def _id3v2_size(head):
+    # ID3v2 tag in front of MP3 (and some FLAC) files: 10 byte header, syncsafe size
+    if len(head) < 10 or head[:3] != b'ID3':
+        return 0
+    size = (head[6] & 0x7f) << 21 | (head[7] & 0x7f) << 14 | (head[8] & 0x7f) << 7 | (head[9] & 0x7f)
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+
+def _wav(f, size):
+    f.seek(12)
+    fmt = None
+    while True:
+        chunk = f.read(8)
+        if len(chunk) < 8:
+            raise UnsupportedAudio("WAV file has no data chunk")
+        chunk_id, chunk_size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'fmt ':
+            body = f.read(min(chunk_size, 40))
+            if len(body) < 16:
+                raise UnsupportedAudio("WAV fmt chunk is truncated")
+            fmt = struct.unpack('<HHIIHH', body[:16])
+            if fmt[0] == 0xFFFE and len(body) >= 26:
+                # WAVE_FORMAT_EXTENSIBLE: the real format tag starts the sub-format GUID
+                fmt = (struct.unpack('<H', body[24:26])[0],) + fmt[1:]
+            f.seek(chunk_size - len(body) + (chunk_size & 1), 1)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise UnsupportedAudio("WAV data chunk before fmt chunk")
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF; trust the file size then
+            data_size = min(chunk_size, size - f.tell()) if chunk_size else size - f.tell()
+            break
+        else:
+            f.seek(chunk_size + (chunk_size & 1), 1)
+    format_tag, _, sample_rate, byte_rate, _, _ = fmt
+    duration = data_size / byte_rate if byte_rate else None
+    return AudioInfo(WAV_CODECS.get(format_tag, f'wav_0x{format_tag:04x}'), duration,
+                     round(byte_rate * 8 / 1000) if byte_rate else None, sample_rate)
+
+
+def _flac_streaminfo(block):
+    packed = int.from_bytes(block[10:18], 'big')
+    sample_rate = packed >> 44
+    total_samples = packed & 0xFFFFFFFFF
+    return sample_rate, (total_samples / sample_rate if sample_rate and total_samples else None)
+
+
+def _flac(f, size, start):
+    f.seek(start + 4)
+    sample_rate = duration = None
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            raise UnsupportedAudio("FLAC metadata is truncated")
+        last, block_type = header[0] & 0x80, header[0] & 0x7f
+        length = int.from_bytes(header[1:], 'big')
+        if block_type == 0:
+            sample_rate, duration = _flac_streaminfo(f.read(length))
+        else:
+            f.seek(length, 1)
+        if last:
+            break
+    if sample_rate is None:
+        raise UnsupportedAudio("FLAC file has no STREAMINFO block")
+    return AudioInfo('flac', duration, _kbps((size - f.tell()) * 8, duration), sample_rate)
+
+
+def _mp3_header(data, offset):
+    """
+        Decode the 4 byte frame header at offset.
+        :return: (version, layer, kbps, sample rate, frame length, samples per frame, mono) or None
+    """
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = {0: 2.5, 2: 2, 3: 1}.get((b1 >> 3) & 3)
+    layer = {1: 3, 2: 2, 3: 1}.get((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    kbps = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index]
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (b2 >> 1) & 1
+    if layer == 1:
+        samples = 384
+        length = (12 * kbps * 1000 // sample_rate + padding) * 4
+    else:
+        samples = 1152 if layer == 2 or version == 1 else 576
+        length = samples // 8 * kbps * 1000 // sample_rate + padding
+    return version, layer, kbps, sample_rate, length, samples, (b3 >> 6) == 3
+
+
+def _mp3_frame_count(data, offset, version, mono):
+    """
+        Xing/Info or VBRI header in the first frame, written by encoders for VBR files.
+        :return: (frame count, encoder delay + padding in samples) or None
+    """
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info') and len(data) >= xing + 12:
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if not flags & 1:
+            return None
+        frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+        # Optional byte count, TOC and quality fields, then the LAME tag
+        lame = xing + 12 + (4 if flags & 2 else 0) + (100 if flags & 4 else 0) + (4 if flags & 8 else 0)
+        gap = 0
+        if data[lame:lame + 4] in (b'LAME', b'Lavf', b'Lavc') and len(data) >= lame + 24:
+            packed = int.from_bytes(data[lame + 21:lame + 24], 'big')
+            gap = (packed >> 12) + (packed & 0xFFF)
+        return frames, gap
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI' and len(data) >= vbri + 18:
+        return struct.unpack('>I', data[vbri + 14:vbri + 18])[0], 0
+    return None
+
+
+def _mp3(f, size, start):
+    f.seek(start)
+    data = f.read(SCAN_BYTES)
+    for offset in range(len(data) - 3):
+        header = _mp3_header(data, offset)
+        if header is None:
+            continue
+        version, layer, kbps, sample_rate, length, samples, mono = header
+        # A second frame right after the first rules out a stray 0xFF byte
+        if offset + length + 4 <= len(data) and _mp3_header(data, offset + length) is None:
+            continue
+        break
+    else:
+        raise UnsupportedAudio("No MPEG audio frame found")
+    audio_start = start + offset
+    f.seek(max(size - 128, 0))
+    audio_bytes = size - audio_start - (128 if f.read(3) == b'TAG' else 0)
+    vbr = _mp3_frame_count(data, offset, version, mono)
+    if vbr and vbr[0]:
+        frames, gap = vbr
+        duration = max(frames * samples - gap, 0) / sample_rate
+        return AudioInfo(f'mp{layer}', duration, _kbps(audio_bytes * 8, duration), sample_rate)
+    return AudioInfo(f'mp{layer}', audio_bytes * 8 / (kbps * 1000), kbps, sample_rate)
+
+
+def _ogg_page(data, offset):
+    # (granule position, serial number, first packet bytes) of the page at offset
+    if data[offset:offset + 4] != b'OggS' or offset + 27 > len(data):
+        return None
+    granule, serial = struct.unpack('<qI', data[offset + 6:offset + 18])
+    segments = data[offset + 26]
+    body = offset + 27 + segments
+    return granule, serial, data[body:body + sum(data[offset + 27:body])]
+
+
+def _ogg(f, size):
+    f.seek(0)
+    first = _ogg_page(f.read(SCAN_BYTES), 0)
+    if first is None:
+        raise UnsupportedAudio("Ogg page header is truncated")
+    _, serial, packet = first
+    if packet.startswith(b'\x01vorbis') and len(packet) >= 24:
+        codec, pre_skip = 'vorbis', 0
+        sample_rate = struct.unpack('<I', packet[12:16])[0]
+        granule_rate = sample_rate
+    elif packet.startswith(b'OpusHead') and len(packet) >= 16:
+        # Opus granules always count 48 kHz samples; the header keeps the source rate
+        codec, granule_rate = 'opus', 48000
+        pre_skip, sample_rate = struct.unpack('<HI', packet[10:16])
+    elif packet.startswith(b'\x7fFLAC') and len(packet) >= 51:
+        codec, pre_skip = 'flac', 0
+        sample_rate = granule_rate = _flac_streaminfo(packet[17:51])[0]
+    else:
+        raise UnsupportedAudio("Unsupported Ogg codec")
+
+    # Duration is the granule position of the stream's last page
+    f.seek(max(size - OGG_TAIL_BYTES, 0))
+    tail = f.read(OGG_TAIL_BYTES)
+    duration = None
+    offset = tail.rfind(b'OggS')
+    while offset >= 0:
+        page = _ogg_page(tail, offset)
+        if page is not None and page[1] == serial and page[0] > 0:
+            duration = max(page[0] - pre_skip, 0) / granule_rate if granule_rate else None
+            break
+        offset = tail.rfind(b'OggS', 0, offset)
+    return AudioInfo(codec, duration, _kbps(size * 8, duration), sample_rate)
+
+
+def probe(path):
+    """
+        Read duration (seconds), bitrate (kbps), sample rate and codec from a
+        WAV, FLAC, MP3 or Ogg (Vorbis, Opus, FLAC) file, detected by its magic
+        bytes. Only headers are read: the start of the file, plus the last
+        page for Ogg.
+        :return: AudioInfo
+        :raise UnsupportedAudio: unknown format or damaged header
+        :raise OSError: the file can't be read
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        head = f.read(12)
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            return _wav(f, size)
+        if head[:4] == b'OggS':
+            return _ogg(f, size)
+        start = _id3v2_size(head)
+        f.seek(start)
+        if f.read(4) == b'fLaC':
+            return _flac(f, size, start)
+        try:
+            return _mp3(f, size, start)
+        except struct.error:
+            raise UnsupportedAudio("MPEG audio header is truncated")
+
+
+def content_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    """
+        SHA-256 of the file's bytes, read in chunks so memory stays flat.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,337 @@
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+from flask import request, current_app
+import pickle
+import time
+
+
+class MemoryBackend:
+    """
+        In-process LRU with per-entry TTL, bounded by entry count and total bytes.
+
+        Version counters live in their own bounded LRU. When one is evicted its
+        value becomes the floor for every unknown counter, so a counter never
+        reads lower than a value it had before.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, max_counters=100000):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_counters = max_counters
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._counters = OrderedDict()
+        self._counter_floor = 0
+        self._lock = Lock()
+
+    def _size(self, value):
+        if isinstance(value, (bytes, str)):
+            return len(value)
+        if isinstance(value, tuple):
+            return sum(self._size(item) for item in value)
+        return 64
+
+    def _remove(self, key):
+        expires, value = self._entries.pop(key)
+        self._bytes -= self._size(value)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires, value)
+            self._bytes += self._size(value)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def counter(self, key):
+        with self._lock:
+            return self._counters.get(key, self._counter_floor)
+
+    def counters(self, keys):
+        with self._lock:
+            return [self._counters.get(key, self._counter_floor) for key in keys]
+
+    def incr(self, key):
+        with self._lock:
+            value = self._counters.pop(key, self._counter_floor) + 1
+            self._counters[key] = value
+            while len(self._counters) > self.max_counters:
+                evicted_key, evicted = self._counters.popitem(last=False)
+                self._counter_floor = max(self._counter_floor, evicted)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes,
+                    "evictions": self.evictions, "expirations": self.expirations}
+
+
+class LocalSharedClient:
+    """
+        Stand-in for a Redis client (get/set/delete/incr on bytes) so the shared
+        backend can run in tests and development without a server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def mget(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ex if ex else None)
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (b'0', None))[0]) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SharedBackend:
+    """
+        Cache backend on a Redis-compatible client, shared by every worker.
+        Values are pickled; keys are namespaced with prefix.
+    """
+
+    def __init__(self, client, prefix='musica:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def get_many(self, keys):
+        # One MGET round trip instead of one GET per key
+        values = self.client.mget([self.prefix + key for key in keys]) if keys else []
+        return [pickle.loads(value) if value is not None else None for value in values]
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def counter(self, key):
+        return int(self.client.get(self.prefix + key) or 0)
+
+    def counters(self, keys):
+        values = self.client.mget([self.prefix + key for key in keys]) if keys else []
+        return [int(value or 0) for value in values]
+
+    def incr(self, key):
+        return self.client.incr(self.prefix + key)
+
+    def clear(self):
+        self.client.flushdb()
+
+    def stats(self):
+        return {}
+
+
+def create_backend(config):
+    """
+        Build the backend named by CACHE_BACKEND: 'memory' (default), 'local-shared',
+        'redis' (needs the redis package and CACHE_REDIS_URL) or 'none'.
+    """
+    name = config.get('CACHE_BACKEND') or 'memory'
+    if name == 'none':
+        return None
+    if name == 'memory':
+        return MemoryBackend(max_entries=int(config.get('CACHE_MAX_ENTRIES') or 10000),
+                             max_bytes=int(config.get('CACHE_MAX_BYTES') or 64 * 1024 * 1024))
+    if name == 'local-shared':
+        return SharedBackend(LocalSharedClient())
+    if name == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+        return SharedBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']))
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+
+class ResponseCache:
+    """
+        Read-through cache for GET responses.
+
+        Keys embed a version per table (bumped on every committed write to it)
+        and, for item routes, a version per entity, so invalidation is a counter
+        increment and stale entries simply age out of the backend.
+    """
+
+    def __init__(self, backend=None, ttl=60, max_item_bytes=1024 * 1024):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_item_bytes = max_item_bytes
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._lock = Lock()
+
+    def init_app(self, app, tracker):
+        self.backend = create_backend(app.config)
+        self.ttl = int(app.config.get('CACHE_TTL') or 60)
+        tracker.add_listener(self.invalidate)
+        app.extensions['response_cache'] = self
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def version(self, table, entity_id=None):
+        key = f"v:{table}" if entity_id is None else f"v:{table}:{entity_id}"
+        return self.backend.counter(key)
+
+    def invalidate(self, changes):
+        """
+            Bump versions for committed writes.
+            :param changes: {table name: set of ids}, as reported by lib.changes
+        """
+        if self.backend is None:
+            return
+        for table, ids in changes.items():
+            self.backend.incr(f"v:{table}")
+            if None in ids:
+                # Rows changed by a Core statement: ids unknown, so every item of the table goes stale
+                self.backend.incr(f"v:{table}:*")
+            for entity_id in ids:
+                if entity_id is not None:
+                    self.backend.incr(f"v:{table}:{entity_id}")
+
+    def key(self, table, entity_id=None, related=()):
+        args = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+        # Tables joined into the response (e.g. by ?expand=) version the key by table
+        extra = ''.join(f"+{name}@{self.version(name)}" for name in related)
+        if entity_id is None:
+            return f"r:{request.endpoint}:{table}@{self.version(table)}{extra}?{args}"
+        version = f"{self.version(table, entity_id)}.{self.version(table, '*')}"
+        return f"r:{request.endpoint}:{table}:{entity_id}@{version}{extra}?{args}"
+
+    def item_keys(self, endpoint, table, ids, related=(), args=()):
+        """
+            The keys item route `endpoint` would use for each id when called
+            with the query args given, so a multi-get shares its entries.
+            Entity versions are read with one backend call.
+        """
+        args = '&'.join(f"{k}={v}" for k, v in sorted(args))
+        extra = ''.join(f"+{name}@{self.version(name)}" for name in related)
+        all_items = self.version(table, '*')
+        versions = self.backend.counters([f"v:{table}:{entity_id}" for entity_id in ids])
+        return [f"r:{endpoint}:{table}:{entity_id}@{version}.{all_items}{extra}?{args}"
+                for entity_id, version in zip(ids, versions)]
+
+    def get(self, key):
+        value = self.backend.get(key)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def get_many(self, keys):
+        values = self.backend.get_many(keys)
+        found = sum(value is not None for value in values)
+        with self._lock:
+            self.hits += found
+            self.misses += len(values) - found
+        return values
+
+    def set(self, key, response):
+        if response.status_code != 200 or response.is_streamed:
+            return
+        self.set_body(key, response.get_data(), response.mimetype)
+
+    def set_body(self, key, body, mimetype):
+        if len(body) > self.max_item_bytes:
+            self._count('skipped')
+            return
+        self.backend.set(key, (body, mimetype), self.ttl)
+
+    def stats(self):
+        stats = {"hits": self.hits, "misses": self.misses, "skipped": self.skipped}
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+    def clear(self):
+        if self.backend is not None:
+            self.backend.clear()
+
+
+def cached(table, id_arg=None, related=None):
+    """
+        Cache a GET route's 200 responses.
+        :param table: Table the response is built from; writes to it invalidate the entry
+        :param id_arg: Name of the view argument holding the entity id, for item routes
+        :param related: Function returning the other tables this request reads, if any
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or cache.backend is None:
+                return func(*args, **kwargs)
+            key = cache.key(table, kwargs.get(id_arg) if id_arg else None, related() if related else ())
+            hit = cache.get(key)
+            if hit is not None:
+                body, mimetype = hit
+                return current_app.response_class(body, mimetype=mimetype)
+            response = current_app.make_response(func(*args, **kwargs))
+            cache.set(key, response)
+            return response
+        return decorated
+    return decorator
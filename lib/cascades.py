@@ -0,0 +1,88 @@
+from sqlalchemy import select, delete, update
+
+# Deletes a row and everything hanging off it with one set-based statement per
+# child table, children before parents so foreign keys hold throughout:
+#
+#   users -> playlists -> playlist_songs
+#         -> play_events
+#   artists -> albums -> songs -> playlist_songs, play_events, similar_songs
+#           -> genres (songs of other artists in them lose their genre)
+#
+# Child rows are selected by nested subqueries (songs of albums of the artist),
+# never loaded into Python, so cost grows with rows deleted, not ORM objects.
+# The counter triggers of lib/aggregates.py still fire per deleted row and keep
+# the surviving playlists' counters right. Chart rollups and similar_songs rows
+# pointing at a deleted song are left alone: both routes join songs, and the
+# next rollup rebuild or full similarity build drops them.
+
+KINDS = ('users', 'playlists', 'artists', 'albums', 'genres', 'songs')
+
+
+def _delete(session, table, condition, counts):
+    counts[table.name] = counts.get(table.name, 0) + session.execute(delete(table).where(condition)).rowcount
+
+
+def delete_songs(session, tables, ids, counts):
+    t = tables
+    _delete(session, t['playlist_songs'], t['playlist_songs'].c.song_id.in_(ids), counts)
+    _delete(session, t['play_events'], t['play_events'].c.song_id.in_(ids), counts)
+    _delete(session, t['similar_songs'], t['similar_songs'].c.song_id.in_(ids), counts)
+    _delete(session, t['songs'], t['songs'].c.id.in_(ids), counts)
+
+
+def delete_albums(session, tables, ids, counts):
+    songs = tables['songs']
+    delete_songs(session, tables, select(songs.c.id).where(songs.c.album_id.in_(ids)), counts)
+    _delete(session, tables['albums'], tables['albums'].c.id.in_(ids), counts)
+
+
+def delete_genres(session, tables, ids, counts):
+    songs = tables['songs']
+    session.execute(update(songs).where(songs.c.genre_id.in_(ids)).values(genre_id=None))
+    _delete(session, tables['genres'], tables['genres'].c.id.in_(ids), counts)
+
+
+def delete_artists(session, tables, ids, counts):
+    albums, genres = tables['albums'], tables['genres']
+    delete_albums(session, tables, select(albums.c.id).where(albums.c.artist_id.in_(ids)), counts)
+    delete_genres(session, tables, select(genres.c.id).where(genres.c.artist_id.in_(ids)), counts)
+    _delete(session, tables['artists'], tables['artists'].c.id.in_(ids), counts)
+
+
+def delete_playlists(session, tables, ids, counts):
+    _delete(session, tables['playlist_songs'], tables['playlist_songs'].c.playlist_id.in_(ids), counts)
+    _delete(session, tables['playlists'], tables['playlists'].c.id.in_(ids), counts)
+
+
+def delete_users(session, tables, ids, counts):
+    playlists = tables['playlists']
+    delete_playlists(session, tables, select(playlists.c.id).where(playlists.c.user_id.in_(ids)), counts)
+    _delete(session, tables['play_events'], tables['play_events'].c.user_id.in_(ids), counts)
+    _delete(session, tables['users'], tables['users'].c.id.in_(ids), counts)
+
+
+_DELETERS = {
+    'users': delete_users,
+    'playlists': delete_playlists,
+    'artists': delete_artists,
+    'albums': delete_albums,
+    'genres': delete_genres,
+    'songs': delete_songs,
+}
+
+
+def cascade_delete(session, tables, kind, entity_id):
+    """
+        Delete one row of `kind` and its children in the session's transaction;
+        the caller commits. The row is locked first (FOR UPDATE on PostgreSQL)
+        so children can't be added to it halfway through.
+        :param tables: Table objects by name, e.g. db.metadata.tables
+        :return: {table name: rows deleted}, or None if the row doesn't exist
+    """
+    table = tables[kind]
+    found = session.execute(select(table.c.id).where(table.c.id == entity_id).with_for_update()).scalar()
+    if found is None:
+        return None
+    counts = {}
+    _DELETERS[kind](session, tables, [entity_id], counts)
+    return counts
@@ -0,0 +1,85 @@
+from sqlalchemy import event
+
+# Tracks which tables and rows a session writes to, and reports them once the
+# transaction commits. ORM flushes give (table, id) pairs; Core INSERT/UPDATE/
+# DELETE statements run through session.execute() give the table only.
+_PENDING_KEY = 'pending_changes'
+
+
+def _pending(session):
+    return session.info.setdefault(_PENDING_KEY, {})
+
+
+def pending_changes(session):
+    """Tables and ids written so far in the session's current transaction."""
+    return session.info.get(_PENDING_KEY, {})
+
+
+# table -> tables the database itself rewrites when it changes (e.g. by triggers)
+_dependents = {}
+
+
+def _record(session, table_name, entity_id=None):
+    pending = _pending(session)
+    pending.setdefault(table_name, set()).add(entity_id)
+    for dependent in _dependents.get(table_name, ()):
+        pending.setdefault(dependent, set()).add(None)
+
+
+class ChangeTracker:
+    """
+        Calls every registered listener with {table name: set of ids} after a
+        commit. A None in the id set means "some rows, ids unknown".
+    """
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def add_dependents(self, table_name, dependents):
+        """
+            Report a write to table_name as a write to some rows of each dependent
+            table too, for tables updated behind the session's back by triggers.
+        """
+        _dependents.setdefault(table_name, set()).update(dependents)
+
+    def report(self, changes):
+        """
+            Call the listeners for writes committed outside a session, e.g. bulk
+            rewrites run on db.engine.
+            :param changes: {table name: set of ids}
+        """
+        for listener in self.listeners:
+            listener(changes)
+
+    def init_session(self, session_class):
+        event.listen(session_class, 'after_flush', self._after_flush)
+        event.listen(session_class, 'do_orm_execute', self._do_orm_execute)
+        event.listen(session_class, 'after_commit', self._after_commit)
+        event.listen(session_class, 'after_rollback', self._after_rollback)
+
+    def _after_flush(self, session, flush_context):
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            table = getattr(obj, '__tablename__', None)
+            if table is not None and (obj not in session.dirty or session.is_modified(obj)):
+                _record(session, table, getattr(obj, 'id', None))
+
+    def _do_orm_execute(self, state):
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement, 'table', None)
+            if table is not None:
+                _record(state.session, table.name)
+
+    def _after_commit(self, session):
+        changes = session.info.pop(_PENDING_KEY, None)
+        if changes:
+            for listener in self.listeners:
+                listener(changes)
+
+    def _after_rollback(self, session):
+        session.info.pop(_PENDING_KEY, None)
+
+
+changes = ChangeTracker()
@@ -0,0 +1,309 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy import text, bindparam, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
+from models import SongHourlyStat, SongDailyStat
+from threading import Lock, Thread
+import os
+import re
+import time
+
+# Per-song counts in hourly and daily buckets. Plays are added by the play
+# buffer in the transaction that writes them; playlist adds by a trigger on
+# playlist_songs, so every write path counts. Charts read only these tables.
+ROLLUPS = {
+    # granularity: (table, bucket length)
+    'hour': (SongHourlyStat.__table__, timedelta(hours=1)),
+    'day': (SongDailyStat.__table__, timedelta(days=1)),
+}
+ROLLUP_TABLES = tuple(table.name for table, _ in ROLLUPS.values())
+METRICS = ('plays', 'ms_played', 'playlist_adds')
+KINDS = ('songs', 'artists')
+
+# Windows up to this many hours are summed from hourly buckets, longer ones from daily
+MAX_HOURLY_WINDOW = 72
+MAX_WINDOW_DAYS = 365
+WINDOW_ALIASES = {'hour': '1h', 'day': '24h', 'week': '7d', 'month': '30d'}
+# Rows kept per snapshot; ?limit= slices it
+MAX_CHART_SIZE = 100
+# Snapshots nobody asked for within this long stop being refreshed
+SNAPSHOT_IDLE_SECONDS = 3600
+MAX_SNAPSHOTS = 64
+
+
+def _truncate(moment, granularity):
+    if granularity == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _bucket_sql(dialect, granularity, column):
+    if dialect == 'postgresql':
+        return f"date_trunc('{granularity}', {column})"
+    # Same text as SQLAlchemy stores for a DateTime on SQLite, so buckets compare and conflict
+    pattern = '%Y-%m-%d %H:00:00.000000' if granularity == 'hour' else '%Y-%m-%d 00:00:00.000000'
+    return f"strftime('{pattern}', {column})"
+
+
+def _upsert(connection, table, rows, counters):
+    insert = (postgresql.insert if connection.dialect.name == 'postgresql' else sqlite.insert)(table)
+    statement = insert.on_conflict_do_update(
+        index_elements=['bucket', 'song_id'],
+        set_={name: table.c[name] + insert.excluded[name] for name in counters})
+    connection.execute(statement, rows)
+
+
+def rollup_plays(connection, events):
+    """
+        Add a batch of play events to the hourly and daily rollups: counted per
+        (bucket, song) in Python, then one upsert per table.
+        :param events: dicts with song_id, played_at and ms_played
+    """
+    for granularity, (table, _) in ROLLUPS.items():
+        totals = {}
+        for event in events:
+            key = (_truncate(event['played_at'], granularity), event['song_id'])
+            plays, ms_played = totals.get(key, (0, 0))
+            totals[key] = (plays + 1, ms_played + event['ms_played'])
+        rows = [{'bucket': bucket, 'song_id': song_id, 'plays': plays, 'ms_played': ms_played,
+                 'playlist_adds': 0} for (bucket, song_id), (plays, ms_played) in sorted(totals.items())]
+        if rows:
+            _upsert(connection, table, rows, ('plays', 'ms_played'))
+
+
+def _trigger_upsert(dialect, granularity):
+    table = ROLLUPS[granularity][0].name
+    now = "timezone('utc', now())" if dialect == 'postgresql' else "'now'"
+    bucket = _bucket_sql(dialect, granularity, f"coalesce(new.added_at, {now})")
+    return (f"INSERT INTO {table} (bucket, song_id, plays, ms_played, playlist_adds) "
+            f"VALUES ({bucket}, new.song_id, 0, 0, 1) ON CONFLICT (bucket, song_id) "
+            f"DO UPDATE SET playlist_adds = {table}.playlist_adds + 1;")
+
+
+def create_rollup_triggers(connection):
+    """
+        Create the trigger counting playlist adds into the rollups. Idempotent.
+        :param connection: SQLAlchemy connection to SQLite or PostgreSQL
+    """
+    dialect = connection.dialect.name
+    body = ' '.join(_trigger_upsert(dialect, granularity) for granularity in ROLLUPS)
+    if dialect == 'sqlite':
+        statements = [f"CREATE TRIGGER IF NOT EXISTS playlist_songs_rollups_ai AFTER INSERT ON playlist_songs "
+                      f"BEGIN {body} END"]
+    elif dialect == 'postgresql':
+        statements = [
+            f"CREATE OR REPLACE FUNCTION playlist_songs_rollups() RETURNS trigger AS $$ BEGIN "
+            f"{body} RETURN NULL; END $$ LANGUAGE plpgsql",
+            "DROP TRIGGER IF EXISTS playlist_songs_rollups ON playlist_songs",
+            "CREATE TRIGGER playlist_songs_rollups AFTER INSERT ON playlist_songs "
+            "FOR EACH ROW EXECUTE FUNCTION playlist_songs_rollups()",
+        ]
+    else:
+        raise RuntimeError(f"Rollup triggers are not implemented for {dialect}")
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def drop_rollup_triggers(connection):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql("DROP TRIGGER IF EXISTS playlist_songs_rollups ON playlist_songs")
+        connection.exec_driver_sql("DROP FUNCTION IF EXISTS playlist_songs_rollups()")
+    else:
+        connection.exec_driver_sql("DROP TRIGGER IF EXISTS playlist_songs_rollups_ai")
+
+
+def rebuild_rollups(connection):
+    """
+        Recompute both rollups from play_events and playlist_songs, e.g. after
+        the tables were added to an existing database.
+        :return: {table: rows written}
+    """
+    dialect = connection.dialect.name
+    counts = {}
+    for granularity, (table, _) in ROLLUPS.items():
+        table = table.name
+        plays_bucket = _bucket_sql(dialect, granularity, 'played_at')
+        adds_bucket = _bucket_sql(dialect, granularity, 'added_at')
+        connection.execute(text(f"DELETE FROM {table}"))
+        counts[table] = connection.execute(text(
+            f"INSERT INTO {table} (bucket, song_id, plays, ms_played, playlist_adds) "
+            f"SELECT bucket, song_id, sum(plays), sum(ms_played), sum(playlist_adds) FROM ("
+            f"SELECT {plays_bucket} AS bucket, song_id, count(*) AS plays, sum(ms_played) AS ms_played, "
+            f"0 AS playlist_adds FROM play_events GROUP BY 1, 2 "
+            f"UNION ALL "
+            f"SELECT {adds_bucket}, song_id, 0, 0, count(*) FROM playlist_songs "
+            f"WHERE added_at IS NOT NULL GROUP BY 1, 2"
+            f") AS combined GROUP BY bucket, song_id")).rowcount
+    return counts
+
+
+def parse_window(value):
+    """
+        Parse a chart window: whole hours or days ('6h', '24h', '7d') or an
+        alias (hour, day, week, month).
+        :return: (normalized name, granularity, bucket count)
+        :raise ValueError: for anything else
+    """
+    value = WINDOW_ALIASES.get(value, value)
+    found = re.fullmatch(r'(\d+)([hd])', value or '')
+    if not found or int(found.group(1)) < 1:
+        raise ValueError(f"window must look like 6h, 24h, 7d or be one of {', '.join(WINDOW_ALIASES)}")
+    count, unit = int(found.group(1)), found.group(2)
+    hours = count if unit == 'h' else count * 24
+    if hours > MAX_WINDOW_DAYS * 24:
+        raise ValueError(f"window must be at most {MAX_WINDOW_DAYS}d")
+    if hours <= MAX_HOURLY_WINDOW:
+        return f"{hours}h", 'hour', hours
+    return f"{-(-hours // 24)}d", 'day', -(-hours // 24)
+
+
+CHART_QUERIES = {
+    'songs': (
+        "SELECT s.song_id, songs.title, songs.album_id, s.plays, s.ms_played, s.playlist_adds FROM ("
+        "SELECT song_id, sum(plays) AS plays, sum(ms_played) AS ms_played, sum(playlist_adds) AS playlist_adds "
+        "FROM {table} WHERE bucket >= :since AND bucket < :until GROUP BY song_id) AS s "
+        "JOIN songs ON songs.id = s.song_id "
+        "WHERE s.{metric} > 0 ORDER BY s.{metric} DESC, s.song_id LIMIT :limit"),
+    'artists': (
+        "SELECT albums.artist_id, artists.name, sum(s.plays) AS plays, sum(s.ms_played) AS ms_played, "
+        "sum(s.playlist_adds) AS playlist_adds FROM ("
+        "SELECT song_id, sum(plays) AS plays, sum(ms_played) AS ms_played, sum(playlist_adds) AS playlist_adds "
+        "FROM {table} WHERE bucket >= :since AND bucket < :until GROUP BY song_id) AS s "
+        "JOIN songs ON songs.id = s.song_id JOIN albums ON albums.id = songs.album_id "
+        "JOIN artists ON artists.id = albums.artist_id "
+        "GROUP BY albums.artist_id, artists.name "
+        "HAVING sum(s.{metric}) > 0 ORDER BY sum(s.{metric}) DESC, albums.artist_id LIMIT :limit"),
+}
+CHART_COLUMNS = {
+    'songs': ('song_id', 'title', 'album_id', 'plays', 'ms_played', 'playlist_adds'),
+    'artists': ('artist_id', 'name', 'plays', 'ms_played', 'playlist_adds'),
+}
+
+
+def compute_chart(connection, kind, granularity, buckets, metric, now=None, limit=MAX_CHART_SIZE):
+    """
+        Top songs or artists by metric over the last `buckets` hours or days,
+        the current, partial one included; buckets after it (future-dated
+        plays) are not.
+        :return: (window start, list of row dicts with a 1-based rank)
+    """
+    table, length = ROLLUPS[granularity]
+    current = _truncate(now or datetime.utcnow(), granularity)
+    since = current - length * (buckets - 1)
+    query = text(CHART_QUERIES[kind].format(table=table.name, metric=metric))
+    query = query.bindparams(bindparam('since', type_=DateTime), bindparam('until', type_=DateTime))
+    rows = connection.execute(query, {'since': since, 'until': current + length, 'limit': limit})
+    columns = CHART_COLUMNS[kind]
+    return since, [{'rank': rank, **dict(zip(columns, row))} for rank, row in enumerate(rows, 1)]
+
+
+class Snapshot:
+
+    def __init__(self, since, items, generated_at):
+        self.since = since
+        self.items = items
+        self.generated_at = generated_at
+        self.used = time.monotonic()
+
+    @property
+    def etag(self):
+        return f"chart-{self.generated_at.timestamp():.6f}"
+
+
+class ChartSnapshots:
+    """
+        Precomputed top-K charts. The first request for a (kind, window, metric)
+        computes it; from then on a background thread recomputes every snapshot
+        in use each refresh_seconds, and requests only read the latest one.
+
+        Snapshots live in this process; each worker refreshes its own, which
+        costs one GROUP BY over the rollups per snapshot per interval.
+    """
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self._snapshots = OrderedDict()
+        self._lock = Lock()
+        self._compute_lock = Lock()
+        self._thread = None
+        self._pid = None
+        self._engine = None
+        self._logger = None
+
+    def init_app(self, app, db):
+        self.refresh_seconds = float(app.config.get('CHARTS_REFRESH_SECONDS') or self.refresh_seconds)
+        self._logger = app.logger
+        with app.app_context():
+            self._engine = db.engine
+        app.extensions['charts'] = self
+
+    def _ensure_thread(self):
+        # Started lazily, and again in each forked worker, since threads don't survive fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='chart-snapshots', daemon=True)
+            self._thread.start()
+
+    def _compute(self, key):
+        kind, granularity, buckets, metric = key
+        with self._engine.connect() as connection:
+            since, items = compute_chart(connection, kind, granularity, buckets, metric)
+        return Snapshot(since, items, datetime.utcnow())
+
+    def get(self, kind, granularity, buckets, metric):
+        """
+            The current snapshot, computed on the spot only the first time it is asked for.
+        """
+        key = (kind, granularity, buckets, metric)
+        with self._lock:
+            self._ensure_thread()
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                snapshot.used = time.monotonic()
+                self._snapshots.move_to_end(key)
+                return snapshot
+        # One computation at a time, so a burst of first requests doesn't run it N times
+        with self._compute_lock:
+            with self._lock:
+                snapshot = self._snapshots.get(key)
+            if snapshot is None:
+                snapshot = self._compute(key)
+                self._store(key, snapshot)
+        return snapshot
+
+    def _store(self, key, snapshot):
+        with self._lock:
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > MAX_SNAPSHOTS:
+                self._snapshots.popitem(last=False)
+
+    def refresh(self):
+        """
+            Recompute every snapshot used within SNAPSHOT_IDLE_SECONDS; drop the rest.
+        """
+        cutoff = time.monotonic() - SNAPSHOT_IDLE_SECONDS
+        with self._lock:
+            for key in [key for key, snapshot in self._snapshots.items() if snapshot.used < cutoff]:
+                del self._snapshots[key]
+            keys = list(self._snapshots)
+        for key in keys:
+            with self._compute_lock:
+                snapshot = self._compute(key)
+            with self._lock:
+                if key in self._snapshots:
+                    snapshot.used = self._snapshots[key].used
+                    self._snapshots[key] = snapshot
+        self.refreshes += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the previous snapshots
+                self.failed_refreshes += 1
+                self._logger.exception("Refreshing chart snapshots failed")
@@ -0,0 +1,115 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+import os
+import sqlite3
+
+DEFAULT_DATABASE_URI = 'sqlite:///MUSICA_DB.db'
+
+# PRAGMAs applied to every new SQLite connection. WAL lets readers run while a
+# writer commits; synchronous=NORMAL is durable in WAL mode except on power loss.
+SQLITE_DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64 * 1024,  # negative: KiB, i.e. 64 MiB per connection
+}
+
+POSTGRES_DEFAULTS = {
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_TIMEOUT': 30,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_STATEMENT_TIMEOUT_MS': 30000,
+}
+
+
+def load_database_config(app):
+    """
+        Read the database URI and tuning knobs from the environment into app.config.
+    """
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI') or DEFAULT_DATABASE_URI
+    for name, default in {**SQLITE_DEFAULTS, **POSTGRES_DEFAULTS}.items():
+        app.config[name] = os.getenv(name, default)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+    configure_sqlite(app.config)
+
+
+def engine_options(uri, config):
+    """
+        Engine keyword arguments for the given database URI.
+        PostgreSQL gets a sized, pre-pinged pool and a server-side statement timeout.
+    """
+    backend = make_url(uri).get_backend_name()
+    if backend == 'postgresql':
+        return {
+            'pool_size': int(config['DB_POOL_SIZE']),
+            'max_overflow': int(config['DB_MAX_OVERFLOW']),
+            'pool_timeout': int(config['DB_POOL_TIMEOUT']),
+            'pool_recycle': int(config['DB_POOL_RECYCLE']),
+            'pool_pre_ping': True,
+            'connect_args': {'options': f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}"},
+        }
+    if backend == 'sqlite':
+        # busy_timeout is also set by PRAGMA below; this covers the connect itself
+        return {'connect_args': {'timeout': int(config['SQLITE_BUSY_TIMEOUT_MS']) / 1000}}
+    return {}
+
+
+def async_engine_url(url):
+    """
+        Async driver URL for a sync engine URL: aiosqlite for SQLite, asyncpg for PostgreSQL.
+    """
+    drivers = {'sqlite': 'sqlite+aiosqlite', 'postgresql': 'postgresql+asyncpg'}
+    backend = url.get_backend_name()
+    if backend not in drivers:
+        raise ValueError(f"No async driver configured for {backend}")
+    return url.set(drivername=drivers[backend])
+
+
+def async_engine_options(url, config):
+    """
+        Same pool tuning as engine_options; asyncpg takes the statement timeout
+        as a server setting instead of a libpq option.
+    """
+    options = engine_options(url.render_as_string(hide_password=False), config)
+    if url.get_backend_name() == 'postgresql':
+        timeout = int(config['DB_STATEMENT_TIMEOUT_MS'])
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(timeout)}}
+    elif url.get_backend_name() == 'sqlite':
+        options.pop('connect_args', None)
+    return options
+
+
+def sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+    ]
+
+
+_pragmas = []
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    for pragma in _pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        apply_sqlite_pragmas(dbapi_connection)
+
+
+def configure_sqlite(config):
+    """
+        Apply the SQLite PRAGMAs on every new DBAPI connection of any engine.
+    """
+    _pragmas[:] = sqlite_pragmas(config)
+    if not event.contains(Engine, 'connect', _set_sqlite_pragmas):
+        event.listen(Engine, 'connect', _set_sqlite_pragmas)
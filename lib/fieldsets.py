@@ -0,0 +1,155 @@
+from flask import request, abort
+from sqlalchemy.orm import joinedload, selectinload, load_only, raiseload
+from models import User, Artist, Album, Genre, Song, Playlist, PlaylistSong
+
+MAX_EXPAND_DEPTH = 4
+
+
+class Resource:
+    """
+        What a route may return for one model.
+        :param fields: Columns clients may ask for with ?fields=
+        :param default_fields: Columns returned when ?fields= names none for this resource
+        :param relations: {relationship attribute name: resource name} clients may ?expand=
+    """
+
+    def __init__(self, model, fields, default_fields=None, relations=None):
+        self.model = model
+        self.fields = fields
+        self.default_fields = default_fields or fields
+        self.relations = relations or {}
+
+
+RESOURCES = {
+    'users': Resource(User, ('id', 'username', 'email'), relations={'playlists': 'playlists'}),
+    'artists': Resource(Artist, ('id', 'name', 'bio', 'album_count', 'song_count'),
+                        relations={'albums': 'albums', 'genres': 'genres'}),
+    'albums': Resource(Album, ('id', 'title', 'artist_id', 'song_count', 'total_duration'),
+                       relations={'artist': 'artists', 'songs': 'songs'}),
+    'genres': Resource(Genre, ('id', 'title', 'artist_id'), relations={'artist': 'artists', 'songs': 'songs'}),
+    'songs': Resource(Song, ('id', 'title', 'duration', 'file_path', 'album_id', 'genre_id',
+                             'bitrate', 'sample_rate', 'codec', 'content_hash'),
+                      default_fields=('id', 'title', 'duration', 'file_path'),
+                      relations={'album': 'albums', 'genre': 'genres'}),
+    'playlists': Resource(Playlist, ('id', 'title', 'user_id', 'song_count', 'total_duration'),
+                          relations={'user': 'users', 'songs': 'playlist_songs'}),
+    'playlist_songs': Resource(PlaylistSong, ('id', 'playlist_id', 'song_id', 'position', 'added_at'),
+                               default_fields=('id', 'playlist_id', 'song_id', 'position'),
+                               relations={'song': 'songs', 'playlist': 'playlists'}),
+}
+
+
+class Selection:
+    """
+        Parsed ?fields= / ?expand= for one resource and, recursively, its expanded relations.
+    """
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.fields = []
+        self.children = {}
+
+    def child(self, name):
+        if name not in self.resource.relations:
+            abort(400, description=f"Cannot expand '{name}' on {self.resource.model.__tablename__}")
+        if name not in self.children:
+            self.children[name] = Selection(RESOURCES[self.resource.relations[name]])
+        return self.children[name]
+
+    def add_field(self, name):
+        if name not in self.resource.fields:
+            abort(400, description=f"Unknown field '{name}' on {self.resource.model.__tablename__}")
+        if name not in self.fields:
+            self.fields.append(name)
+
+    def finish(self):
+        if not self.fields:
+            self.fields = list(self.resource.default_fields)
+        for child in self.children.values():
+            child.finish()
+
+    def tables(self):
+        names = {self.resource.model.__tablename__}
+        for child in self.children.values():
+            names |= child.tables()
+        return names
+
+    def options(self):
+        """
+            Loader options selecting exactly these columns: many-to-one relations
+            are joined into the same SELECT, collections come from one
+            SELECT ... IN per level. Anything else raises instead of lazy loading.
+        """
+        model = self.resource.model
+        options = [load_only(*[getattr(model, name) for name in self.fields])]
+        for name, child in self.children.items():
+            attribute = getattr(model, name)
+            loader = selectinload(attribute) if attribute.property.uselist else joinedload(attribute)
+            options.append(loader.options(*child.options()))
+        options.append(raiseload('*'))
+        return options
+
+    def apply(self, query):
+        return query.options(*self.options())
+
+    def serialize(self, obj):
+        data = {name: getattr(obj, name) for name in self.fields}
+        for name, child in self.children.items():
+            value = getattr(obj, name)
+            if isinstance(value, list):
+                data[name] = [child.serialize(item) for item in value]
+            else:
+                data[name] = child.serialize(value) if value is not None else None
+        return data
+
+
+def _names(arg):
+    return [name.strip() for name in (arg or '').split(',') if name.strip()]
+
+
+def parse_selection(resource_name, fields=None, expand=None):
+    """
+        Build the Selection for ?fields=id,title,album.title&expand=album.artist.
+        Dotted names address expanded relations; naming a relation's field expands it.
+    """
+    root = Selection(RESOURCES[resource_name])
+    for path in _names(expand):
+        parts = path.split('.')
+        if len(parts) > MAX_EXPAND_DEPTH:
+            abort(400, description=f"'{path}' expands more than {MAX_EXPAND_DEPTH} levels")
+        node = root
+        for part in parts:
+            node = node.child(part)
+    for path in _names(fields):
+        *relations, field = path.split('.')
+        if len(relations) > MAX_EXPAND_DEPTH:
+            abort(400, description=f"'{path}' expands more than {MAX_EXPAND_DEPTH} levels")
+        node = root
+        for part in relations:
+            node = node.child(part)
+        node.add_field(field)
+    root.finish()
+    return root
+
+
+def requested_selection(resource_name):
+    """
+        The Selection asked for by the current request, or None when it uses
+        neither ?fields= nor ?expand= (the route's usual output).
+    """
+    if 'fields' not in request.args and 'expand' not in request.args:
+        return None
+    return parse_selection(resource_name, request.args.get('fields'), request.args.get('expand'))
+
+
+def expanded_tables(resource_name):
+    """
+        For conditional()/cached(): a function naming the other tables the
+        current request's ?expand= reads, so writes to them invalidate too.
+    """
+    def tables():
+        selection = requested_selection(resource_name)
+        if selection is None:
+            return []
+        return sorted(selection.tables() - {RESOURCES[resource_name].model.__tablename__})
+    return tables
@@ -0,0 +1,96 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from threading import BoundedSemaphore, Lock
+import multiprocessing
+import os
+import bcrypt
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing queue is full or a job timed out; the route should answer 503."""
+
+
+def _hash_password(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check_password(hashed, password):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def cost_of(hashed):
+    """
+        Work factor of a bcrypt hash ("$2b$12$..." -> 12), or None if it is not one.
+    """
+    parts = (hashed or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """
+        Runs bcrypt in a process pool so it scales across cores and never holds
+        a request thread's CPU. At most max_pending jobs may be queued or running;
+        beyond that calls fail fast with HasherBusy instead of piling up.
+    """
+
+    def __init__(self, rounds=12, workers=None, max_pending=None, timeout=10):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        self.rejected = 0
+        self._slots = BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.rounds = int(app.config.get('BCRYPT_LOG_ROUNDS') or self.rounds)
+        self.workers = int(app.config.get('PASSWORD_HASH_WORKERS') or self.workers)
+        self.max_pending = int(app.config.get('PASSWORD_HASH_QUEUE') or self.workers * 4)
+        self._slots = BoundedSemaphore(self.max_pending)
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # The server runs threads (play buffer, chart refresher...); forking it could
+                # copy a lock some other thread holds, so workers come from a clean process
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+            return self._pool
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            future = self._executor().submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Still queued: drop it. Already running: its slot frees when it finishes.
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+
+    def hash(self, password):
+        return self._run(_hash_password, password, self.rounds)
+
+    def check(self, hashed, password):
+        return self._run(_check_password, hashed, password)
+
+    def needs_rehash(self, hashed):
+        return cost_of(hashed) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,179 @@
+from sqlalchemy import insert, select
+import codecs
+import json
+import re
+
+from lib.streaming import is_relative_media_path
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_BATCH_SIZE = 10000
+MAX_REPORTED_ERRORS = 1000
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def iter_ndjson(stream):
+    """
+        Yield one parsed value per non-empty line of a binary stream.
+        Lines that are not valid JSON are yielded as ValueError instances so the
+        caller can report them against the right row.
+    """
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+        Incrementally parse a top-level JSON array from a binary stream,
+        yielding elements as soon as they are complete. Bytes are decoded
+        incrementally, so a UTF-8 character split across two reads is kept
+        whole. Elements are decoded in place from a moving offset and consumed
+        text is dropped once per read, so the cost stays linear in the body.
+        Unlike NDJSON there is no safe point to resume after a malformed
+        element, so one fails the whole array with ValueError; rows yielded
+        before it have already been handed to the caller.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    index = 0
+    started = False
+    eof = False
+    while True:
+        if not eof:
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[index:] + utf8.decode(chunk, final=eof)
+            index = 0
+        while True:
+            index = WHITESPACE.match(buffer, index).end()
+            if index == len(buffer):
+                break
+            if not started:
+                if buffer[index] != '[':
+                    raise ValueError("Expected a JSON array")
+                index += 1
+                started = True
+                continue
+            if buffer[index] == ',':
+                index += 1
+                continue
+            if buffer[index] == ']':
+                return
+            try:
+                value, end = decoder.raw_decode(buffer, index)
+            except ValueError:
+                if eof:
+                    raise ValueError("Truncated or invalid JSON array")
+                break
+            if end == len(buffer) and not eof:
+                # A number or literal may continue in the next read
+                break
+            yield value
+            index = end
+        if eof:
+            raise ValueError("Truncated or invalid JSON array")
+
+
+def validate_song(data):
+    """
+        Check one incoming song row and build the column values to insert.
+        :return: (values, None) or (None, error message)
+    """
+    if isinstance(data, ValueError):
+        return None, str(data)
+    if not isinstance(data, dict):
+        return None, "Row must be a JSON object"
+    for field in ('title', 'file_path', 'album_id'):
+        if data.get(field) in (None, ''):
+            return None, f"Missing '{field}'"
+    for field in ('album_id', 'genre_id', 'duration'):
+        value = data.get(field)
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            return None, f"'{field}' must be an integer"
+    if not is_relative_media_path(str(data['file_path'])):
+        return None, "'file_path' must be a relative path inside MEDIA_ROOT"
+    return {
+        'title': str(data['title']),
+        'duration': data.get('duration'),
+        'file_path': str(data['file_path']),
+        'album_id': data['album_id'],
+        'genre_id': data.get('genre_id'),
+    }, None
+
+
+class SongIngest:
+    """
+        Insert songs in batches: one set-based reference check per table and
+        one executemany INSERT per batch, committed batch by batch.
+    """
+
+    def __init__(self, session, song_table, album_table, genre_table, batch_size=DEFAULT_BATCH_SIZE):
+        self.session = session
+        self.song_table = song_table
+        self.album_table = album_table
+        self.genre_table = genre_table
+        self.batch_size = batch_size
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+        self._known_albums = set()
+        self._known_genres = set()
+
+    def _error(self, index, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": index, "error": message})
+
+    def _existing_ids(self, table, ids, known):
+        missing = ids - known
+        if missing:
+            found = self.session.execute(select(table.c.id).where(table.c.id.in_(missing))).scalars()
+            known.update(found)
+        return known
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        albums = self._existing_ids(self.album_table, {values['album_id'] for _, values in batch},
+                                    self._known_albums)
+        genres = self._existing_ids(self.genre_table,
+                                    {values['genre_id'] for _, values in batch if values['genre_id'] is not None},
+                                    self._known_genres)
+        rows = []
+        for index, values in batch:
+            if values['album_id'] not in albums:
+                self._error(index, f"Album not found with id: {values['album_id']}")
+            elif values['genre_id'] is not None and values['genre_id'] not in genres:
+                self._error(index, f"Genre not found with id: {values['genre_id']}")
+            else:
+                rows.append(values)
+        if rows:
+            self.session.execute(insert(self.song_table), rows)
+            self.session.commit()
+            self.inserted += len(rows)
+
+    def run(self, items):
+        """
+            Consume an iterable of parsed rows.
+            :return: report dict with inserted, failed and per-row errors
+        """
+        batch = []
+        for index, data in enumerate(items):
+            values, error = validate_song(data)
+            if error:
+                self._error(index, error)
+                continue
+            batch.append((index, values))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+        self.errors.sort(key=lambda error: error["row"])
+        return {"inserted": self.inserted, "failed": self.error_count, "errors": self.errors}
@@ -0,0 +1,299 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert, delete, func, and_
+from threading import Event
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import time
+import uuid
+
+QUEUED, RUNNING, DONE, DEAD = 'queued', 'running', 'done', 'dead'
+STATUSES = (QUEUED, RUNNING, DONE, DEAD)
+
+# Lower runs first; jobs of equal priority run in run_at order
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 100
+PRIORITY_LOW = 200
+
+DEFAULT_MAX_ATTEMPTS = 5
+# Seconds a claimed job stays invisible to other workers before it's handed out again
+DEFAULT_TIMEOUT = 300
+# Queued jobs looked at per claim; the first one still unclaimed wins
+CLAIM_CANDIDATES = 10
+MAX_ERROR_LENGTH = 2000
+
+Task = namedtuple('Task', ['func', 'priority', 'max_attempts', 'timeout'])
+
+
+class UnknownTask(ValueError):
+    """Raised when enqueuing a task name that was never registered."""
+
+
+def retry_delay(attempts, base, cap):
+    """
+        Exponential back-off with jitter before retry number `attempts`:
+        base, 2 x base, 4 x base ... up to cap seconds, each scaled by 0.5-1.0
+        so jobs failing together don't retry together.
+    """
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class JobQueue:
+    """
+        Durable job queue kept in a database table, for work that shouldn't run
+        inside a request: emails, cascades, index and counter rebuilds.
+
+        Tasks are plain functions registered with @jobs.task(). enqueue() adds a
+        row through the request's session, so a job commits (or rolls back) with
+        the writes that asked for it. Workers (`flask run-jobs`) claim the
+        lowest-priority-number job whose run_at has passed with a conditional
+        UPDATE, so two workers never claim the same job; on PostgreSQL the
+        candidates are also read FOR UPDATE SKIP LOCKED.
+
+        A claimed job is leased for its timeout. A failure is retried with
+        exponential back-off until max_attempts, then the job is moved to the
+        dead state with its last error. A lease that runs out (the worker died
+        or the job hung) hands the job to another worker, which counts as an
+        attempt. Delivery is therefore at least once: tasks must be safe to run
+        twice.
+    """
+
+    def __init__(self, poll_seconds=1.0, backoff_seconds=10, max_backoff_seconds=3600, keep_seconds=86400):
+        self.poll_seconds = poll_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.keep_seconds = keep_seconds
+        self.tasks = {}
+        self._stop = Event()
+        self._app = None
+        self._db = None
+        self._table = None
+
+    def init_app(self, app, db, table):
+        self.poll_seconds = float(app.config.get('JOBS_POLL_SECONDS') or self.poll_seconds)
+        self.backoff_seconds = float(app.config.get('JOBS_BACKOFF_SECONDS') or self.backoff_seconds)
+        self.max_backoff_seconds = float(app.config.get('JOBS_MAX_BACKOFF_SECONDS') or self.max_backoff_seconds)
+        self.keep_seconds = float(app.config.get('JOBS_KEEP_SECONDS') or self.keep_seconds)
+        self._app = app
+        self._db = db
+        self._table = table
+        app.extensions['jobs'] = self
+
+    def task(self, name=None, priority=PRIORITY_NORMAL, max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT):
+        """
+            Decorator registering a function as a task; enqueue() payloads are
+            passed to it as keyword arguments. The function is returned as is.
+            :param name: Task name (default: the function's name)
+            :param timeout: Seconds the job may run before another worker may take it over
+        """
+        def decorator(func):
+            self.tasks[name or func.__name__] = Task(func, priority, max_attempts, timeout)
+            return func
+        return decorator
+
+    def enqueue(self, name, payload=None, priority=None, delay=0, session=None):
+        """
+            Add a job to the caller's session; it becomes visible to workers when
+            that session commits.
+            :param payload: JSON-serializable dict of keyword arguments for the task
+            :param priority: Overrides the task's priority (lower runs first)
+            :param delay: Seconds before the job may run
+            :return: job id
+            :raise UnknownTask: name isn't a registered task
+        """
+        task = self.tasks.get(name)
+        if task is None:
+            raise UnknownTask(f"Unknown task '{name}'")
+        now = datetime.utcnow()
+        result = (session or self._db.session).execute(insert(self._table).values(
+            task=name, payload=json.dumps(payload or {}), status=QUEUED,
+            priority=task.priority if priority is None else priority, attempts=0,
+            max_attempts=task.max_attempts, timeout=task.timeout,
+            run_at=now + timedelta(seconds=delay), created_at=now))
+        return result.inserted_primary_key[0]
+
+    def _expire_leases(self, connection, now):
+        # Jobs whose worker went quiet past the lease: retry, or give up if out of attempts
+        t = self._table
+        expired = and_(t.c.status == RUNNING, t.c.locked_until < now)
+        dead = connection.execute(update(t).where(expired, t.c.attempts >= t.c.max_attempts).values(
+            status=DEAD, finished_at=now, lease=None, locked_until=None,
+            last_error="Lease expired before the job finished")).rowcount
+        retried = connection.execute(update(t).where(expired).values(
+            status=QUEUED, run_at=now, lease=None, locked_until=None,
+            last_error="Lease expired before the job finished")).rowcount
+        return dead + retried
+
+    def _purge(self, connection, now):
+        t = self._table
+        cutoff = now - timedelta(seconds=self.keep_seconds)
+        return connection.execute(delete(t).where(t.c.status == DONE, t.c.finished_at < cutoff)).rowcount
+
+    def claim(self, worker):
+        """
+            Lease the next runnable job to worker. If other workers took every
+            candidate first, select again (in a new transaction, so their claims
+            are visible) until one is won or none are left.
+            :return: the claimed row (attempts already counting this run), or None
+        """
+        t = self._table
+        while True:
+            with self._db.engine.begin() as connection:
+                now = datetime.utcnow()
+                candidates = connection.execute(
+                    select(t.c.id, t.c.timeout).where(t.c.status == QUEUED, t.c.run_at <= now)
+                    .order_by(t.c.priority, t.c.run_at, t.c.id).limit(CLAIM_CANDIDATES)
+                    .with_for_update(skip_locked=True)).all()
+                if not candidates:
+                    return None
+                for job_id, timeout in candidates:
+                    lease = uuid.uuid4().hex
+                    claimed = connection.execute(
+                        update(t).where(t.c.id == job_id, t.c.status == QUEUED)
+                        .values(status=RUNNING, lease=lease, locked_by=worker, attempts=t.c.attempts + 1,
+                                locked_until=now + timedelta(seconds=timeout))).rowcount
+                    if claimed:
+                        return connection.execute(select(t).where(t.c.id == job_id)).one()
+
+    def _finish(self, job, **values):
+        # Only the lease holder may settle a job; a late finish after takeover is dropped
+        t = self._table
+        with self._db.engine.begin() as connection:
+            settled = connection.execute(update(t).where(t.c.id == job.id, t.c.lease == job.lease).values(
+                lease=None, locked_until=None, **values)).rowcount
+        if not settled:
+            self._app.logger.warning(f"Job {job.id} ({job.task}) finished after its lease expired")
+        return settled
+
+    def run_job(self, job):
+        """
+            Run a claimed job in an app context and record the outcome.
+            :return: the job's new status
+        """
+        task = self.tasks.get(job.task)
+        if task is None:
+            self._finish(job, status=DEAD, finished_at=datetime.utcnow(), last_error=f"Unknown task '{job.task}'")
+            return DEAD
+        try:
+            with self._app.app_context():
+                try:
+                    task.func(**json.loads(job.payload))
+                finally:
+                    self._db.session.remove()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"[:MAX_ERROR_LENGTH]
+            if job.attempts >= job.max_attempts:
+                self._app.logger.exception(f"Job {job.id} ({job.task}) failed for good")
+                self._finish(job, status=DEAD, finished_at=datetime.utcnow(), last_error=error)
+                return DEAD
+            delay = retry_delay(job.attempts, self.backoff_seconds, self.max_backoff_seconds)
+            self._app.logger.warning(f"Job {job.id} ({job.task}) failed, retrying in {delay:.0f}s: {error}")
+            self._finish(job, status=QUEUED, run_at=datetime.utcnow() + timedelta(seconds=delay), last_error=error)
+            return QUEUED
+        self._finish(job, status=DONE, finished_at=datetime.utcnow(), last_error=None)
+        return DONE
+
+    def work(self, burst=False, max_jobs=None):
+        """
+            Claim and run jobs one at a time until stop() is called. Between jobs
+            the worker also hands out expired leases again and deletes done jobs
+            older than keep_seconds, at most once per poll interval.
+            :param burst: Return once no job is runnable instead of polling
+            :param max_jobs: Return after this many jobs
+            :return: {status: number of jobs} for the jobs this worker ran
+        """
+        worker = f"{socket.gethostname()}:{os.getpid()}"
+        report = {DONE: 0, QUEUED: 0, DEAD: 0}
+        last_sweep = 0.0
+        self._stop.clear()
+        while not self._stop.is_set():
+            if time.monotonic() - last_sweep >= self.poll_seconds:
+                with self._db.engine.begin() as connection:
+                    now = datetime.utcnow()
+                    self._expire_leases(connection, now)
+                    self._purge(connection, now)
+                last_sweep = time.monotonic()
+            job = self.claim(worker)
+            if job is None:
+                if burst:
+                    break
+                self._stop.wait(self.poll_seconds)
+                continue
+            report[self.run_job(job)] += 1
+            if max_jobs and sum(report.values()) >= max_jobs:
+                break
+        return report
+
+    def stop(self):
+        """Ask work() to return after the job it is running."""
+        self._stop.set()
+
+    def _work_until_signalled(self, burst, progress):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: self.stop())
+        report = self.work(burst=burst)
+        if progress:
+            progress(report)
+
+    def run_workers(self, processes=1, burst=False, progress=None):
+        """
+            Run work() here, or in `processes` forked worker processes that each
+            open their own database connections. SIGINT and SIGTERM let every
+            worker finish the job it is running, then exit. Run inside an app context.
+            :param progress: Optional callback(report), called by each worker as it exits
+        """
+        if processes <= 1:
+            self._work_until_signalled(burst, progress)
+            return
+        # Pooled connections must not be shared across fork
+        self._db.engine.dispose()
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=self._work_until_signalled, args=(burst, progress),
+                                   name=f'jobs-{number}') for number in range(processes)]
+        for worker in workers:
+            worker.start()
+
+        def forward(signum, frame):
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, forward)
+        for worker in workers:
+            worker.join()
+
+    def requeue_dead(self, task=None):
+        """
+            Give dead jobs (of one task, or all) a fresh set of attempts, due now.
+            :return: number of jobs requeued
+        """
+        t = self._table
+        query = update(t).where(t.c.status == DEAD)
+        if task:
+            query = query.where(t.c.task == task)
+        with self._db.engine.begin() as connection:
+            return connection.execute(query.values(
+                status=QUEUED, attempts=0, run_at=datetime.utcnow(), finished_at=None)).rowcount
+
+    def stats(self):
+        """
+            Jobs per status and task, and the age of the oldest runnable job.
+        """
+        t = self._table
+        with self._db.engine.connect() as connection:
+            rows = connection.execute(
+                select(t.c.status, t.c.task, func.count()).group_by(t.c.status, t.c.task)).all()
+            oldest = connection.execute(select(func.min(t.c.run_at)).where(
+                t.c.status == QUEUED, t.c.run_at <= datetime.utcnow())).scalar()
+        counts = {status: 0 for status in STATUSES}
+        tasks = {}
+        for status, task, count in rows:
+            counts[status] += count
+            tasks.setdefault(task, {})[status] = count
+        lag = (datetime.utcnow() - oldest).total_seconds() if oldest else 0.0
+        return {**counts, "tasks": tasks, "oldest_ready_seconds": round(lag, 3)}
@@ -0,0 +1,170 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, update, bindparam
+from threading import BoundedSemaphore, Lock
+import os
+import time
+
+from lib.audio import probe, content_hash, UnsupportedAudio
+from lib.streaming import resolve_media_path
+
+BACKFILL_BATCH_SIZE = 500
+MAX_ERROR_LENGTH = 200
+
+
+def extract_song_metadata(file_path, media_root):
+    """
+        Probe and hash one song's file.
+        :return: column values for the songs row; metadata_error is set instead
+                 of the audio columns when the file is missing or unreadable
+    """
+    checked = {'metadata_checked_at': datetime.utcnow()}
+    if not media_root:
+        return {**checked, 'metadata_error': "MEDIA_ROOT is not set"}
+    path = resolve_media_path(file_path, media_root)
+    if path is None:
+        return {**checked, 'metadata_error': "Invalid file path"}
+    try:
+        info = probe(path)
+        digest = content_hash(path)
+    except FileNotFoundError:
+        return {**checked, 'metadata_error': "File not found"}
+    except (UnsupportedAudio, OSError) as e:
+        return {**checked, 'metadata_error': str(e)[:MAX_ERROR_LENGTH] or type(e).__name__}
+    values = {**checked, 'metadata_error': None, 'bitrate': info.bitrate, 'sample_rate': info.sample_rate,
+              'codec': info.codec, 'content_hash': digest}
+    if info.duration is not None:
+        values['duration'] = round(info.duration)
+    return values
+
+
+def _write(session, table, results):
+    # One executemany UPDATE per distinct set of columns (success, failure, no duration)
+    groups = {}
+    for song_id, values in results:
+        groups.setdefault(tuple(sorted(values)), []).append({'song_id': song_id, **values})
+    for columns, rows in groups.items():
+        statement = (update(table).where(table.c.id == bindparam('song_id'))
+                     .values({column: bindparam(column) for column in columns}))
+        session.execute(statement, rows)
+
+
+class MetadataExtractor:
+    """
+        Reads duration, bitrate, sample rate and codec from song files, plus a
+        SHA-256 of their content, and writes them to the songs row.
+
+        New and re-pointed songs are submitted to a thread pool off the request
+        path. At most max_pending jobs may be queued or running; beyond that
+        songs are skipped and left unchecked (metadata_checked_at NULL) for the
+        next backfill rather than slowing requests down.
+    """
+
+    def __init__(self, workers=None, max_pending=None):
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.workers * 16
+        self.submitted = 0
+        self.skipped = 0
+        self.failed = 0
+        self._slots = BoundedSemaphore(self.max_pending)
+        self._pool = None
+        self._lock = Lock()
+        self._app = None
+        self._db = None
+        self._table = None
+
+    def init_app(self, app, db, table):
+        self.workers = int(app.config.get('METADATA_WORKERS') or self.workers)
+        self.max_pending = int(app.config.get('METADATA_QUEUE') or self.workers * 16)
+        self._slots = BoundedSemaphore(self.max_pending)
+        self._app = app
+        self._db = db
+        self._table = table
+        app.extensions['metadata'] = self
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='metadata')
+            return self._pool
+
+    def submit(self, song_id):
+        """
+            Queue a song for extraction without waiting for it.
+            :return: False if the queue was full and the song was skipped
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return False
+        try:
+            future = self._executor().submit(self._extract, song_id)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.submitted += 1
+        future.add_done_callback(lambda f: self._slots.release())
+        return True
+
+    def _extract(self, song_id):
+        t = self._table
+        try:
+            with self._app.app_context():
+                session = self._db.session
+                file_path = session.execute(select(t.c.file_path).where(t.c.id == song_id)).scalar()
+                if file_path is None:
+                    return
+                values = extract_song_metadata(file_path, self._app.config['MEDIA_ROOT'])
+                _write(session, t, [(song_id, values)])
+                session.commit()
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            self._app.logger.exception(f"Extracting metadata of song {song_id} failed")
+
+    def backfill(self, workers=None, recheck=False, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+        """
+            Extract metadata for every song not checked yet (or every song, with
+            recheck), batch by batch in id order: each batch's files are read in
+            parallel, then written with one executemany UPDATE and committed.
+            Run inside an app context.
+            :param progress: Optional callback(report) after each batch
+            :return: report dict: checked, failed, seconds
+        """
+        t = self._table
+        session = self._db.session
+        media_root = self._app.config['MEDIA_ROOT']
+        report = {"checked": 0, "failed": 0, "seconds": 0.0}
+        started = time.perf_counter()
+        last_id = 0
+        with ThreadPoolExecutor(max_workers=workers or self.workers) as pool:
+            while True:
+                query = select(t.c.id, t.c.file_path).where(t.c.id > last_id)
+                if not recheck:
+                    query = query.where(t.c.metadata_checked_at.is_(None))
+                rows = session.execute(query.order_by(t.c.id).limit(batch_size)).all()
+                if not rows:
+                    break
+                values = pool.map(lambda row: extract_song_metadata(row.file_path, media_root), rows)
+                results = [(row.id, result) for row, result in zip(rows, values)]
+                _write(session, t, results)
+                session.commit()
+                last_id = rows[-1].id
+                report["checked"] += len(results)
+                report["failed"] += sum(1 for _, result in results if result['metadata_error'])
+                report["seconds"] = round(time.perf_counter() - started, 3)
+                if progress:
+                    progress(report)
+        return report
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.workers, "max_pending": self.max_pending, "submitted": self.submitted,
+                    "skipped": self.skipped, "failed": self.failed}
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from flask import request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from threading import Lock
+import time
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements kept per request for the slow-request log; the rest are only counted
+MAX_RECORDED_STATEMENTS = 50
+SLOW_LOG_STATEMENTS = 5
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info['query_start'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    start = conn.info.pop('query_start', None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = g.get('sql_stats')
+    if stats is None:
+        stats = g.sql_stats = [0, 0.0, []]
+    stats[0] += 1
+    stats[1] += elapsed
+    if len(stats[2]) < MAX_RECORDED_STATEMENTS:
+        stats[2].append((elapsed, statement))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Metrics:
+    """
+        Per-endpoint request latency histograms, status counts, in-flight
+        requests and SQL statement count/time, in Prometheus text format.
+
+        Counters live in this process; with several workers each one reports its
+        own. Requests slower than SLOW_REQUEST_SECONDS are logged with their
+        slowest SQL statements.
+    """
+
+    def __init__(self):
+        self.slow_seconds = 1.0
+        self._lock = Lock()
+        self._latency = {}    # (endpoint, method) -> [bucket counts..., +Inf count, sum]
+        self._statuses = {}   # (endpoint, method, status) -> count
+        self._sql = {}        # endpoint -> [statements, seconds]
+        self._in_flight = 0
+        self._logger = None
+
+    def init_app(self, app):
+        self.slow_seconds = float(app.config.get('SLOW_REQUEST_SECONDS') or self.slow_seconds)
+        self._logger = app.logger
+        app.before_request(self._start)
+        app.after_request(self._record)
+        app.teardown_request(self._finish)
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        app.extensions['metrics'] = self
+
+    def _start(self):
+        g.request_start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+
+    def _finish(self, exc):
+        if 'request_start' in g:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _record(self, response):
+        if 'request_start' not in g:
+            return response
+        # Streamed bodies are still being sent; this is the time to first byte
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'unmatched'
+        method = request.method
+        statements, sql_seconds, recorded = g.get('sql_stats') or (0, 0.0, [])
+        bucket = bisect_left(LATENCY_BUCKETS, elapsed)
+        with self._lock:
+            histogram = self._latency.get((endpoint, method))
+            if histogram is None:
+                histogram = self._latency[(endpoint, method)] = [0] * (len(LATENCY_BUCKETS) + 2)
+            histogram[bucket] += 1
+            histogram[-1] += elapsed
+            key = (endpoint, method, response.status_code)
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+            sql = self._sql.get(endpoint)
+            if sql is None:
+                sql = self._sql[endpoint] = [0, 0.0]
+            sql[0] += statements
+            sql[1] += sql_seconds
+        if elapsed >= self.slow_seconds:
+            self._log_slow(elapsed, response.status_code, statements, sql_seconds, recorded)
+        return response
+
+    def _log_slow(self, elapsed, status, statements, sql_seconds, recorded):
+        slowest = sorted(recorded, key=lambda item: item[0], reverse=True)[:SLOW_LOG_STATEMENTS]
+        lines = [f"Slow request: {request.method} {request.full_path.rstrip('?')} -> {status} "
+                 f"in {elapsed * 1000:.1f}ms, {statements} SQL statements in {sql_seconds * 1000:.1f}ms"]
+        lines += [f"  {seconds * 1000:.1f}ms  {' '.join(statement.split())}" for seconds, statement in slowest]
+        self._logger.warning('\n'.join(lines))
+
+    def render(self):
+        """
+            All metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            latency = {key: list(value) for key, value in self._latency.items()}
+            statuses = dict(self._statuses)
+            sql = {key: list(value) for key, value in self._sql.items()}
+            in_flight = self._in_flight
+
+        lines = ['# HELP musica_http_request_duration_seconds Request latency by endpoint.',
+                 '# TYPE musica_http_request_duration_seconds histogram']
+        for (endpoint, method), histogram in sorted(latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+                cumulative += count
+                labels = _labels(endpoint=endpoint, method=method, le=bound)
+                lines.append(f'musica_http_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(endpoint=endpoint, method=method)
+            lines.append(f'musica_http_request_duration_seconds_sum{labels} {histogram[-1]:.6f}')
+            lines.append(f'musica_http_request_duration_seconds_count{labels} {cumulative}')
+
+        lines += ['# HELP musica_http_requests_total Responses by endpoint and status code.',
+                  '# TYPE musica_http_requests_total counter']
+        for (endpoint, method, status), count in sorted(statuses.items()):
+            lines.append(f'musica_http_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+        lines += ['# HELP musica_http_requests_in_flight Requests being handled right now.',
+                  '# TYPE musica_http_requests_in_flight gauge',
+                  f'musica_http_requests_in_flight {in_flight}']
+
+        lines += ['# HELP musica_db_statements_total SQL statements executed by endpoint.',
+                  '# TYPE musica_db_statements_total counter']
+        lines += [f'musica_db_statements_total{_labels(endpoint=endpoint)} {count}'
+                  for endpoint, (count, _) in sorted(sql.items())]
+        lines += ['# HELP musica_db_seconds_total Time spent in SQL statements by endpoint.',
+                  '# TYPE musica_db_seconds_total counter']
+        lines += [f'musica_db_seconds_total{_labels(endpoint=endpoint)} {seconds:.6f}'
+                  for endpoint, (_, seconds) in sorted(sql.items())]
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,60 @@
+from flask import request, abort, current_app, jsonify
+import json
+
+MAX_IDS = 100
+
+
+def parse_ids(value, limit=MAX_IDS):
+    """
+        '3,1,2' -> [3, 1, 2]. Aborts with 400 if the list is empty, isn't
+        comma-separated integers or is longer than limit.
+    """
+    try:
+        ids = [int(part) for part in (value or '').split(',') if part.strip()]
+    except ValueError:
+        abort(400, description="'ids' must be comma-separated integers")
+    if not ids:
+        abort(400, description="Please provide 'ids'")
+    if len(ids) > limit:
+        abort(400, description=f"At most {limit} ids per request")
+    return ids
+
+
+def multi_get_response(table, item_endpoint, load, serialize, related=()):
+    """
+        Build the response of a multi-get route (?ids=3,1,2) from the same JSON
+        the item route returns for each id.
+
+        Items are looked up in the response cache first, under the keys
+        item_endpoint uses for the same ?fields= / ?expand=, so both routes
+        share entries. The rest are loaded with one IN query and cached.
+        :param load: Function returning the rows for a list of ids
+        :param serialize: Function turning one row into the item route's dict
+        :param related: Other tables the items read (see expanded_tables)
+        :return: {"items": [item or null, in request order], "missing": [ids not found]}
+    """
+    ids = parse_ids(request.args.get('ids'))
+    unique = list(dict.fromkeys(ids))
+    args = [(k, v) for k, v in request.args.items(multi=True) if k != 'ids']
+    cache = current_app.extensions.get('response_cache')
+    keys = {}
+    bodies = {}
+    if cache is not None and cache.backend is not None:
+        keys = dict(zip(unique, cache.item_keys(item_endpoint, table, unique, related, args)))
+        for entity_id, hit in zip(unique, cache.get_many(list(keys.values()))):
+            if hit is not None:
+                bodies[entity_id] = hit[0]
+
+    wanted = [entity_id for entity_id in unique if entity_id not in bodies]
+    if wanted:
+        for row in load(wanted):
+            body = jsonify(serialize(row)).get_data()
+            bodies[row.id] = body
+            if keys:
+                cache.set_body(keys[row.id], body, 'application/json')
+
+    # Cached bodies are whole JSON documents: splice them in rather than decode and re-encode
+    items = b','.join(bodies[entity_id].strip() if entity_id in bodies else b'null' for entity_id in ids)
+    missing = json.dumps([entity_id for entity_id in unique if entity_id not in bodies]).encode()
+    return current_app.response_class(b'{"items":[' + items + b'],"missing":' + missing + b'}\n',
+                                      mimetype='application/json')
@@ -0,0 +1,88 @@
+from flask import request, jsonify, Response, stream_with_context, abort
+from lib.serialization import Projection
+import json
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+
+def keyset_page(query, id_column, serialize, limit, after=None):
+    """
+        Fetch one page of rows ordered by id, starting after the given cursor.
+        Only limit + 1 rows are loaded; the extra row tells us whether a next page exists.
+        :param query: Base query
+        :param id_column: Column used as the keyset (must be unique and indexed)
+        :param serialize: Function turning one row into a dict
+        :param limit: Page size
+        :param after: Last id of the previous page, or None for the first page
+        :return: dict with items and next_cursor
+    """
+    if after is not None:
+        query = query.filter(id_column > after)
+    rows = query.order_by(id_column).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1].id
+    return {"items": [serialize(row) for row in rows], "next_cursor": next_cursor}
+
+
+def stream_json_array(query, id_column, serialize, batch_size=STREAM_BATCH_SIZE, dumps=json.dumps):
+    """
+        Write a JSON array chunk by chunk from a yield_per cursor.
+        Memory stays bounded by batch_size whatever the table size.
+        :param dumps: Function encoding one serialized row
+        :return: generator of str chunks
+    """
+    yield "["
+    first = True
+    for row in query.order_by(id_column).yield_per(batch_size):
+        if first:
+            first = False
+            yield dumps(serialize(row))
+        else:
+            yield "," + dumps(serialize(row))
+    yield "]"
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        abort(400, description=f"'{name}' must be an integer")
+
+
+def list_response(query, id_column, serialize, json_provider=None):
+    """
+        Build the response for a list route from the request query string.
+        ?limit=N&after=ID -> {"items": [...], "next_cursor": ID or null}
+        ?stream=1         -> the full JSON array, streamed in yield_per batches
+        no parameters     -> the full JSON array (legacy behaviour)
+        :param serialize: Function turning one ORM object into a dict, or a
+                          Projection to load only those columns as tuples
+        :param json_provider: JSON provider for this route (default: the app's, as jsonify)
+    """
+    if isinstance(serialize, Projection):
+        query = serialize.apply(query)
+    respond = json_provider.response if json_provider is not None else jsonify
+
+    if request.args.get('stream') in ('1', 'true', 'True'):
+        dumps = json_provider.dumps if json_provider is not None else json.dumps
+        generator = stream_json_array(query, id_column, serialize, dumps=dumps)
+        return Response(stream_with_context(generator), mimetype='application/json')
+
+    limit = _int_arg('limit')
+    after = _int_arg('after')
+    if limit is None and after is None:
+        return respond([serialize(row) for row in query.all()])
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit < 1:
+        abort(400, description="'limit' must be positive")
+    limit = min(limit, MAX_PAGE_SIZE)
+    return respond(keyset_page(query, id_column, serialize, limit, after))
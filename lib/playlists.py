@@ -0,0 +1,151 @@
+from sqlalchemy import select, insert, update, delete, func, bindparam
+from datetime import datetime
+
+# Entries are spaced POSITION_GAP apart so inserting or moving a song only
+# writes that one row. The playlist is renumbered when two neighbours run
+# out of room between them.
+POSITION_GAP = 1024
+
+
+class PlaylistChangeError(ValueError):
+    pass
+
+
+def next_position(session, table, playlist_id):
+    last = session.execute(
+        select(func.max(table.c.position)).where(table.c.playlist_id == playlist_id)
+    ).scalar()
+    return (last or 0) + POSITION_GAP
+
+
+def _position_between(entries, index):
+    """Midpoint between entries[index - 1] and entries[index], or None if they touch."""
+    before = entries[index - 1][1] if index > 0 else 0
+    if index < len(entries):
+        after = entries[index][1]
+        if after - before < 2:
+            return None
+        return (before + after) // 2
+    return before + POSITION_GAP
+
+
+def _insert_at(entries, dirty, index, entry_id):
+    """Place entry_id at index, renumbering the whole list if there is no gap left."""
+    position = _position_between(entries, index)
+    entries.insert(index, [entry_id, position])
+    if position is None:
+        for i, entry in enumerate(entries):
+            entry[1] = (i + 1) * POSITION_GAP
+            dirty.add(entry[0])
+    else:
+        dirty.add(entry_id)
+
+
+def _index_after(entries, after_id):
+    if after_id is None:
+        return 0
+    for i, entry in enumerate(entries):
+        if entry[0] == after_id:
+            return i + 1
+    raise PlaylistChangeError(f"Playlist entry not found with id: {after_id}")
+
+
+def _is_id(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_playlist_changes(data):
+    """
+        Check a batch request body and normalize it for apply_playlist_changes.
+        Bare song ids in 'add' become {"song_id": id}.
+        :return: (add, remove, move)
+        :raises PlaylistChangeError: the body isn't an object of lists of ids / {id, after} objects
+    """
+    if not isinstance(data, dict):
+        raise PlaylistChangeError("Body must be a JSON object")
+    for name in ('add', 'remove', 'move'):
+        if not isinstance(data.get(name, []), list):
+            raise PlaylistChangeError(f"'{name}' must be a list")
+    add = [item if isinstance(item, dict) else {"song_id": item} for item in data.get('add', [])]
+    remove = data.get('remove', [])
+    move = data.get('move', [])
+    if not all(_is_id(entry_id) for entry_id in remove):
+        raise PlaylistChangeError("'remove' must be a list of entry ids")
+    for name, items, key in (('add', add, 'song_id'), ('move', move, 'id')):
+        for item in items:
+            if not isinstance(item, dict) or not _is_id(item.get(key)):
+                raise PlaylistChangeError(f"Each {name} needs an integer {key}")
+            if item.get('after') is not None and not _is_id(item['after']):
+                raise PlaylistChangeError("'after' must be an entry id or null")
+    return add, remove, move
+
+
+def apply_playlist_changes(session, table, song_table, playlist_id, add=(), remove=(), move=()):
+    """
+        Apply many playlist mutations in one transaction.
+        :param add: list of {"song_id": id, "after": entry id or None (front)}; without "after" the song is appended
+        :param remove: list of playlist entry ids
+        :param move: list of {"id": entry id, "after": entry id or None (front)}
+        :return: dict of added/removed/moved counts
+        :raises PlaylistChangeError: unknown song or entry ids
+    """
+    song_ids = {item['song_id'] for item in add}
+    if song_ids:
+        found = set(session.execute(
+            select(song_table.c.id).where(song_table.c.id.in_(song_ids))).scalars())
+        missing = song_ids - found
+        if missing:
+            raise PlaylistChangeError(f"Song not found with id: {sorted(missing)[0]}")
+
+    removed = 0
+    if remove:
+        removed = session.execute(
+            delete(table).where(table.c.playlist_id == playlist_id, table.c.id.in_(set(remove)))
+        ).rowcount
+
+    positional = move or any('after' in item for item in add)
+    now = datetime.utcnow()
+    moved = 0
+    if not positional:
+        # Appends only: no need to load the playlist order
+        start = next_position(session, table, playlist_id)
+        rows = [{'playlist_id': playlist_id, 'song_id': item['song_id'], 'added_at': now,
+                 'position': start + i * POSITION_GAP} for i, item in enumerate(add)]
+        if rows:
+            session.execute(insert(table), rows)
+        return {"added": len(rows), "removed": removed, "moved": moved}
+
+    entries = [list(row) for row in session.execute(
+        select(table.c.id, table.c.position)
+        .where(table.c.playlist_id == playlist_id)
+        .order_by(table.c.position, table.c.id))]
+    dirty = set()
+
+    for item in move:
+        entry_id = item['id']
+        current = next((i for i, entry in enumerate(entries) if entry[0] == entry_id), None)
+        if current is None:
+            raise PlaylistChangeError(f"Playlist entry not found with id: {entry_id}")
+        entries.pop(current)
+        _insert_at(entries, dirty, _index_after(entries, item.get('after')), entry_id)
+        moved += 1
+
+    # New rows get temporary keys until they are inserted
+    new_rows = {}
+    for i, item in enumerate(add):
+        key = ('new', i)
+        new_rows[key] = {'playlist_id': playlist_id, 'song_id': item['song_id'], 'added_at': now}
+        index = _index_after(entries, item['after']) if 'after' in item else len(entries)
+        _insert_at(entries, dirty, index, key)
+
+    positions = {entry[0]: entry[1] for entry in entries}
+    updates = [{'entry_id': entry_id, 'new_position': positions[entry_id]}
+               for entry_id in dirty if entry_id not in new_rows]
+    if updates:
+        session.execute(
+            update(table).where(table.c.id == bindparam('entry_id'))
+            .values(position=bindparam('new_position')),
+            updates)
+    if new_rows:
+        session.execute(insert(table), [dict(row, position=positions[key]) for key, row in new_rows.items()])
+    return {"added": len(new_rows), "removed": removed, "moved": moved}
@@ -0,0 +1,326 @@
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError, InterfaceError
+from threading import Condition, Thread, Lock
+import atexit
+import os
+import time
+
+MAX_EVENTS_PER_REQUEST = 1000
+# play_events.user_id, song_id and ms_played are 32-bit INTEGER columns
+MAX_INT = 2 ** 31 - 1
+# Events the database refused, kept for inspection
+MAX_DEAD_LETTERS = 1000
+# How far ahead of the server clock a client's played_at may be
+MAX_CLOCK_SKEW = timedelta(minutes=5)
+# User and song ids seen to exist are remembered this long, and at most this many,
+# so deletes made by other processes are noticed within KNOWN_IDS_SECONDS
+KNOWN_IDS_SECONDS = 60
+MAX_KNOWN_IDS = 100000
+# Failures that say nothing about the rows themselves: the whole batch is retried later
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+
+class PlayBufferFull(Exception):
+    """Raised when the buffer stayed full for the whole wait; the route should answer 503."""
+
+
+def _parse_time(value):
+    if value is None:
+        return datetime.utcnow()
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value / 1000, timezone.utc).replace(tzinfo=None)
+    if isinstance(value, str):
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+    raise ValueError()
+
+
+def validate_play(data):
+    """
+        Check one incoming play event and build the column values to insert.
+        played_at is ISO 8601 or epoch milliseconds (default: now, UTC), at most
+        MAX_CLOCK_SKEW in the future.
+        :return: (values, None) or (None, error message)
+    """
+    if not isinstance(data, dict):
+        return None, "Event must be a JSON object"
+    for field in ('user_id', 'song_id', 'ms_played'):
+        value = data.get(field)
+        if value is None:
+            return None, f"Missing '{field}'"
+        if not isinstance(value, int) or isinstance(value, bool):
+            return None, f"'{field}' must be an integer"
+    for field in ('user_id', 'song_id'):
+        if not 1 <= data[field] <= MAX_INT:
+            return None, f"'{field}' must be between 1 and {MAX_INT}"
+    if not 0 <= data['ms_played'] <= MAX_INT:
+        return None, f"'ms_played' must be between 0 and {MAX_INT}"
+    try:
+        played_at = _parse_time(data.get('played_at'))
+    except (ValueError, OverflowError, OSError):
+        return None, "'played_at' must be ISO 8601 or epoch milliseconds"
+    if played_at > datetime.utcnow() + MAX_CLOCK_SKEW:
+        return None, "'played_at' is in the future"
+    return {
+        'user_id': data['user_id'],
+        'song_id': data['song_id'],
+        'played_at': played_at,
+        'ms_played': data['ms_played'],
+    }, None
+
+
+class PlayBuffer:
+    """
+        Write-behind buffer for play events. Requests only append to an
+        in-memory queue; a background thread writes it out with one batched
+        INSERT per batch (multi-row VALUES on PostgreSQL) once batch_size events are waiting or flush_seconds
+        have passed, whichever comes first.
+
+        The queue, counting the batch being written, holds at most max_events.
+        When it is full, add() waits up to wait_seconds for the flusher to make
+        room and then raises PlayBufferFull, so a slow database pushes back on
+        clients instead of growing memory. Whatever is buffered is flushed at
+        interpreter exit.
+
+        A batch that fails on a lost connection or lock timeout goes back to
+        the front of the queue as is. Any other failure means some event in it
+        can't be written: the batch is halved until that event is alone, and
+        it is moved to dead_letters (the last MAX_DEAD_LETTERS, with the error)
+        so the rest still gets written.
+
+        Events for users or songs that no longer exist are dropped. Ids seen to
+        exist are cached; forget() (a change listener) drops the cache when
+        this process writes to users or songs, e.g. a cascade delete, and it
+        expires after KNOWN_IDS_SECONDS for deletes made elsewhere.
+
+        Each worker process has its own buffer; events accepted but not yet
+        flushed are lost if the process is killed outright.
+    """
+
+    def __init__(self, batch_size=5000, flush_seconds=1.0, max_events=100000, wait_seconds=0.5):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_events = max_events
+        self.wait_seconds = wait_seconds
+        self.accepted = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.failed_flushes = 0
+        self.dead_lettered = 0
+        self.last_flush_seconds = 0.0
+        self.dead_letters = deque(maxlen=MAX_DEAD_LETTERS)
+        self._events = deque()
+        self._in_flight = 0
+        self._condition = Condition()
+        self._flush_lock = Lock()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._engine = None
+        self._logger = None
+        self._table = None
+        self._user_table = None
+        self._song_table = None
+        self._known_users = set()
+        self._known_songs = set()
+        self._known_expires = 0
+        self._listeners = []
+
+    def init_app(self, app, db, table, user_table, song_table):
+        self.batch_size = int(app.config.get('PLAY_FLUSH_BATCH') or self.batch_size)
+        self.flush_seconds = float(app.config.get('PLAY_FLUSH_SECONDS') or self.flush_seconds)
+        self.max_events = int(app.config.get('PLAY_BUFFER_SIZE') or self.max_events)
+        self.wait_seconds = float(app.config.get('PLAY_BUFFER_WAIT_SECONDS') or self.wait_seconds)
+        self._table = table
+        self._user_table = user_table
+        self._song_table = song_table
+        self._logger = app.logger
+        with app.app_context():
+            self._engine = db.engine
+        atexit.register(self.shutdown)
+        app.extensions['plays'] = self
+
+    def add_listener(self, listener):
+        """
+            Call listener(connection, rows) with every batch written, inside its transaction.
+        """
+        self._listeners.append(listener)
+
+    def _ensure_thread(self):
+        # Started lazily, and again in each forked worker, since threads don't survive fork
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = Thread(target=self._run, name='play-buffer', daemon=True)
+            self._thread.start()
+
+    def add(self, events):
+        """
+            Queue validated events (dicts from validate_play) for the next flush.
+            :raise PlayBufferFull: if there was no room within wait_seconds
+        """
+        with self._condition:
+            self._ensure_thread()
+            deadline = time.monotonic() + self.wait_seconds
+            while len(self._events) + self._in_flight + len(events) > self.max_events:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self.rejected += len(events)
+                    raise PlayBufferFull()
+                self._condition.notify_all()
+                self._condition.wait(remaining)
+            self._events.extend(events)
+            self.accepted += len(events)
+            if len(self._events) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _take(self, limit):
+        batch = []
+        while self._events and len(batch) < limit:
+            batch.append(self._events.popleft())
+        return batch
+
+    def _run(self):
+        while True:
+            with self._condition:
+                deadline = time.monotonic() + self.flush_seconds
+                while len(self._events) < self.batch_size and not self._stopping:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopping:
+                    return
+            if self._flush() is None:
+                # The database is failing; back off before retrying the batch
+                time.sleep(self.flush_seconds)
+
+    def forget(self, changes):
+        """
+            Change listener: drop the cached ids of a table that had rows written.
+            :param changes: {table name: set of ids}
+        """
+        if self._user_table is not None and self._user_table.name in changes:
+            self._known_users = set()
+        if self._song_table is not None and self._song_table.name in changes:
+            self._known_songs = set()
+
+    def _existing_ids(self, connection, table, ids, known):
+        # The ids of `ids` that exist; a local set, since forget() may swap the cache meanwhile
+        missing = ids - known
+        if not missing:
+            return ids
+        found = set(connection.execute(select(table.c.id).where(table.c.id.in_(missing))).scalars())
+        known.update(found)
+        return (ids - missing) | found
+
+    def _write(self, batch):
+        if (time.monotonic() >= self._known_expires
+                or len(self._known_users) + len(self._known_songs) > MAX_KNOWN_IDS):
+            self._known_users = set()
+            self._known_songs = set()
+            self._known_expires = time.monotonic() + KNOWN_IDS_SECONDS
+        with self._engine.begin() as connection:
+            users = self._existing_ids(connection, self._user_table,
+                                       {event['user_id'] for event in batch}, self._known_users)
+            songs = self._existing_ids(connection, self._song_table,
+                                       {event['song_id'] for event in batch}, self._known_songs)
+            rows = [event for event in batch if event['user_id'] in users and event['song_id'] in songs]
+            if rows:
+                connection.execute(insert(self._table), rows)
+                for listener in self._listeners:
+                    listener(connection, rows)
+        return len(rows)
+
+    def flush(self):
+        """
+            Write out everything buffered so far, batch_size events per INSERT.
+            A batch that fails on the connection goes back to the front of the queue.
+            :return: number of events written
+        """
+        return self._flush() or 0
+
+    def _dead_letter(self, event, error):
+        self.dead_letters.append({**event, 'error': f"{type(error).__name__}: {error}"})
+        self.dead_lettered += 1
+        self._logger.error(f"Dropping play event the database refused: {event} ({error})")
+
+    def _write_isolating(self, batch):
+        # (written, dead-lettered, events to retry later). A failure that isn't the
+        # connection's halves the batch until the event behind it is alone.
+        pending = [batch]
+        written = dead = 0
+        while pending:
+            chunk = pending.pop()
+            try:
+                written += self._write(chunk)
+            except Exception as e:
+                self.failed_flushes += 1
+                # A user or song may have been deleted since it was seen
+                self._known_users = set()
+                self._known_songs = set()
+                if isinstance(e, TRANSIENT_ERRORS):
+                    self._logger.exception(f"Flushing {len(chunk)} play events failed; will retry")
+                    return written, dead, chunk + [event for rest in reversed(pending) for event in rest]
+                if len(chunk) == 1:
+                    self._dead_letter(chunk[0], e)
+                    dead += 1
+                    continue
+                middle = len(chunk) // 2
+                pending += [chunk[middle:], chunk[:middle]]
+        return written, dead, []
+
+    def _flush(self):
+        # Number of events written, or None if a batch has to be retried
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._condition:
+                    batch = self._take(self.batch_size)
+                    # Still counted against max_events, so putting it back can't overfill the queue
+                    self._in_flight = len(batch)
+                if not batch:
+                    return written
+                started = time.perf_counter()
+                inserted, dead, retry = self._write_isolating(batch)
+                with self._condition:
+                    self._events.extendleft(reversed(retry))
+                    self._in_flight = 0
+                    # Room was made; wake requests waiting in add()
+                    self._condition.notify_all()
+                self.flushed += inserted
+                # Events for users or songs that don't exist are dropped
+                self.invalid += len(batch) - inserted - dead - len(retry)
+                written += inserted
+                if retry:
+                    return None
+                self.last_flush_seconds = time.perf_counter() - started
+                self.flushes += 1
+
+    def shutdown(self):
+        """
+            Stop the flusher thread and flush what is left. Registered with atexit,
+            so it runs on graceful worker shutdown.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout=self.flush_seconds + 5)
+        if self._engine is not None:
+            self.flush()
+
+    def stats(self):
+        with self._condition:
+            buffered = len(self._events) + self._in_flight
+        return {"buffered": buffered, "max_events": self.max_events, "accepted": self.accepted,
+                "flushed": self.flushed, "flushes": self.flushes, "rejected": self.rejected,
+                "invalid": self.invalid, "failed_flushes": self.failed_flushes,
+                "dead_lettered": self.dead_lettered,
+                "last_flush_ms": round(self.last_flush_seconds * 1000, 2)}
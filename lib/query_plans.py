@@ -0,0 +1,43 @@
+from sqlalchemy import select
+from models import User, Artist, Album, Genre, Song, Playlist, PlaylistSong
+
+# Lookups the routes run on every request. Each one must be answered by an
+# index SEARCH, never a full table SCAN.
+HOT_QUERIES = {
+    'user by username': select(User).where(User.username == 'x'),
+    'user by email': select(User).where(User.email == 'x'),
+    'artist by name': select(Artist).where(Artist.name == 'x'),
+    'albums by artist': select(Album).where(Album.artist_id == 1),
+    'genres by artist': select(Genre).where(Genre.artist_id == 1),
+    'songs by album': select(Song).where(Song.album_id == 1),
+    'songs by genre': select(Song).where(Song.genre_id == 1),
+    'playlists by user': select(Playlist).where(Playlist.user_id == 1),
+    'playlist songs by playlist': select(PlaylistSong).where(PlaylistSong.playlist_id == 1),
+    'playlist songs by song': select(PlaylistSong).where(PlaylistSong.song_id == 1),
+    'playlist song by pair': select(PlaylistSong).where(PlaylistSong.playlist_id == 1,
+                                                        PlaylistSong.song_id == 1),
+    'songs page after cursor': select(Song).where(Song.id > 1).order_by(Song.id).limit(100),
+}
+
+
+def explain(connection, statement):
+    """
+        Run EXPLAIN QUERY PLAN for a statement on a SQLite connection.
+        :return: list of plan detail strings
+    """
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled))
+    return [row[-1] for row in rows]
+
+
+def find_table_scans(connection, queries=HOT_QUERIES):
+    """
+        Check every hot query's plan for full table scans.
+        :return: dict of query name -> offending plan lines (empty when all plans use indexes)
+    """
+    failures = {}
+    for name, statement in queries.items():
+        scans = [line for line in explain(connection, statement) if line.startswith('SCAN')]
+        if scans:
+            failures[name] = scans
+    return failures
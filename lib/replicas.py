@@ -0,0 +1,157 @@
+from flask import request, g, current_app, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from functools import wraps
+from sqlalchemy import event, text
+from sqlalchemy.sql import Select
+from threading import Lock
+import random
+import time
+
+READ_METHODS = ('GET', 'HEAD')
+RECENT_WRITE_COOKIE = 'db_recent_write'
+
+
+class RoutingSession(Session):
+    """
+        Session that sends plain SELECTs of read-only requests to a replica and
+        everything else (writes, flushes, SELECT FOR UPDATE, raw SQL) to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('replica_router')
+            if router is not None and router.wants_replica(self, clause):
+                engine = router.pick_replica()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def use_primary(func):
+    """Route every read of this view to the primary, for rows another process may have just written."""
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        g.db_target = 'primary'
+        return func(*args, **kwargs)
+    return decorated
+
+
+def _mark_wrote(session, *args):
+    session.info['wrote'] = True
+
+
+def _mark_dml(state):
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info['wrote'] = True
+
+
+def _mark_committed(session):
+    if session.info.get('wrote') and has_request_context():
+        g.db_committed_write = True
+
+
+class ReplicaRouter:
+    """
+        Read/write routing over one primary and any number of replica binds.
+
+        Replicas are configured with DATABASE_REPLICA_URIS (comma separated).
+        After a request commits a write, the client gets a cookie that keeps
+        its reads on the primary for REPLICA_READ_YOUR_WRITES_SECONDS. A replica
+        that fails its health check is skipped for REPLICA_HEALTH_CHECK_SECONDS;
+        with no healthy replica, reads fall back to the primary.
+    """
+
+    def __init__(self):
+        self.bind_keys = []
+        self.window = 5
+        self.health_interval = 10
+        self._health = {}
+        self._watched = set()
+        self._lock = Lock()
+        self._db = None
+
+    def init_app(self, app, db):
+        """Call before db.init_app(app): adds the replica binds to the config."""
+        uris = [uri.strip() for uri in (app.config.get('DATABASE_REPLICA_URIS') or '').split(',') if uri.strip()]
+        self.window = float(app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS') or 5)
+        self.health_interval = float(app.config.get('REPLICA_HEALTH_CHECK_SECONDS') or 10)
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        self.bind_keys = []
+        for i, uri in enumerate(uris):
+            key = f'replica_{i}'
+            binds[key] = uri
+            self.bind_keys.append(key)
+        app.config['SQLALCHEMY_BINDS'] = binds
+        self._db = db
+        app.extensions['replica_router'] = self
+        app.after_request(self._set_recent_write_cookie)
+
+    def init_session(self, session_class):
+        event.listen(session_class, 'after_flush', _mark_wrote)
+        event.listen(session_class, 'do_orm_execute', _mark_dml)
+        event.listen(session_class, 'after_commit', _mark_committed)
+
+    def wants_replica(self, session, clause):
+        if not self.bind_keys or not has_request_context():
+            return False
+        if session._flushing or session.info.get('wrote'):
+            return False
+        if not isinstance(clause, Select) or clause._for_update_arg is not None:
+            return False
+        if g.get('db_target') == 'primary' or request.method not in READ_METHODS:
+            return False
+        until = request.cookies.get(RECENT_WRITE_COOKIE)
+        try:
+            if until and float(until) > time.time():
+                return False
+        except ValueError:
+            pass
+        return True
+
+    def _healthy(self, key):
+        now = time.monotonic()
+        with self._lock:
+            status = self._health.get(key)
+        if status is not None and now - status[1] < self.health_interval:
+            return status[0]
+        try:
+            with self._db.engines[key].connect() as connection:
+                connection.execute(text('SELECT 1'))
+            ok = True
+        except Exception:
+            ok = False
+        with self._lock:
+            self._health[key] = (ok, now)
+        return ok
+
+    def mark_unhealthy(self, key):
+        with self._lock:
+            self._health[key] = (False, time.monotonic())
+
+    def _watch(self, key, engine):
+        """Take a replica out of rotation as soon as one of its connections drops."""
+        with self._lock:
+            if key in self._watched:
+                return
+            self._watched.add(key)
+
+        def on_error(context):
+            if context.is_disconnect:
+                self.mark_unhealthy(key)
+        event.listen(engine, 'handle_error', on_error)
+
+    def pick_replica(self):
+        """A random healthy replica engine, or None to fall back to the primary."""
+        keys = [key for key in self.bind_keys if self._healthy(key)]
+        if not keys:
+            return None
+        key = random.choice(keys)
+        engine = self._db.engines[key]
+        self._watch(key, engine)
+        return engine
+
+    def _set_recent_write_cookie(self, response):
+        if self.bind_keys and g.get('db_committed_write'):
+            response.set_cookie(RECENT_WRITE_COOKIE, str(time.time() + self.window),
+                                max_age=int(self.window) + 1, httponly=True)
+        return response
@@ -0,0 +1,109 @@
+from sqlalchemy import text
+import re
+
+# One FTS5 table holds songs, albums and artists. The rowid encodes the source
+# row as id * 4 + kind, so triggers can update or delete an entry by rowid
+# instead of scanning the index.
+KINDS = {'song': 1, 'album': 2, 'artist': 3}
+
+# bm25 column weights: name, bio
+NAME_WEIGHT = 10.0
+BIO_WEIGHT = 1.0
+
+SOURCES = {
+    # table: (kind, name column, bio column)
+    'songs': ('song', 'title', None),
+    'albums': ('album', 'title', None),
+    'artists': ('artist', 'name', 'bio'),
+}
+
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, name, bio, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+
+def _trigger_statements(table, kind, name_column, bio_column):
+    number = KINDS[kind]
+    bio = f"coalesce(new.{bio_column}, '')" if bio_column else "''"
+    insert = (f"INSERT INTO search_index(rowid, kind, name, bio) "
+              f"VALUES (new.id * 4 + {number}, '{kind}', new.{name_column}, {bio});")
+    delete = f"DELETE FROM search_index WHERE rowid = old.id * 4 + {number};"
+    # Only the indexed columns: counter updates on these tables must not rewrite the index
+    columns = ', '.join(column for column in (name_column, bio_column) if column)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_search_au AFTER UPDATE OF {columns} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def is_supported(connection):
+    return connection.dialect.name == 'sqlite'
+
+
+def create_search_index(connection):
+    """
+        Create the FTS5 table and the triggers that keep it in sync. Idempotent.
+        :param connection: SQLAlchemy connection to a SQLite database
+    """
+    connection.exec_driver_sql(CREATE_TABLE)
+    for table, (kind, name_column, bio_column) in SOURCES.items():
+        for statement in _trigger_statements(table, kind, name_column, bio_column):
+            connection.exec_driver_sql(statement)
+
+
+def rebuild_search_index(connection):
+    """
+        Repopulate the index from the source tables, e.g. for a database that
+        existed before the triggers did.
+        :return: number of indexed rows
+    """
+    create_search_index(connection)
+    connection.exec_driver_sql("DELETE FROM search_index")
+    for table, (kind, name_column, bio_column) in SOURCES.items():
+        bio = f"coalesce({bio_column}, '')" if bio_column else "''"
+        connection.exec_driver_sql(
+            f"INSERT INTO search_index(rowid, kind, name, bio) "
+            f"SELECT id * 4 + {KINDS[kind]}, '{kind}', {name_column}, {bio} FROM {table}"
+        )
+    connection.exec_driver_sql("INSERT INTO search_index(search_index) VALUES ('optimize')")
+    return connection.exec_driver_sql("SELECT count(*) FROM search_index").scalar()
+
+
+def build_match_query(q):
+    """
+        Turn free text into a safe FTS5 query: every word is quoted, and the
+        last one is a prefix match so partial input still finds results.
+        :return: match expression or None when q has no searchable words
+    """
+    words = re.findall(r'\w+', q or '')
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search(connection, q, kind=None, limit=20, offset=0):
+    """
+        Ranked (bm25) search over song titles, album titles and artist names/bios.
+        :param kind: Optional 'song', 'album' or 'artist' filter
+        :return: list of dicts with type, id, name and rank; best match first
+    """
+    match = build_match_query(q)
+    if match is None:
+        return []
+    sql = ("SELECT rowid, kind, name, bm25(search_index, 0.0, :name_weight, :bio_weight) AS rank "
+           "FROM search_index WHERE search_index MATCH :match")
+    params = {'match': match, 'name_weight': NAME_WEIGHT, 'bio_weight': BIO_WEIGHT,
+              'limit': limit, 'offset': offset}
+    if kind is not None:
+        sql += " AND kind = :kind"
+        params['kind'] = kind
+    # rowid breaks bm25 ties, so pages don't overlap or skip equally ranked rows
+    sql += " ORDER BY rank, rowid LIMIT :limit OFFSET :offset"
+    rows = connection.execute(text(sql), params)
+    return [{"type": row.kind, "id": row.rowid // 4, "name": row.name, "rank": row.rank}
+            for row in rows]
@@ -0,0 +1,119 @@
+from itertools import accumulate
+from sqlalchemy import func, insert, select, text
+from lib.playlists import POSITION_GAP
+import random
+
+BATCH_SIZE = 5000
+
+# Pareto shape for playlist sizes: most playlists are short, a few are huge
+PLAYLIST_SIZE_SHAPE = 1.2
+# Zipf exponent for song popularity when filling playlists
+SONG_POPULARITY_SKEW = 1.0
+
+WORDS = ('blue', 'night', 'river', 'gold', 'echo', 'summer', 'wild', 'static', 'paper', 'neon',
+         'silver', 'ghost', 'ocean', 'fire', 'glass', 'velvet', 'storm', 'honey', 'iron', 'dream')
+GENRES = ('Rock', 'Pop', 'Jazz', 'Hip Hop', 'Electronic', 'Folk', 'Classical', 'Blues', 'Soul', 'Metal')
+
+
+def _title(rng, words=2):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).title()
+
+
+def _next_id(session, table):
+    return (session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+
+def _insert(session, table, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        session.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def _reset_sequence(session, table):
+    # Ids are assigned here, so PostgreSQL's serial sequence has to catch up
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                             f"(SELECT MAX(id) FROM {table.name}))"))
+
+
+def playlist_sizes(rng, count, min_size, max_size):
+    """
+        Heavy-tailed playlist lengths between min_size and max_size.
+    """
+    return [min(max_size, int(min_size * rng.paretovariate(PLAYLIST_SIZE_SHAPE))) for _ in range(count)]
+
+
+def seed_catalog(session, tables, password_hash, artists=100, albums_per_artist=5, songs_per_album=10,
+                 genres_per_artist=2, users=1000, playlists=2000, playlist_min=5, playlist_max=1000,
+                 seed=0):
+    """
+        Bulk-generate a synthetic catalog with executemany inserts.
+        Every user gets the same password hash, so seeding never runs bcrypt.
+        The same seed always produces the same catalog on an empty database.
+        :param tables: dict of table name -> Table for users, artists, albums, genres, songs, playlists, playlist_songs
+        :param password_hash: Hash stored for every user and artist
+        :return: dict of table name -> rows inserted
+    """
+    rng = random.Random(seed)
+    t = tables
+
+    artist_id = _next_id(session, t['artists'])
+    artist_rows = [{'id': artist_id + i, 'name': f"{_title(rng)} {artist_id + i}",
+                    'bio': f"{_title(rng, 6)}.", 'password': password_hash} for i in range(artists)]
+    _insert(session, t['artists'], artist_rows)
+    artist_ids = [row['id'] for row in artist_rows]
+
+    genre_id = _next_id(session, t['genres'])
+    genre_rows = [{'id': genre_id + i, 'title': rng.choice(GENRES), 'artist_id': artist_ids[i // genres_per_artist]}
+                  for i in range(artists * genres_per_artist)]
+    _insert(session, t['genres'], genre_rows)
+    genres_of = {}
+    for row in genre_rows:
+        genres_of.setdefault(row['artist_id'], []).append(row['id'])
+
+    album_id = _next_id(session, t['albums'])
+    album_rows = [{'id': album_id + i, 'title': _title(rng, 3), 'artist_id': artist_ids[i // albums_per_artist]}
+                  for i in range(artists * albums_per_artist)]
+    _insert(session, t['albums'], album_rows)
+
+    song_id = _next_id(session, t['songs'])
+    song_rows = []
+    for album in album_rows:
+        for track in range(songs_per_album):
+            song_rows.append({'id': song_id + len(song_rows), 'title': _title(rng, 3), 'duration': rng.randint(90, 420),
+                              'file_path': f"{album['artist_id']}/{album['id']}/{track + 1:02d}.mp3",
+                              'album_id': album['id'],
+                              'genre_id': rng.choice(genres_of.get(album['artist_id']) or [None])})
+    _insert(session, t['songs'], song_rows)
+    song_ids = [row['id'] for row in song_rows]
+
+    user_id = _next_id(session, t['users'])
+    user_rows = [{'id': user_id + i, 'username': f"user{user_id + i}", 'email': f"user{user_id + i}@example.com",
+                  'password': password_hash} for i in range(users)]
+    _insert(session, t['users'], user_rows)
+
+    playlist_id = _next_id(session, t['playlists'])
+    playlist_rows = [{'id': playlist_id + i, 'title': _title(rng), 'user_id': rng.choice(user_rows)['id']}
+                     for i in range(playlists if user_rows else 0)]
+    _insert(session, t['playlists'], playlist_rows)
+
+    # A few songs show up in most playlists, as in real listening data
+    popularity = list(accumulate(1 / (rank + 1) ** SONG_POPULARITY_SKEW for rank in range(len(song_ids))))
+    entries = 0
+    batch = []
+    sizes = playlist_sizes(rng, len(playlist_rows), playlist_min, min(playlist_max, len(song_ids))) if song_ids else []
+    for playlist, size in zip(playlist_rows, sizes):
+        picked = dict.fromkeys(rng.choices(song_ids, cum_weights=popularity, k=size))
+        for position, song in enumerate(picked, start=1):
+            batch.append({'playlist_id': playlist['id'], 'song_id': song, 'position': position * POSITION_GAP})
+        if len(batch) >= BATCH_SIZE:
+            _insert(session, t['playlist_songs'], batch)
+            entries += len(batch)
+            batch = []
+    _insert(session, t['playlist_songs'], batch)
+    entries += len(batch)
+
+    for name in ('artists', 'genres', 'albums', 'songs', 'users', 'playlists'):
+        _reset_sequence(session, t[name])
+    return {'artists': len(artist_rows), 'genres': len(genre_rows), 'albums': len(album_rows),
+            'songs': len(song_rows), 'users': len(user_rows), 'playlists': len(playlist_rows),
+            'playlist_songs': entries}
@@ -0,0 +1,59 @@
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional: fall back to the stdlib encoder
+    orjson = None
+
+
+class Projection:
+    """
+        The columns a list route returns, loaded as plain row tuples instead of
+        ORM objects: no identity map, no attribute instrumentation.
+        Use it in place of a model's to_dict: list_response(query, Song.id, Projection(Song.id, Song.title))
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.keys = tuple(column.key for column in columns)
+
+    def apply(self, query):
+        return query.with_entities(*self.columns)
+
+    def __call__(self, row):
+        return dict(zip(self.keys, row))
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+        JSON provider encoding with orjson when it is installed, else with the
+        stdlib like Flask's default. Output is compact and key-sorted like
+        jsonify; non-ASCII text is written as UTF-8 instead of \\u escapes.
+    """
+    ensure_ascii = False
+
+    def _orjson_options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _pretty(self):
+        return (self.compact is None and self._app.debug) or self.compact is False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options()).decode('utf-8')
+
+    def dumps_bytes(self, obj):
+        """Compact UTF-8 encoded JSON, without a str round trip when orjson is available."""
+        if orjson is None:
+            return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+
+    def response(self, *args, **kwargs):
+        if self._pretty():
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
@@ -0,0 +1,168 @@
+from datetime import datetime
+from sqlalchemy import select, func, delete, insert
+import time
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional: only building the similar-songs table needs them
+    np = sparse = None
+
+DEFAULT_TOP_K = 20
+# Pairs of songs sharing fewer playlists than this are noise, not similarity
+MIN_COOCCURRENCE = 2
+# Co-occurrence entries computed at once (upper bound); bounds peak memory
+BLOCK_ENTRIES = 2000000
+WRITE_BATCH_SIZE = 5000
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("Similar songs need the numpy and scipy packages")
+
+
+def playlist_matrix(playlist_ids, song_ids, shape=None):
+    """
+        Binary playlists x songs CSR matrix indexed by id. A song listed twice
+        in a playlist counts once.
+    """
+    _require_numpy()
+    if shape is None and not len(song_ids):
+        shape = (1, 1)
+    matrix = sparse.csr_matrix((np.ones(len(song_ids), dtype=np.float32), (playlist_ids, song_ids)),
+                               shape=shape)
+    matrix.data[:] = 1
+    return matrix
+
+
+def _blocks(by_song, matrix, songs, max_entries):
+    # A song's co-occurrence row has at most as many entries as its playlists have
+    # rows in total; cut songs into runs whose bounds add up to max_entries
+    playlist_sizes = np.diff(matrix.indptr).astype(np.float64)
+    bounds = np.asarray(by_song[:, songs].T @ playlist_sizes).ravel()
+    cumulative = np.cumsum(bounds)
+    cuts = np.searchsorted(cumulative, np.arange(max_entries, cumulative[-1], max_entries), side='right')
+    return np.split(songs, np.unique(np.clip(cuts, 1, len(songs) - 1)))
+
+
+def top_k_neighbours(matrix, songs, k=DEFAULT_TOP_K, min_count=MIN_COOCCURRENCE, max_entries=BLOCK_ENTRIES):
+    """
+        The k most similar songs of each song in songs, by cosine similarity of
+        playlist membership: c_ij / sqrt(c_ii * c_jj), where c_ij counts the
+        playlists holding both songs. Co-occurrence rows are computed one block
+        of songs at a time as a sparse product, so the full song x song matrix
+        never exists in memory; popular songs get smaller blocks.
+        :param matrix: playlists x songs matrix from playlist_matrix
+        :param songs: ids of the songs to compute neighbours for
+        :return: (song ids, similar song ids, scores), by song then best first
+    """
+    _require_numpy()
+    songs = np.asarray(songs, dtype=np.int64)
+    if not len(songs):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32)
+    by_song = matrix.tocsc()
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0), dtype=np.float32).ravel())
+    results = []
+    for block in _blocks(by_song, matrix, songs, max_entries):
+        co = (by_song[:, block].T.tocsr() @ matrix).tocoo()
+        rows, cols, counts = block[co.row], co.col.astype(np.int64), co.data
+        keep = (rows != cols) & (counts >= min_count)
+        rows, cols, counts = rows[keep], cols[keep], counts[keep]
+        scores = counts / (norms[rows] * norms[cols])
+        order = np.lexsort((cols, -scores, rows))
+        rows, cols, scores = rows[order], cols[order], scores[order]
+        # Position of each entry within its song's run, to keep the first k
+        run_starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        ranks = np.arange(len(rows)) - np.repeat(run_starts, np.diff(np.r_[run_starts, len(rows)]))
+        top = ranks < k
+        results.append((rows[top], cols[top], scores[top]))
+    return tuple(np.concatenate(parts) for parts in zip(*results))
+
+
+def load_pairs(connection, table):
+    """
+        Every (playlist_id, song_id) of playlist_songs as two int arrays.
+    """
+    _require_numpy()
+    rows = connection.execute(select(table.c.playlist_id, table.c.song_id)).all()
+    pairs = np.array(rows, dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+class SimilarSongsBuilder:
+    """
+        Fills similar_songs with the top-K neighbours of every song, so the
+        /songs/<id>/similar route is a single indexed lookup.
+
+        A full build recomputes every song. An incremental build takes the songs
+        added to playlists since the last build (added_at newer than its
+        watermark) and recomputes only the songs sharing a playlist with one of
+        them, the only ones whose scores can have changed. Removals, and rows
+        committed late with an older added_at, wait for the next full build.
+    """
+
+    def __init__(self, session, playlist_songs, similar_songs, builds, k=DEFAULT_TOP_K,
+                 min_count=MIN_COOCCURRENCE):
+        self.session = session
+        self.playlist_songs = playlist_songs
+        self.similar_songs = similar_songs
+        self.builds = builds
+        self.k = k
+        self.min_count = min_count
+
+    def last_watermark(self):
+        return self.session.execute(
+            select(self.builds.c.watermark).order_by(self.builds.c.id.desc()).limit(1)).scalar()
+
+    def _added_songs(self, watermark):
+        t = self.playlist_songs
+        query = select(t.c.song_id).where(t.c.added_at > watermark).distinct()
+        return self.session.execute(query).scalars().all()
+
+    def _write(self, songs, rows, full):
+        t = self.similar_songs
+        if full:
+            self.session.execute(delete(t))
+        else:
+            for start in range(0, len(songs), WRITE_BATCH_SIZE):
+                chunk = [int(song) for song in songs[start:start + WRITE_BATCH_SIZE]]
+                self.session.execute(delete(t).where(t.c.song_id.in_(chunk)))
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            self.session.execute(insert(t), rows[start:start + WRITE_BATCH_SIZE])
+
+    def run(self, full=False):
+        """
+            Build (incrementally unless full or there was no previous build) and commit.
+            :return: report dict: full, songs, pairs, seconds
+        """
+        started = time.perf_counter()
+        t = self.playlist_songs
+        watermark = None if full else self.last_watermark()
+        full = watermark is None
+        new_watermark = self.session.execute(select(func.max(t.c.added_at))).scalar()
+        added = [] if full else self._added_songs(watermark)
+
+        playlist_ids, song_ids = load_pairs(self.session.connection(), t)
+        matrix = playlist_matrix(playlist_ids, song_ids)
+        if full:
+            songs = np.unique(song_ids)
+        elif added:
+            # Songs in any playlist holding an added song: their counts with it, or its norm, moved
+            playlists = np.unique(matrix.tocsc()[:, added].indices)
+            songs = np.unique(matrix[playlists].indices)
+        else:
+            songs = np.empty(0, np.int64)
+
+        sources, targets, scores = top_k_neighbours(matrix, songs, self.k, self.min_count)
+        ranks = np.arange(len(sources)) - np.searchsorted(sources, sources)
+        rows = [{'song_id': int(source), 'rank': int(rank) + 1, 'similar_song_id': int(target),
+                 'score': round(float(score), 4)}
+                for source, target, score, rank in zip(sources, targets, scores, ranks)]
+        self._write(songs, rows, full)
+
+        seconds = time.perf_counter() - started
+        self.session.execute(insert(self.builds).values(
+            built_at=datetime.utcnow(), full=full, watermark=new_watermark or watermark,
+            songs=len(songs), pairs=len(rows), seconds=seconds))
+        self.session.commit()
+        return {"full": full, "songs": int(len(songs)), "pairs": len(rows), "seconds": round(seconds, 3)}
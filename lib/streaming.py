@@ -0,0 +1,92 @@
+from collections import OrderedDict, namedtuple
+from threading import Lock
+import mimetypes
+import os
+import time
+
+FileInfo = namedtuple('FileInfo', ['path', 'size', 'mtime', 'etag', 'mimetype'])
+
+
+def is_relative_media_path(file_path):
+    """
+        True if file_path is relative and stays inside its root lexically
+        (no absolute path, drive or leading '..'). Checked when songs are written.
+    """
+    if not isinstance(file_path, str) or not file_path or '\x00' in file_path:
+        return False
+    if os.path.isabs(file_path) or os.path.splitdrive(file_path)[0]:
+        return False
+    normalized = os.path.normpath(file_path)
+    return normalized != os.pardir and not normalized.startswith(os.pardir + os.sep)
+
+
+def resolve_media_path(file_path, media_root):
+    """
+        Turn a Song.file_path into an absolute real path under media_root.
+        Nothing is served without a media_root: absolute paths, and paths
+        escaping the root after symlinks are resolved, are rejected.
+        :return: absolute path or None
+    """
+    if not media_root or not is_relative_media_path(file_path):
+        return None
+    root = os.path.realpath(media_root)
+    path = os.path.realpath(os.path.join(root, file_path))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+
+class FileStatCache:
+    """
+        Small LRU of song id -> resolved path and stat metadata.
+        Entries expire after ttl seconds so replaced files are picked up,
+        and can be dropped explicitly when a song is updated or deleted.
+    """
+
+    def __init__(self, max_entries=10000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, song_id, load_path, media_root):
+        """
+            Return the FileInfo for a song, calling load_path(song_id) only on a miss.
+            :param load_path: Function returning the song's file_path, or None if missing
+            :return: FileInfo or None when the song or the file does not exist
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(song_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(song_id)
+                return entry[1]
+
+        file_path = load_path(song_id)
+        if file_path is None:
+            return None
+        path = resolve_media_path(file_path, media_root)
+        if path is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        etag = f"{st.st_mtime_ns:x}-{st.st_size:x}-{song_id:x}"
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        info = FileInfo(path, st.st_size, st.st_mtime, etag, mimetype)
+
+        with self._lock:
+            self._entries[song_id] = (now + self.ttl, info)
+            self._entries.move_to_end(song_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return info
+
+    def invalidate(self, song_id):
+        with self._lock:
+            self._entries.pop(song_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
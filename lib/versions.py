@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+from functools import wraps
+from flask import request, current_app
+from sqlalchemy import event, select, insert, update
+from models import db, TableVersion
+from lib.changes import pending_changes, changes
+
+versions_table = TableVersion.__table__
+
+
+def bump_versions(connection, tables):
+    """
+        Add 1 to the version of each table, in the caller's transaction.
+
+        Each table has a single table_versions row, so concurrent transactions
+        writing to the same table queue on that row's lock (PostgreSQL) until the
+        first commits: writes to one table are serialized for the rest of their
+        transaction. Keep write transactions short. SQLite serializes writers
+        anyway. Bumping after commit instead would let a client cache a new
+        version of an old body.
+    """
+    for name in sorted(tables):
+        result = connection.execute(
+            update(versions_table).where(versions_table.c.table_name == name)
+            .values(version=versions_table.c.version + 1))
+        if result.rowcount == 0:
+            connection.execute(insert(versions_table).values(table_name=name, version=1))
+
+
+def bump_table_versions(session):
+    """
+        before_commit hook: flush, then add 1 to the version of every table the
+        transaction wrote to. The bump commits with the data it describes, so a
+        version is never visible before its rows.
+    """
+    session.flush()
+    bump_versions(session, set(pending_changes(session)) - {versions_table.name})
+
+
+@contextmanager
+def engine_transaction(tables):
+    """
+        db.engine.begin() for writes that bypass the session (counter, search
+        and rollup rebuilds), which before_commit never sees: the versions of
+        `tables` are bumped in the same transaction, and the response cache is
+        invalidated once it commits.
+        :param tables: Names of the tables the block rewrites
+    """
+    with db.engine.begin() as connection:
+        yield connection
+        bump_versions(connection, tables)
+    changes.report({name: {None} for name in tables})
+
+
+def init_versions(session_class):
+    event.listen(session_class, 'before_commit', bump_table_versions)
+
+
+def table_version(name):
+    version = db.session.execute(
+        select(versions_table.c.version).where(versions_table.c.table_name == name)).scalar()
+    return version or 0
+
+
+def conditional(table, id_arg=None, related=None):
+    """
+        Answer If-None-Match with 304 from the table version alone, before the
+        view loads or serializes anything. 200 responses carry the weak ETag.
+        :param table: Table the response is built from
+        :param id_arg: Name of the view argument holding the entity id, for item routes
+        :param related: Function returning the other tables this request reads, if any
+    """
+    def decorator(func):
+        @wraps(func)
+        def decorated(*args, **kwargs):
+            etag = f"{table}-{table_version(table)}"
+            if id_arg:
+                etag += f"-{kwargs[id_arg]}"
+            for name in (related() if related else ()):
+                etag += f"+{name}-{table_version(name)}"
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+            response = current_app.make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+            return response
+        return decorated
+    return decorator
@@ -51,6 +51,15 @@ def get_metadata():
     return target_db.metadata
 
 
+# The SQLite FTS5 search index and its shadow tables (search_index_data,
+# search_index_idx...) are created by lib/search.py, not by the models, so
+# autogenerate must not try to drop them
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == 'table' and name.startswith('search_index'):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +74,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +103,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
@@ -11,31 +11,47 @@ import sqlalchemy as sa
 
 # revision identifiers, used by Alembic.
 revision = '263eb6e65de9'
-down_revision = '74adadacea70'
+down_revision = '843fcc0c314d'
 branch_labels = None
 depends_on = None
 
+# SQLite reflects foreign keys unnamed; batch mode needs a name to drop one
+NAMING_CONVENTION = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _genre_foreign_key(referred_table):
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('songs'):
+        if fk['referred_table'] == referred_table:
+            return fk['name'] or f'fk_songs_genre_id_{referred_table}'
+    return None
+
 
 def upgrade():
+    # An interrupted run of this revision can leave genres, playlist_songs and
+    # batch mode's temp table behind (instance/MUSICA_DB.db did); pick up from there
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    if '_alembic_tmp_albums' in existing:
+        op.drop_table('_alembic_tmp_albums')
+
     # ### commands auto generated by Alembic - please adjust! ###
-    op.create_table('genres',
-    sa.Column('id', sa.Integer(), nullable=False),
-    sa.Column('title', sa.String(length=100), nullable=False),
-    sa.Column('artist_id', sa.Integer(), nullable=False),
-    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
-    sa.PrimaryKeyConstraint('id')
-    )
-    op.create_table('playlist_songs',
-    sa.Column('id', sa.Integer(), nullable=False),
-    sa.Column('playlist_id', sa.Integer(), nullable=False),
-    sa.Column('song_id', sa.Integer(), nullable=False),
-    sa.Column('added_at', sa.DateTime(), nullable=True),
-    sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
-    sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ),
-    sa.PrimaryKeyConstraint('id')
-    )
-    op.drop_table('genre')
-    op.drop_table('playlists_songs')
+    if 'genres' not in existing:
+        op.create_table('genres',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(length=100), nullable=False),
+        sa.Column('artist_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'playlist_songs' not in existing:
+        op.create_table('playlist_songs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('playlist_id', sa.Integer(), nullable=False),
+        sa.Column('song_id', sa.Integer(), nullable=False),
+        sa.Column('added_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
+        sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
     with op.batch_alter_table('albums', schema=None) as batch_op:
         batch_op.alter_column('title',
                existing_type=sa.VARCHAR(length=100),
@@ -59,7 +75,10 @@ def upgrade():
                existing_nullable=False)
         batch_op.drop_column('created_at')
 
-    with op.batch_alter_table('songs', schema=None) as batch_op:
+    genre_fk = _genre_foreign_key('genre')
+    # songs.genre_id still points at genre, which the interrupted run may have dropped
+    with op.batch_alter_table('songs', schema=None, naming_convention=NAMING_CONVENTION,
+                              reflect_kwargs={'resolve_fks': False}) as batch_op:
         batch_op.alter_column('title',
                existing_type=sa.VARCHAR(length=100),
                type_=sa.String(length=200),
@@ -74,8 +93,9 @@ def upgrade():
         batch_op.alter_column('album_id',
                existing_type=sa.INTEGER(),
                nullable=False)
-        batch_op.drop_constraint(None, type_='foreignkey')
-        batch_op.create_foreign_key(None, 'genres', ['genre_id'], ['id'])
+        if genre_fk:
+            batch_op.drop_constraint(genre_fk, type_='foreignkey')
+        batch_op.create_foreign_key('fk_songs_genre_id_genres', 'genres', ['genre_id'], ['id'])
 
     with op.batch_alter_table('users', schema=None) as batch_op:
         batch_op.alter_column('username',
@@ -91,11 +111,31 @@ def upgrade():
                type_=sa.String(length=100),
                existing_nullable=False)
 
+    # Only once songs no longer references it
+    if 'genre' in existing:
+        op.drop_table('genre')
+    if 'playlists_songs' in existing:
+        op.drop_table('playlists_songs')
     # ### end Alembic commands ###
 
 
 def downgrade():
     # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('playlists_songs',
+    sa.Column('id', sa.INTEGER(), nullable=False),
+    sa.Column('playlist_id', sa.INTEGER(), nullable=False),
+    sa.Column('song_id', sa.INTEGER(), nullable=False),
+    sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
+    sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('genre',
+    sa.Column('id', sa.INTEGER(), nullable=False),
+    sa.Column('title', sa.VARCHAR(length=50), nullable=False),
+    sa.Column('artist_id', sa.INTEGER(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
     with op.batch_alter_table('users', schema=None) as batch_op:
         batch_op.alter_column('password',
                existing_type=sa.String(length=100),
@@ -110,9 +150,11 @@ def downgrade():
                type_=sa.VARCHAR(length=50),
                existing_nullable=False)
 
-    with op.batch_alter_table('songs', schema=None) as batch_op:
-        batch_op.drop_constraint(None, type_='foreignkey')
-        batch_op.create_foreign_key(None, 'genre', ['genre_id'], ['id'])
+    genres_fk = _genre_foreign_key('genres')
+    with op.batch_alter_table('songs', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        if genres_fk:
+            batch_op.drop_constraint(genres_fk, type_='foreignkey')
+        batch_op.create_foreign_key('fk_songs_genre_id_genre', 'genre', ['genre_id'], ['id'])
         batch_op.alter_column('album_id',
                existing_type=sa.INTEGER(),
                nullable=True)
@@ -151,21 +193,6 @@ def downgrade():
                type_=sa.VARCHAR(length=100),
                existing_nullable=False)
 
-    op.create_table('playlists_songs',
-    sa.Column('id', sa.INTEGER(), nullable=False),
-    sa.Column('playlist_id', sa.INTEGER(), nullable=False),
-    sa.Column('song_id', sa.INTEGER(), nullable=False),
-    sa.ForeignKeyConstraint(['playlist_id'], ['playlists.id'], ),
-    sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ),
-    sa.PrimaryKeyConstraint('id')
-    )
-    op.create_table('genre',
-    sa.Column('id', sa.INTEGER(), nullable=False),
-    sa.Column('title', sa.VARCHAR(length=50), nullable=False),
-    sa.Column('artist_id', sa.INTEGER(), nullable=False),
-    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ),
-    sa.PrimaryKeyConstraint('id')
-    )
     op.drop_table('playlist_songs')
     op.drop_table('genres')
     # ### end Alembic commands ###
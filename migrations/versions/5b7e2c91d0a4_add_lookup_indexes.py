@@ -0,0 +1,58 @@
+"""Add lookup and foreign key indexes
+
+Indexes every column the routes filter or join on.
+
+Pass ``-x unique_playlist_songs=true`` to make (playlist_id, song_id)
+unique. Duplicate playlist entries are removed first, keeping the oldest row.
+
+Revision ID: 5b7e2c91d0a4
+Revises: 263eb6e65de9
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e2c91d0a4'
+down_revision = '263eb6e65de9'
+branch_labels = None
+depends_on = None
+
+
+SINGLE_COLUMN_INDEXES = [
+    ('users', 'username'),
+    ('artists', 'name'),
+    ('albums', 'artist_id'),
+    ('genres', 'artist_id'),
+    ('songs', 'album_id'),
+    ('songs', 'genre_id'),
+    ('playlists', 'user_id'),
+    ('playlist_songs', 'song_id'),
+]
+
+
+def unique_playlist_songs():
+    value = context.get_x_argument(as_dictionary=True).get('unique_playlist_songs', '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def upgrade():
+    for table, column in SINGLE_COLUMN_INDEXES:
+        op.create_index(op.f(f'ix_{table}_{column}'), table, [column], unique=False)
+
+    unique = unique_playlist_songs()
+    if unique:
+        op.execute(
+            "DELETE FROM playlist_songs WHERE id NOT IN "
+            "(SELECT MIN(id) FROM playlist_songs GROUP BY playlist_id, song_id)"
+        )
+    op.create_index('ix_playlist_songs_playlist_id_song_id', 'playlist_songs',
+                    ['playlist_id', 'song_id'], unique=unique)
+
+
+def downgrade():
+    op.drop_index('ix_playlist_songs_playlist_id_song_id', table_name='playlist_songs')
+    for table, column in reversed(SINGLE_COLUMN_INDEXES):
+        op.drop_index(op.f(f'ix_{table}_{column}'), table_name=table)
@@ -0,0 +1,32 @@
+"""Add table_versions for conditional GET
+
+Revision ID: 7a0d5e3b9c12
+Revises: e41d7a2c5f86
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a0d5e3b9c12'
+down_revision = 'e41d7a2c5f86'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['users', 'artists', 'albums', 'genres', 'songs', 'playlists', 'playlist_songs']
+
+
+def upgrade():
+    table_versions = op.create_table('table_versions',
+    sa.Column('table_name', sa.String(length=100), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(table_versions, [{'table_name': name, 'version': 1} for name in TABLES])
+
+
+def downgrade():
+    op.drop_table('table_versions')
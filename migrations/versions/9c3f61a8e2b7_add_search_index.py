@@ -0,0 +1,85 @@
+"""Add FTS5 search index over songs, albums and artists
+
+SQLite only; other databases are left untouched. Triggers keep the index
+in sync with the source tables. Existing rows are indexed here; run
+``flask rebuild-search`` to repopulate it at any time.
+
+Revision ID: 9c3f61a8e2b7
+Revises: 5b7e2c91d0a4
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c3f61a8e2b7'
+down_revision = '5b7e2c91d0a4'
+branch_labels = None
+depends_on = None
+
+
+# The index and its triggers as of this revision; lib/search.py has the current ones
+CREATE_TABLE = (
+    "CREATE VIRTUAL TABLE search_index USING fts5("
+    "kind UNINDEXED, name, bio, tokenize = 'unicode61 remove_diacritics 2')"
+)
+
+TRIGGERS = {
+    'songs': [
+        "CREATE TRIGGER songs_search_ai AFTER INSERT ON songs BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 1, 'song', new.title, ''); END",
+        "CREATE TRIGGER songs_search_ad AFTER DELETE ON songs BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END",
+        "CREATE TRIGGER songs_search_au AFTER UPDATE ON songs BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 1, 'song', new.title, ''); END",
+    ],
+    'albums': [
+        "CREATE TRIGGER albums_search_ai AFTER INSERT ON albums BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 2, 'album', new.title, ''); END",
+        "CREATE TRIGGER albums_search_ad AFTER DELETE ON albums BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; END",
+        "CREATE TRIGGER albums_search_au AFTER UPDATE ON albums BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 2, 'album', new.title, ''); END",
+    ],
+    'artists': [
+        "CREATE TRIGGER artists_search_ai AFTER INSERT ON artists BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) "
+        "VALUES (new.id * 4 + 3, 'artist', new.name, coalesce(new.bio, '')); END",
+        "CREATE TRIGGER artists_search_ad AFTER DELETE ON artists BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; END",
+        "CREATE TRIGGER artists_search_au AFTER UPDATE ON artists BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; "
+        "INSERT INTO search_index(rowid, kind, name, bio) "
+        "VALUES (new.id * 4 + 3, 'artist', new.name, coalesce(new.bio, '')); END",
+    ],
+}
+
+BACKFILL = [
+    "INSERT INTO search_index(rowid, kind, name, bio) SELECT id * 4 + 1, 'song', title, '' FROM songs",
+    "INSERT INTO search_index(rowid, kind, name, bio) SELECT id * 4 + 2, 'album', title, '' FROM albums",
+    "INSERT INTO search_index(rowid, kind, name, bio) SELECT id * 4 + 3, 'artist', name, coalesce(bio, '') FROM artists",
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(CREATE_TABLE)
+    for statements in TRIGGERS.values():
+        for statement in statements:
+            op.execute(statement)
+    for statement in BACKFILL:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for table in TRIGGERS:
+        for suffix in ('ai', 'ad', 'au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_{suffix}")
+    op.execute("DROP TABLE IF EXISTS search_index")
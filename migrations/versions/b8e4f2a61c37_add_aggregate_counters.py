@@ -0,0 +1,235 @@
+"""Add aggregate counters to artists, albums and playlists
+
+Triggers keep the counters in step with songs, albums and playlist entries;
+existing rows are counted here. ``flask verify-aggregates`` checks them and
+``flask rebuild-aggregates`` recomputes them at any time.
+
+On SQLite the search index update triggers are also narrowed to the indexed
+columns, so counter updates don't rewrite search entries.
+
+Revision ID: b8e4f2a61c37
+Revises: 7a0d5e3b9c12
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e4f2a61c37'
+down_revision = '7a0d5e3b9c12'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = {
+    'artists': ['album_count', 'song_count'],
+    'albums': ['song_count', 'total_duration'],
+    'playlists': ['song_count', 'total_duration'],
+}
+
+# Counter triggers and recount as lib/aggregates.py built them at this revision
+TRIGGER_TABLES = ('songs', 'albums', 'playlist_songs')
+
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS songs_aggregates_ai AFTER INSERT ON songs BEGIN "
+    "UPDATE albums SET song_count = song_count + 1, total_duration = total_duration + coalesce(new.duration, "
+    "0) WHERE id = new.album_id; UPDATE artists SET song_count = song_count + 1 WHERE id = (SELECT artist_id "
+    "FROM albums WHERE id = new.album_id); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS songs_aggregates_ad AFTER DELETE ON songs BEGIN "
+    "UPDATE albums SET song_count = song_count - 1, total_duration = total_duration - coalesce(old.duration, "
+    "0) WHERE id = old.album_id; UPDATE artists SET song_count = song_count - 1 WHERE id = (SELECT artist_id "
+    "FROM albums WHERE id = old.album_id);UPDATE playlists SET total_duration = total_duration + "
+    "(-coalesce(old.duration, 0)) * (SELECT count(*) FROM playlist_songs WHERE playlist_id = playlists.id "
+    "AND song_id = old.id) WHERE id IN (SELECT playlist_id FROM playlist_songs WHERE song_id = old.id); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS songs_aggregates_au AFTER UPDATE OF album_id, duration ON songs BEGIN "
+    "UPDATE albums SET song_count = song_count - 1, total_duration = total_duration - coalesce(old.duration, "
+    "0) WHERE id = old.album_id; UPDATE artists SET song_count = song_count - 1 WHERE id = (SELECT artist_id "
+    "FROM albums WHERE id = old.album_id); "
+    "UPDATE albums SET song_count = song_count + 1, total_duration = total_duration + coalesce(new.duration, "
+    "0) WHERE id = new.album_id; UPDATE artists SET song_count = song_count + 1 WHERE id = (SELECT artist_id "
+    "FROM albums WHERE id = new.album_id); "
+    "UPDATE playlists SET total_duration = total_duration + (coalesce(new.duration, 0) - "
+    "coalesce(old.duration, 0)) * (SELECT count(*) FROM playlist_songs WHERE playlist_id = playlists.id AND "
+    "song_id = new.id) WHERE id IN (SELECT playlist_id FROM playlist_songs WHERE song_id = new.id); "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS albums_aggregates_ai AFTER INSERT ON albums BEGIN "
+    "UPDATE artists SET album_count = album_count + 1, song_count = song_count + new.song_count WHERE id = "
+    "new.artist_id; END",
+    "CREATE TRIGGER IF NOT EXISTS albums_aggregates_ad AFTER DELETE ON albums BEGIN "
+    "UPDATE artists SET album_count = album_count - 1, song_count = song_count - old.song_count WHERE id = "
+    "old.artist_id; END",
+    "CREATE TRIGGER IF NOT EXISTS albums_aggregates_au AFTER UPDATE OF artist_id ON albums BEGIN "
+    "UPDATE artists SET album_count = album_count - 1, song_count = song_count - old.song_count WHERE id = "
+    "old.artist_id; UPDATE artists SET album_count = album_count + 1, song_count = song_count + "
+    "new.song_count WHERE id = new.artist_id;  "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS playlist_songs_aggregates_ai AFTER INSERT ON playlist_songs BEGIN "
+    "UPDATE playlists SET song_count = song_count + 1, total_duration = total_duration + coalesce((SELECT "
+    "duration FROM songs WHERE id = new.song_id), 0) WHERE id = new.playlist_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS playlist_songs_aggregates_ad AFTER DELETE ON playlist_songs BEGIN "
+    "UPDATE playlists SET song_count = song_count - 1, total_duration = total_duration - coalesce((SELECT "
+    "duration FROM songs WHERE id = old.song_id), 0) WHERE id = old.playlist_id; "
+    "END",
+    "CREATE TRIGGER IF NOT EXISTS playlist_songs_aggregates_au AFTER UPDATE OF playlist_id, song_id ON "
+    "playlist_songs BEGIN UPDATE playlists SET song_count = song_count - 1, total_duration = total_duration "
+    "- coalesce((SELECT duration FROM songs WHERE id = old.song_id), 0) WHERE id = old.playlist_id; "
+    "UPDATE playlists SET song_count = song_count + 1, total_duration = total_duration + coalesce((SELECT "
+    "duration FROM songs WHERE id = new.song_id), 0) WHERE id = new.playlist_id;  "
+    "END",
+]
+
+POSTGRESQL_TRIGGERS = [
+    "CREATE OR REPLACE FUNCTION songs_aggregates() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP = 'INSERT' THEN UPDATE albums SET song_count = song_count + 1, total_duration = total_duration "
+    "+ coalesce(new.duration, 0) WHERE id = new.album_id; "
+    "UPDATE artists SET song_count = song_count + 1 WHERE id = (SELECT artist_id FROM albums WHERE id = "
+    "new.album_id); ELSIF TG_OP = 'DELETE' THEN "
+    "UPDATE albums SET song_count = song_count - 1, total_duration = total_duration - coalesce(old.duration, "
+    "0) WHERE id = old.album_id; UPDATE artists SET song_count = song_count - 1 WHERE id = (SELECT artist_id "
+    "FROM albums WHERE id = old.album_id);UPDATE playlists SET total_duration = total_duration + "
+    "(-coalesce(old.duration, 0)) * (SELECT count(*) FROM playlist_songs WHERE playlist_id = playlists.id "
+    "AND song_id = old.id) WHERE id IN (SELECT playlist_id FROM playlist_songs WHERE song_id = old.id); "
+    "ELSE UPDATE albums SET song_count = song_count - 1, total_duration = total_duration - "
+    "coalesce(old.duration, 0) WHERE id = old.album_id; "
+    "UPDATE artists SET song_count = song_count - 1 WHERE id = (SELECT artist_id FROM albums WHERE id = "
+    "old.album_id); UPDATE albums SET song_count = song_count + 1, total_duration = total_duration + "
+    "coalesce(new.duration, 0) WHERE id = new.album_id; "
+    "UPDATE artists SET song_count = song_count + 1 WHERE id = (SELECT artist_id FROM albums WHERE id = "
+    "new.album_id); UPDATE playlists SET total_duration = total_duration + (coalesce(new.duration, 0) - "
+    "coalesce(old.duration, 0)) * (SELECT count(*) FROM playlist_songs WHERE playlist_id = playlists.id AND "
+    "song_id = new.id) WHERE id IN (SELECT playlist_id FROM playlist_songs WHERE song_id = new.id); "
+    "END IF; RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS songs_aggregates ON songs",
+    "CREATE TRIGGER songs_aggregates AFTER INSERT OR DELETE OR UPDATE OF album_id, duration ON songs FOR "
+    "EACH ROW EXECUTE FUNCTION songs_aggregates()",
+    "CREATE OR REPLACE FUNCTION albums_aggregates() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP = 'INSERT' THEN UPDATE artists SET album_count = album_count + 1, song_count = song_count + "
+    "new.song_count WHERE id = new.artist_id; "
+    "ELSIF TG_OP = 'DELETE' THEN UPDATE artists SET album_count = album_count - 1, song_count = song_count - "
+    "old.song_count WHERE id = old.artist_id; "
+    "ELSE UPDATE artists SET album_count = album_count - 1, song_count = song_count - old.song_count WHERE "
+    "id = old.artist_id; UPDATE artists SET album_count = album_count + 1, song_count = song_count + "
+    "new.song_count WHERE id = new.artist_id;  "
+    "END IF; RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS albums_aggregates ON albums",
+    "CREATE TRIGGER albums_aggregates AFTER INSERT OR DELETE OR UPDATE OF artist_id ON albums FOR EACH ROW "
+    "EXECUTE FUNCTION albums_aggregates()",
+    "CREATE OR REPLACE FUNCTION playlist_songs_aggregates() RETURNS trigger AS $$ BEGIN "
+    "IF TG_OP = 'INSERT' THEN UPDATE playlists SET song_count = song_count + 1, total_duration = "
+    "total_duration + coalesce((SELECT duration FROM songs WHERE id = new.song_id), 0) WHERE id = "
+    "new.playlist_id; ELSIF TG_OP = 'DELETE' THEN "
+    "UPDATE playlists SET song_count = song_count - 1, total_duration = total_duration - coalesce((SELECT "
+    "duration FROM songs WHERE id = old.song_id), 0) WHERE id = old.playlist_id; "
+    "ELSE UPDATE playlists SET song_count = song_count - 1, total_duration = total_duration - "
+    "coalesce((SELECT duration FROM songs WHERE id = old.song_id), 0) WHERE id = old.playlist_id; "
+    "UPDATE playlists SET song_count = song_count + 1, total_duration = total_duration + coalesce((SELECT "
+    "duration FROM songs WHERE id = new.song_id), 0) WHERE id = new.playlist_id;  "
+    "END IF; RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS playlist_songs_aggregates ON playlist_songs",
+    "CREATE TRIGGER playlist_songs_aggregates AFTER INSERT OR DELETE OR UPDATE OF playlist_id, song_id ON "
+    "playlist_songs FOR EACH ROW EXECUTE FUNCTION playlist_songs_aggregates()",
+]
+
+REBUILD = [
+    "UPDATE albums SET song_count = (SELECT count(*) FROM songs WHERE songs.album_id = albums.id), "
+    "total_duration = (SELECT coalesce(sum(songs.duration), 0) FROM songs WHERE songs.album_id = albums.id)",
+    "UPDATE artists SET album_count = (SELECT count(*) FROM albums WHERE albums.artist_id = artists.id), "
+    "song_count = (SELECT count(*) FROM songs JOIN albums ON albums.id = songs.album_id WHERE "
+    "albums.artist_id = artists.id)",
+    "UPDATE playlists SET song_count = (SELECT count(*) FROM playlist_songs WHERE playlist_songs.playlist_id "
+    "= playlists.id), total_duration = (SELECT coalesce(sum(songs.duration), 0) FROM playlist_songs JOIN "
+    "songs ON songs.id = playlist_songs.song_id WHERE playlist_songs.playlist_id = playlists.id)",
+]
+
+# Search index triggers as of this revision; lib/search.py has the current ones.
+# Update triggers narrowed to the indexed columns:
+SEARCH_UPDATE_TRIGGERS = {
+    'songs': "CREATE TRIGGER songs_search_au AFTER UPDATE OF title ON songs BEGIN "
+             "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; "
+             "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 1, 'song', new.title, ''); END",
+    'albums': "CREATE TRIGGER albums_search_au AFTER UPDATE OF title ON albums BEGIN "
+              "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; "
+              "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 2, 'album', new.title, ''); END",
+    'artists': "CREATE TRIGGER artists_search_au AFTER UPDATE OF name, bio ON artists BEGIN "
+               "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; "
+               "INSERT INTO search_index(rowid, kind, name, bio) "
+               "VALUES (new.id * 4 + 3, 'artist', new.name, coalesce(new.bio, '')); END",
+}
+
+# The triggers of 9c3f61a8e2b7, restored on downgrade
+PREVIOUS_SEARCH_TRIGGERS = {
+    'songs': [
+        "CREATE TRIGGER IF NOT EXISTS songs_search_ai AFTER INSERT ON songs BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 1, 'song', new.title, ''); END",
+        "CREATE TRIGGER IF NOT EXISTS songs_search_ad AFTER DELETE ON songs BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; END",
+        "CREATE TRIGGER IF NOT EXISTS songs_search_au AFTER UPDATE ON songs BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 1; "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 1, 'song', new.title, ''); END",
+    ],
+    'albums': [
+        "CREATE TRIGGER IF NOT EXISTS albums_search_ai AFTER INSERT ON albums BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 2, 'album', new.title, ''); END",
+        "CREATE TRIGGER IF NOT EXISTS albums_search_ad AFTER DELETE ON albums BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; END",
+        "CREATE TRIGGER IF NOT EXISTS albums_search_au AFTER UPDATE ON albums BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 2; "
+        "INSERT INTO search_index(rowid, kind, name, bio) VALUES (new.id * 4 + 2, 'album', new.title, ''); END",
+    ],
+    'artists': [
+        "CREATE TRIGGER IF NOT EXISTS artists_search_ai AFTER INSERT ON artists BEGIN "
+        "INSERT INTO search_index(rowid, kind, name, bio) "
+        "VALUES (new.id * 4 + 3, 'artist', new.name, coalesce(new.bio, '')); END",
+        "CREATE TRIGGER IF NOT EXISTS artists_search_ad AFTER DELETE ON artists BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; END",
+        "CREATE TRIGGER IF NOT EXISTS artists_search_au AFTER UPDATE ON artists BEGIN "
+        "DELETE FROM search_index WHERE rowid = old.id * 4 + 3; "
+        "INSERT INTO search_index(rowid, kind, name, bio) "
+        "VALUES (new.id * 4 + 3, 'artist', new.name, coalesce(new.bio, '')); END",
+    ],
+}
+
+
+def upgrade():
+    for table, columns in COLUMNS.items():
+        for column in columns:
+            op.add_column(table, sa.Column(column, sa.Integer(), nullable=False, server_default='0'))
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for table, statement in SEARCH_UPDATE_TRIGGERS.items():
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_au")
+            op.execute(statement)
+    if bind.dialect.name == 'sqlite':
+        triggers = SQLITE_TRIGGERS
+    elif bind.dialect.name == 'postgresql':
+        triggers = POSTGRESQL_TRIGGERS
+    else:
+        raise RuntimeError(f"Aggregate triggers are not implemented for {bind.dialect.name}")
+    for statement in triggers + REBUILD:
+        op.execute(statement)
+
+
+def downgrade():
+    bind = op.get_bind()
+    for table in TRIGGER_TABLES:
+        if bind.dialect.name == 'postgresql':
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_aggregates ON {table}")
+            op.execute(f"DROP FUNCTION IF EXISTS {table}_aggregates()")
+        else:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f"DROP TRIGGER IF EXISTS {table}_aggregates_{suffix}")
+    for table, columns in COLUMNS.items():
+        with op.batch_alter_table(table) as batch_op:
+            for column in reversed(columns):
+                batch_op.drop_column(column)
+    # SQLite batch mode recreates the tables, dropping their triggers with them
+    if bind.dialect.name == 'sqlite':
+        for table, statements in PREVIOUS_SEARCH_TRIGGERS.items():
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_search_au")
+            for statement in statements:
+                op.execute(statement)
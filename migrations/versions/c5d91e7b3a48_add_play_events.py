@@ -0,0 +1,37 @@
+"""Add play_events
+
+Revision ID: c5d91e7b3a48
+Revises: b8e4f2a61c37
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5d91e7b3a48'
+down_revision = 'b8e4f2a61c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('play_events',
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.Column('played_at', sa.DateTime(), nullable=False),
+    sa.Column('ms_played', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['song_id'], ['songs.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_play_events_song_id_played_at', 'play_events', ['song_id', 'played_at'], unique=False)
+    op.create_index('ix_play_events_user_id_played_at', 'play_events', ['user_id', 'played_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_play_events_user_id_played_at', table_name='play_events')
+    op.drop_index('ix_play_events_song_id_played_at', table_name='play_events')
+    op.drop_table('play_events')
@@ -0,0 +1,110 @@
+"""Add hourly and daily song rollups for charts
+
+Revision ID: d7a3c8f19e25
+Revises: c5d91e7b3a48
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a3c8f19e25'
+down_revision = 'c5d91e7b3a48'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['song_stats_hourly', 'song_stats_daily']
+
+# Playlist-add trigger and rollup rebuild as lib/charts.py built them at this revision
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER IF NOT EXISTS playlist_songs_rollups_ai AFTER INSERT ON playlist_songs BEGIN "
+    "INSERT INTO song_stats_hourly (bucket, song_id, plays, ms_played, playlist_adds) VALUES "
+    "(strftime('%Y-%m-%d %H:00:00.000000', coalesce(new.added_at, 'now')), new.song_id, 0, 0, 1) ON CONFLICT "
+    "(bucket, song_id) DO UPDATE SET playlist_adds = song_stats_hourly.playlist_adds + 1; "
+    "INSERT INTO song_stats_daily (bucket, song_id, plays, ms_played, playlist_adds) VALUES "
+    "(strftime('%Y-%m-%d 00:00:00.000000', coalesce(new.added_at, 'now')), new.song_id, 0, 0, 1) ON CONFLICT "
+    "(bucket, song_id) DO UPDATE SET playlist_adds = song_stats_daily.playlist_adds + 1; "
+    "END",
+]
+
+SQLITE_REBUILD = [
+    "DELETE FROM song_stats_hourly",
+    "INSERT INTO song_stats_hourly (bucket, song_id, plays, ms_played, playlist_adds) SELECT bucket, "
+    "song_id, sum(plays), sum(ms_played), sum(playlist_adds) FROM (SELECT strftime('%Y-%m-%d "
+    "%H:00:00.000000', played_at) AS bucket, song_id, count(*) AS plays, sum(ms_played) AS ms_played, 0 AS "
+    "playlist_adds FROM play_events GROUP BY 1, 2 UNION ALL SELECT strftime('%Y-%m-%d %H:00:00.000000', "
+    "added_at), song_id, 0, 0, count(*) FROM playlist_songs WHERE added_at IS NOT NULL GROUP BY 1, 2) AS "
+    "combined GROUP BY bucket, song_id",
+    "DELETE FROM song_stats_daily",
+    "INSERT INTO song_stats_daily (bucket, song_id, plays, ms_played, playlist_adds) SELECT bucket, song_id, "
+    "sum(plays), sum(ms_played), sum(playlist_adds) FROM (SELECT strftime('%Y-%m-%d 00:00:00.000000', "
+    "played_at) AS bucket, song_id, count(*) AS plays, sum(ms_played) AS ms_played, 0 AS playlist_adds FROM "
+    "play_events GROUP BY 1, 2 UNION ALL SELECT strftime('%Y-%m-%d 00:00:00.000000', added_at), song_id, 0, "
+    "0, count(*) FROM playlist_songs WHERE added_at IS NOT NULL GROUP BY 1, 2) AS combined GROUP BY bucket, "
+    "song_id",
+]
+
+POSTGRESQL_TRIGGERS = [
+    "CREATE OR REPLACE FUNCTION playlist_songs_rollups() RETURNS trigger AS $$ BEGIN "
+    "INSERT INTO song_stats_hourly (bucket, song_id, plays, ms_played, playlist_adds) VALUES "
+    "(date_trunc('hour', coalesce(new.added_at, timezone('utc', now()))), new.song_id, 0, 0, 1) ON CONFLICT "
+    "(bucket, song_id) DO UPDATE SET playlist_adds = song_stats_hourly.playlist_adds + 1; "
+    "INSERT INTO song_stats_daily (bucket, song_id, plays, ms_played, playlist_adds) VALUES "
+    "(date_trunc('day', coalesce(new.added_at, timezone('utc', now()))), new.song_id, 0, 0, 1) ON CONFLICT "
+    "(bucket, song_id) DO UPDATE SET playlist_adds = song_stats_daily.playlist_adds + 1; "
+    "RETURN NULL; END $$ LANGUAGE plpgsql",
+    "DROP TRIGGER IF EXISTS playlist_songs_rollups ON playlist_songs",
+    "CREATE TRIGGER playlist_songs_rollups AFTER INSERT ON playlist_songs FOR EACH ROW EXECUTE FUNCTION "
+    "playlist_songs_rollups()",
+]
+
+POSTGRESQL_REBUILD = [
+    "DELETE FROM song_stats_hourly",
+    "INSERT INTO song_stats_hourly (bucket, song_id, plays, ms_played, playlist_adds) SELECT bucket, "
+    "song_id, sum(plays), sum(ms_played), sum(playlist_adds) FROM (SELECT date_trunc('hour', played_at) AS "
+    "bucket, song_id, count(*) AS plays, sum(ms_played) AS ms_played, 0 AS playlist_adds FROM play_events "
+    "GROUP BY 1, 2 UNION ALL SELECT date_trunc('hour', added_at), song_id, 0, 0, count(*) FROM "
+    "playlist_songs WHERE added_at IS NOT NULL GROUP BY 1, 2) AS combined GROUP BY bucket, song_id",
+    "DELETE FROM song_stats_daily",
+    "INSERT INTO song_stats_daily (bucket, song_id, plays, ms_played, playlist_adds) SELECT bucket, song_id, "
+    "sum(plays), sum(ms_played), sum(playlist_adds) FROM (SELECT date_trunc('day', played_at) AS bucket, "
+    "song_id, count(*) AS plays, sum(ms_played) AS ms_played, 0 AS playlist_adds FROM play_events GROUP BY "
+    "1, 2 UNION ALL SELECT date_trunc('day', added_at), song_id, 0, 0, count(*) FROM playlist_songs WHERE "
+    "added_at IS NOT NULL GROUP BY 1, 2) AS combined GROUP BY bucket, song_id",
+]
+
+
+def upgrade():
+    for table in TABLES:
+        op.create_table(table,
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('song_id', sa.Integer(), nullable=False),
+        sa.Column('plays', sa.Integer(), nullable=False),
+        sa.Column('ms_played', sa.BigInteger(), nullable=False),
+        sa.Column('playlist_adds', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket', 'song_id')
+        )
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        triggers, rebuild = SQLITE_TRIGGERS, SQLITE_REBUILD
+    elif bind.dialect.name == 'postgresql':
+        triggers, rebuild = POSTGRESQL_TRIGGERS, POSTGRESQL_REBUILD
+    else:
+        raise RuntimeError(f"Rollup triggers are not implemented for {bind.dialect.name}")
+    for statement in triggers:
+        bind.exec_driver_sql(statement)
+    for statement in rebuild:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP TRIGGER IF EXISTS playlist_songs_rollups ON playlist_songs")
+        op.execute("DROP FUNCTION IF EXISTS playlist_songs_rollups()")
+    else:
+        op.execute("DROP TRIGGER IF EXISTS playlist_songs_rollups_ai")
+    for table in reversed(TABLES):
+        op.drop_table(table)
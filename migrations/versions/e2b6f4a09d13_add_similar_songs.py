@@ -0,0 +1,41 @@
+"""Add similar_songs and similarity_builds
+
+Revision ID: e2b6f4a09d13
+Revises: d7a3c8f19e25
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6f4a09d13'
+down_revision = 'd7a3c8f19e25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('similar_songs',
+    sa.Column('song_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('similar_song_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('song_id', 'rank')
+    )
+    op.create_table('similarity_builds',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('built_at', sa.DateTime(), nullable=False),
+    sa.Column('full', sa.Boolean(), nullable=False),
+    sa.Column('watermark', sa.DateTime(), nullable=True),
+    sa.Column('songs', sa.Integer(), nullable=False),
+    sa.Column('pairs', sa.Integer(), nullable=False),
+    sa.Column('seconds', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('similarity_builds')
+    op.drop_table('similar_songs')
@@ -0,0 +1,40 @@
+"""Add position column to playlist_songs
+
+Existing entries are numbered in insertion order, 1024 apart, so later
+inserts and moves can take the midpoint between two neighbours.
+
+Revision ID: e41d7a2c5f86
+Revises: 9c3f61a8e2b7
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e41d7a2c5f86'
+down_revision = '9c3f61a8e2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('playlist_songs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('position', sa.Integer(), nullable=False, server_default='0'))
+
+    # One pass numbering every playlist's entries (UPDATE ... FROM needs SQLite 3.33+)
+    op.execute(
+        "UPDATE playlist_songs SET position = numbered.position FROM ("
+        "SELECT id, ROW_NUMBER() OVER (PARTITION BY playlist_id ORDER BY id) * 1024 AS position "
+        "FROM playlist_songs) AS numbered "
+        "WHERE numbered.id = playlist_songs.id"
+    )
+    op.create_index('ix_playlist_songs_playlist_id_position', 'playlist_songs',
+                    ['playlist_id', 'position'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_playlist_songs_playlist_id_position', table_name='playlist_songs')
+    with op.batch_alter_table('playlist_songs', schema=None) as batch_op:
+        batch_op.drop_column('position')
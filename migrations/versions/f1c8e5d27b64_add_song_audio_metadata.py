@@ -0,0 +1,40 @@
+"""Add audio metadata columns to songs
+
+Revision ID: f1c8e5d27b64
+Revises: e2b6f4a09d13
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c8e5d27b64'
+down_revision = 'e2b6f4a09d13'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = [
+    sa.Column('bitrate', sa.Integer(), nullable=True),
+    sa.Column('sample_rate', sa.Integer(), nullable=True),
+    sa.Column('codec', sa.String(length=16), nullable=True),
+    sa.Column('content_hash', sa.String(length=64), nullable=True),
+    sa.Column('metadata_checked_at', sa.DateTime(), nullable=True),
+    sa.Column('metadata_error', sa.String(length=200), nullable=True),
+]
+
+
+def upgrade():
+    for column in COLUMNS:
+        op.add_column('songs', column)
+    op.create_index(op.f('ix_songs_content_hash'), 'songs', ['content_hash'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_songs_content_hash'), table_name='songs')
+    # Plain DROP COLUMN (SQLite 3.35+) rather than batch mode, which would
+    # recreate songs and lose its search and aggregate triggers
+    for column in reversed(COLUMNS):
+        op.drop_column('songs', column.name)
@@ -1,13 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from lib.replicas import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession sends reads of GET requests to replicas when any are configured
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # User Model
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(100), nullable=False)
+    username = db.Column(db.String(100), nullable=False, index=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password = db.Column(db.String(100), nullable=False)
     playlists = db.relationship('Playlist', backref='user', lazy=True)
@@ -15,41 +17,61 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+    def to_dict(self):
+        return {"id": self.id, "username": self.username, "email": self.email}
+
 # Artist Model
 class Artist(db.Model):
     __tablename__ = 'artists'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     bio = db.Column(db.String(500))
     password = db.Column(db.String(100), nullable=False)
+    # Maintained by database triggers (lib/aggregates.py); never set them from Python
+    album_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    song_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     albums = db.relationship('Album', backref='artist', lazy=True)
     genres = db.relationship('Genre', backref='artist', lazy=True)
 
     def __repr__(self):
         return f'<Artist {self.name}>'
 
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "bio": self.bio,
+                "album_count": self.album_count, "song_count": self.song_count}
+
 # Album Model
 class Album(db.Model):
     __tablename__ = 'albums'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False, index=True)
+    # Maintained by database triggers (lib/aggregates.py)
+    song_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_duration = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     songs = db.relationship('Song', backref='album', lazy=True)
 
     def __repr__(self):
         return f'<Album {self.title}>'
 
+    def to_dict(self):
+        return {"id": self.id, "title": self.title, "artist_id": self.artist_id,
+                "song_count": self.song_count, "total_duration": self.total_duration}
+
 # Genre Model
 class Genre(db.Model):
     __tablename__ = 'genres'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
-    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False)
+    artist_id = db.Column(db.Integer, db.ForeignKey('artists.id'), nullable=False, index=True)
     songs = db.relationship('Song', backref='genre', lazy=True)
 
     def __repr__(self):
         return f'<Genre {self.title}>'
 
+    def to_dict(self):
+        return {"id": self.id, "title": self.title, "artist_id": self.artist_id}
+
 # Song Model
 class Song(db.Model):
     __tablename__ = 'songs'
@@ -57,31 +79,173 @@ class Song(db.Model):
     title = db.Column(db.String(200), nullable=False)
     duration = db.Column(db.Integer)  # Duration in seconds
     file_path = db.Column(db.String(500), nullable=False)
-    album_id = db.Column(db.Integer, db.ForeignKey('albums.id'), nullable=False)
-    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'))
+    album_id = db.Column(db.Integer, db.ForeignKey('albums.id'), nullable=False, index=True)
+    genre_id = db.Column(db.Integer, db.ForeignKey('genres.id'), index=True)
+    # Read from the file by lib.metadata; NULL until it has been checked
+    bitrate = db.Column(db.Integer)  # kbps
+    sample_rate = db.Column(db.Integer)
+    codec = db.Column(db.String(16))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the file
+    metadata_checked_at = db.Column(db.DateTime)
+    metadata_error = db.Column(db.String(200))
     playlists = db.relationship('PlaylistSong', backref='song', lazy=True)
 
     def __repr__(self):
         return f'<Song {self.title}>'
 
+    def to_dict(self):
+        return {"id": self.id, "title": self.title, "duration": self.duration, "file_path": self.file_path}
+
 # Playlist Model
 class Playlist(db.Model):
     __tablename__ = 'playlists'
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    # Maintained by database triggers (lib/aggregates.py)
+    song_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total_duration = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     songs = db.relationship('PlaylistSong', backref='playlist', lazy=True)
 
     def __repr__(self):
         return f'<Playlist {self.title}>'
 
+    def to_dict(self):
+        return {"id": self.id, "title": self.title, "user_id": self.user_id,
+                "song_count": self.song_count, "total_duration": self.total_duration}
+
 # PlaylistSong Model (Join Table for Songs and Playlists)
 class PlaylistSong(db.Model):
     __tablename__ = 'playlist_songs'
+    # (playlist_id, song_id) also serves lookups on playlist_id alone.
+    # The migration can make it unique with: flask db upgrade -x unique_playlist_songs=true
+    __table_args__ = (
+        db.Index('ix_playlist_songs_playlist_id_song_id', 'playlist_id', 'song_id'),
+        db.Index('ix_playlist_songs_playlist_id_position', 'playlist_id', 'position'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     playlist_id = db.Column(db.Integer, db.ForeignKey('playlists.id'), nullable=False)
-    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False, index=True)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Sort key within the playlist, spaced by lib.playlists.POSITION_GAP
+    position = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def __repr__(self):
         return f'<PlaylistSong playlist_id={self.playlist_id}, song_id={self.song_id}>'
+
+    def to_dict(self):
+        return {"id": self.id, "playlist_id": self.playlist_id, "song_id": self.song_id, "position": self.position}
+
+# PlayEvent Model, written in batches by lib.plays.PlayBuffer
+class PlayEvent(db.Model):
+    __tablename__ = 'play_events'
+    __table_args__ = (
+        db.Index('ix_play_events_song_id_played_at', 'song_id', 'played_at'),
+        db.Index('ix_play_events_user_id_played_at', 'user_id', 'played_at'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    song_id = db.Column(db.Integer, db.ForeignKey('songs.id'), nullable=False)
+    played_at = db.Column(db.DateTime, nullable=False)
+    ms_played = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self):
+        return f'<PlayEvent user_id={self.user_id}, song_id={self.song_id}>'
+
+    def to_dict(self):
+        return {"id": self.id, "user_id": self.user_id, "song_id": self.song_id,
+                "played_at": self.played_at.isoformat(), "ms_played": self.ms_played}
+
+# Per-song play and playlist-add counts by hour and by day (lib/charts.py)
+class SongHourlyStat(db.Model):
+    __tablename__ = 'song_stats_hourly'
+    bucket = db.Column(db.DateTime, primary_key=True)
+    song_id = db.Column(db.Integer, primary_key=True)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    ms_played = db.Column(db.BigInteger, nullable=False, default=0)
+    playlist_adds = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SongHourlyStat {self.bucket} song_id={self.song_id}>'
+
+class SongDailyStat(db.Model):
+    __tablename__ = 'song_stats_daily'
+    bucket = db.Column(db.DateTime, primary_key=True)
+    song_id = db.Column(db.Integer, primary_key=True)
+    plays = db.Column(db.Integer, nullable=False, default=0)
+    ms_played = db.Column(db.BigInteger, nullable=False, default=0)
+    playlist_adds = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<SongDailyStat {self.bucket} song_id={self.song_id}>'
+
+# Top-K similar songs per song, precomputed by lib.similarity.SimilarSongsBuilder
+class SimilarSong(db.Model):
+    __tablename__ = 'similar_songs'
+    song_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    similar_song_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<SimilarSong song_id={self.song_id}, rank={self.rank}>'
+
+# One row per similar_songs build; the latest watermark drives incremental builds
+class SimilarityBuild(db.Model):
+    __tablename__ = 'similarity_builds'
+    id = db.Column(db.Integer, primary_key=True)
+    built_at = db.Column(db.DateTime, nullable=False)
+    full = db.Column(db.Boolean, nullable=False)
+    # Newest playlist_songs.added_at included in the build
+    watermark = db.Column(db.DateTime)
+    songs = db.Column(db.Integer, nullable=False)
+    pairs = db.Column(db.Integer, nullable=False)
+    seconds = db.Column(db.Float, nullable=False)
+
+    def __repr__(self):
+        return f'<SimilarityBuild {self.built_at}>'
+
+# Deferred work queued by lib.jobs.JobQueue and run by `flask run-jobs` workers
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Claim order: runnable jobs by priority, then due time
+        db.Index('ix_jobs_status_priority_run_at', 'status', 'priority', 'run_at'),
+    )
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    task = db.Column(db.String(100), nullable=False)
+    # JSON keyword arguments of the task
+    payload = db.Column(db.Text, nullable=False)
+    # queued, running, done or dead
+    status = db.Column(db.String(20), nullable=False)
+    priority = db.Column(db.Integer, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    # Lease length in seconds once claimed
+    timeout = db.Column(db.Integer, nullable=False)
+    run_at = db.Column(db.DateTime, nullable=False)
+    locked_until = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(100))
+    lease = db.Column(db.String(32))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.task} {self.status}>'
+
+    def to_dict(self):
+        return {"id": self.id, "task": self.task, "status": self.status,
+                "attempts": self.attempts, "max_attempts": self.max_attempts,
+                "run_at": self.run_at.isoformat(), "last_error": self.last_error,
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None}
+
+# Version counter per table, bumped in the same transaction as every write to it
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+    table_name = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<TableVersion {self.table_name}={self.version}>'
@@ -0,0 +1,48 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+API_KEY = 'test-key'
+
+# app.py reads its configuration at import time
+_tmp = tempfile.mkdtemp(prefix='musica-tests-')
+os.environ.update(API_KEY=API_KEY, BCRYPT_LOG_ROUNDS='4', CACHE_BACKEND='none', MEDIA_ROOT=_tmp,
+                  JWT_SECRET_KEY='test-jwt-secret', SECRET_KEY='test-secret',
+                  SQLALCHEMY_DATABASE_URI=f"sqlite:///{os.path.join(_tmp, 'test.db')}")
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app, db
+    from lib.aggregates import create_aggregate_triggers
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            create_aggregate_triggers(connection)
+        db.session.remove()
+    return app
+
+
+@pytest.fixture
+def db(app):
+    from app import db
+
+    with app.app_context():
+        yield db
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def headers():
+    return {'X-API-KEY': API_KEY}
@@ -0,0 +1,63 @@
+import json
+from datetime import datetime
+
+from models import User, Artist, Album, Genre, Song, Playlist, PlaylistSong, PlayEvent, Job
+
+
+def _add_artist(db, name):
+    artist = Artist(name=name, password='x')
+    user = User(username=f'{name} fan', email=f'{name}@example.com', password='x')
+    db.session.add_all([artist, user])
+    db.session.flush()
+    genre = Genre(title=f'{name} genre', artist_id=artist.id)
+    albums = [Album(title=f'{name} album {n}', artist_id=artist.id) for n in range(2)]
+    playlist = Playlist(title=f'{name} playlist', user_id=user.id)
+    db.session.add_all([genre, playlist, *albums])
+    db.session.flush()
+    songs = [Song(title=f'{name} song {n}', duration=180, file_path=f'{name}/{n}.mp3',
+                  album_id=albums[n % 2].id, genre_id=genre.id) for n in range(3)]
+    db.session.add_all(songs)
+    db.session.flush()
+    db.session.add_all([PlaylistSong(playlist_id=playlist.id, song_id=song.id, position=(n + 1) * 1024)
+                        for n, song in enumerate(songs[:2])])
+    db.session.add(PlayEvent(user_id=user.id, song_id=songs[0].id, played_at=datetime.utcnow(), ms_played=1000))
+    db.session.commit()
+    return artist.id, playlist.id
+
+
+def test_artist_delete_reports_rows_removed(db, client, headers):
+    artist_id, playlist_id = _add_artist(db, 'Cascade')
+
+    response = client.delete(f'/delete-artist/{artist_id}', headers=headers)
+    assert response.status_code == 200
+    deleted = response.get_json()['deleted']
+    assert {table: deleted[table] for table in
+            ('artists', 'albums', 'genres', 'songs', 'playlist_songs', 'play_events')} == {
+        'artists': 1, 'albums': 2, 'genres': 1, 'songs': 3, 'playlist_songs': 2, 'play_events': 1}
+
+    db.session.remove()
+    assert db.session.get(Artist, artist_id) is None
+    assert db.session.get(Playlist, playlist_id).song_count == 0
+    assert client.delete(f'/delete-artist/{artist_id}', headers=headers).status_code == 404
+
+
+def test_artist_delete_in_background_queues_a_job(db, client, headers):
+    from app import cascade_delete_job
+
+    artist_id, _ = _add_artist(db, 'Background')
+
+    response = client.delete(f'/delete-artist/{artist_id}?background=true', headers=headers)
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+    status = client.get(f'/jobs/{job_id}', headers=headers)
+    assert status.status_code == 200
+    assert status.get_json()['task'] == 'cascade_delete' and status.get_json()['status'] == 'queued'
+    db.session.remove()
+    job = db.session.get(Job, job_id)
+    assert json.loads(job.payload) == {'kind': 'artists', 'entity_id': artist_id}
+    assert db.session.get(Artist, artist_id) is not None
+
+    cascade_delete_job(**json.loads(job.payload))
+    db.session.remove()
+    assert db.session.get(Artist, artist_id) is None
+    assert client.delete(f'/delete-artist/{artist_id}?background=true', headers=headers).status_code == 404
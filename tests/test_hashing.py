@@ -0,0 +1,13 @@
+import pytest
+
+from lib.hashing import PasswordHasher, HasherBusy
+
+
+def test_timed_out_hash_raises_busy():
+    hasher = PasswordHasher(rounds=14, workers=1, timeout=0.01)
+    try:
+        with pytest.raises(HasherBusy):
+            hasher.hash('password')
+        assert hasher.rejected == 1
+    finally:
+        hasher.shutdown()
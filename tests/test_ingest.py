@@ -0,0 +1,21 @@
+import io
+
+import pytest
+
+from lib.ingest import iter_json_array
+
+
+def _parse(text, chunk_size=1):
+    return list(iter_json_array(io.BytesIO(text.encode('utf-8')), chunk_size=chunk_size))
+
+
+def test_elements_split_across_reads():
+    assert _parse(' [ {"title": "Café"}, 123 , true,null,"x"] ') == [{"title": "Café"}, 123, True, None, "x"]
+    assert _parse('[]') == []
+
+
+@pytest.mark.parametrize('text', ['', '{"a": 1}', '[{"a": 1}', '[{"a": 1}, {"a": x}]', '[1, 2'])
+def test_malformed_array_fails(text):
+    with pytest.raises(ValueError):
+        _parse(text, chunk_size=4)
+
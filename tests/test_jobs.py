@@ -0,0 +1,33 @@
+from sqlalchemy import event, update
+
+from lib import jobs as jobs_module
+
+
+def test_claim_selects_again_when_every_candidate_was_taken(db, monkeypatch):
+    from app import jobs
+    from models import Job
+
+    table = Job.__table__
+    jobs.task('claim_test')(lambda: None)
+    taken, free = (jobs.enqueue('claim_test', priority=-100) for _ in range(2))
+    db.session.commit()
+    monkeypatch.setattr(jobs_module, 'CLAIM_CANDIDATES', 1)
+
+    selects = []
+
+    def another_worker_wins(conn, cursor, statement, parameters, context, executemany):
+        # Right after the first candidate select, someone else claims the job it returned
+        if statement.startswith('SELECT jobs.id, jobs.timeout'):
+            selects.append(statement)
+            if len(selects) == 1:
+                conn.execute(update(table).where(table.c.id == taken).values(status=jobs_module.RUNNING))
+
+    event.listen(db.engine, 'after_cursor_execute', another_worker_wins)
+    try:
+        job = jobs.claim('test-worker')
+    finally:
+        event.remove(db.engine, 'after_cursor_execute', another_worker_wins)
+        with db.engine.begin() as connection:
+            connection.execute(update(table).where(table.c.id.in_([taken, free])).values(status=jobs_module.DONE))
+    assert job is not None and job.id == free
+    assert len(selects) == 2
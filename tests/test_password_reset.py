@@ -0,0 +1,25 @@
+import json
+
+from flask_jwt_extended import create_access_token
+
+from models import User, Job
+
+
+def test_password_reset_queues_email(db, client, headers):
+    db.session.add(User(username='reset', email='reset@example.com', password='x'))
+    db.session.commit()
+    token = create_access_token(identity='reset')
+
+    response = client.post('/request-password-reset', json={'email': 'reset@example.com'},
+                           headers={**headers, 'Authorization': f'Bearer {token}'})
+    assert response.status_code == 200
+    job = Job.query.filter_by(task='send_reset_token').one()
+    payload = json.loads(job.payload)
+    assert payload['recipient'] == 'reset@example.com'
+    assert payload['name'] == 'reset'
+    assert payload['token']
+
+
+def test_password_reset_requires_jwt(client, headers):
+    response = client.post('/request-password-reset', json={'email': 'reset@example.com'}, headers=headers)
+    assert response.status_code == 401
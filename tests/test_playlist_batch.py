@@ -0,0 +1,40 @@
+import pytest
+
+from models import User, Playlist
+
+
+@pytest.fixture(scope='module')
+def playlist_id(app):
+    from app import db
+
+    with app.app_context():
+        user = User(username='batch', email='batch@example.com', password='x')
+        db.session.add(user)
+        db.session.flush()
+        playlist = Playlist(title='Batch', user_id=user.id)
+        db.session.add(playlist)
+        db.session.commit()
+        return playlist.id
+
+
+@pytest.mark.parametrize('body', [
+    [1, 2],
+    {"add": 5},
+    {"add": [{"x": 1}]},
+    {"add": ["7"]},
+    {"add": [{"song_id": 1, "after": "first"}]},
+    {"remove": [{"x": 1}]},
+    {"remove": [True]},
+    {"move": [5]},
+    {"move": [{"id": "1"}]},
+    {"move": {"id": 1}},
+])
+def test_malformed_batch_is_rejected(client, headers, playlist_id, body):
+    response = client.post(f'/playlists/{playlist_id}/songs/batch', json=body, headers=headers)
+    assert response.status_code == 400
+
+
+def test_empty_batch_is_a_no_op(client, headers, playlist_id):
+    response = client.post(f'/playlists/{playlist_id}/songs/batch', json={}, headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['added'] == 0
@@ -0,0 +1,75 @@
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from models import User, Artist, Album, Song, Playlist, PlaylistSong
+
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@pytest.fixture(scope='module')
+def catalog(app):
+    from app import db
+
+    with app.app_context():
+        return _add_catalog(db)
+
+
+def _add_catalog(db):
+    user = User(username='tracks', email='tracks@example.com', password='x')
+    artist = Artist(name='Tracks Artist', password='x')
+    db.session.add_all([user, artist])
+    db.session.flush()
+    album = Album(title='Tracks Album', artist_id=artist.id)
+    db.session.add(album)
+    db.session.flush()
+    songs = [Song(title=f'Track {n}', duration=180, file_path=f'tracks/{n}.mp3', album_id=album.id)
+             for n in range(300)]
+    db.session.add_all(songs)
+    db.session.flush()
+    playlists = {}
+    for size in (3, 300):
+        playlist = Playlist(title=f'{size} tracks', user_id=user.id)
+        db.session.add(playlist)
+        db.session.flush()
+        db.session.add_all(PlaylistSong(playlist_id=playlist.id, song_id=song.id, position=(n + 1) * 1024)
+                           for n, song in enumerate(songs[:size]))
+        playlists[size] = playlist.id
+    db.session.commit()
+    return playlists
+
+
+def test_tracks_query_count_does_not_grow_with_playlist(db, client, headers, catalog):
+    counts = {}
+    for size, playlist_id in catalog.items():
+        with count_statements(db.engine) as statements:
+            response = client.get(f'/a-playlist/{playlist_id}/tracks?limit=1000', headers=headers)
+        assert response.status_code == 200
+        assert len(response.get_json()['tracks']) == size
+        counts[size] = len(statements)
+    assert counts[3] == counts[300]
+
+
+def test_tracks_of_song_without_album(db, client, headers, catalog):
+    playlist_id = catalog[3]
+    entry = PlaylistSong.query.filter_by(playlist_id=playlist_id).order_by(PlaylistSong.position).first()
+    missing = db.session.query(db.func.max(Album.id)).scalar() + 1
+    db.session.get(Song, entry.song_id).album_id = missing
+    db.session.commit()
+
+    response = client.get(f'/a-playlist/{playlist_id}/tracks', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['tracks'][0]['song']['album'] is None
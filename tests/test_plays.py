@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+
+from lib.plays import validate_play
+
+
+def _play(played_at):
+    return {'user_id': 1, 'song_id': 1, 'ms_played': 1000, 'played_at': played_at}
+
+
+def test_played_at_far_in_the_future_is_rejected():
+    values, error = validate_play(_play('2030-01-01T00:00:00Z'))
+    assert values is None and 'future' in error
+
+
+def test_played_at_within_clock_skew_is_accepted():
+    played_at = (datetime.utcnow() + timedelta(minutes=1)).isoformat()
+    values, error = validate_play(_play(played_at))
+    assert error is None and values['played_at'].isoformat() == played_at
+
+
+def test_plays_for_a_deleted_song_are_dropped(db, client, headers):
+    from app import play_buffer
+    from models import User, Artist, Album, Song, PlayEvent
+
+    user = User(username='plays', email='plays@example.com', password='x')
+    artist = Artist(name='Plays Artist', password='x')
+    db.session.add_all([user, artist])
+    db.session.flush()
+    album = Album(title='Plays Album', artist_id=artist.id)
+    db.session.add(album)
+    db.session.flush()
+    song = Song(title='Played', duration=180, file_path='plays/1.mp3', album_id=album.id)
+    db.session.add(song)
+    db.session.commit()
+    user_id, song_id = user.id, song.id
+    play = {'user_id': user_id, 'song_id': song_id, 'ms_played': 1000}
+
+    play_buffer.add([validate_play(play)[0]])
+    assert play_buffer.flush() == 1
+    assert client.delete(f'/songs/{song_id}', headers=headers).status_code == 200
+    play_buffer.add([validate_play(play)[0]])
+    assert play_buffer.flush() == 0
+    db.session.remove()
+    assert PlayEvent.query.filter_by(song_id=song_id).count() == 0
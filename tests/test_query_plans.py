@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import create_engine
+
+from conftest import ROOT
+from lib.query_plans import find_table_scans
+
+
+def test_hot_queries_use_indexes_after_migrations(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'migrated.db'}"
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'db', 'upgrade'], cwd=ROOT, check=True,
+                   env={**os.environ, 'SQLALCHEMY_DATABASE_URI': uri}, capture_output=True)
+
+    engine = create_engine(uri)
+    try:
+        with engine.connect() as connection:
+            assert find_table_scans(connection) == {}
+    finally:
+        engine.dispose()